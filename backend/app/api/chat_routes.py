@@ -1,7 +1,9 @@
 from fastapi import APIRouter, HTTPException
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
+import json
 
-from .session_routes import game_sessions, update_session_timestamp
+from .session_routes import get_game_master, save_game_master, session_gate, session_store
 
 router = APIRouter()
 
@@ -11,21 +13,72 @@ class ChatMessage(BaseModel):
     message: str
 
 
+def format_sse(event: str, data: dict) -> str:
+    """按 text/event-stream 格式编码一条事件"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
 @router.post("/chat")
 async def chat(chat_data: ChatMessage):
     """处理聊天消息"""
-    if chat_data.session_id not in game_sessions:
-        raise HTTPException(status_code=404, detail="会话不存在，请先创建会话")
-
-    update_session_timestamp(chat_data.session_id)
-    game_master = game_sessions[chat_data.session_id]
-
-    try:
-        user_input, bot_response = game_master.submit_chat(chat_data.message)
+    async def handle_chat():
+        game_master = get_game_master(chat_data.session_id, detail="会话不存在，请先创建会话")
+        user_input, bot_response = await game_master.asubmit_chat(chat_data.message)
+        save_game_master(chat_data.session_id, game_master)
         return {
             "user_input": user_input,
             "bot_response": bot_response,
             "status": game_master.get_status()
         }
+
+    try:
+        return await session_gate.run(chat_data.session_id, ("chat", chat_data.message), handle_chat)
+    except HTTPException:
+        raise
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"聊天处理失败: {str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"聊天处理失败: {str(e)}")
+
+
+@router.post("/chat/stream")
+async def chat_stream(chat_data: ChatMessage):
+    """以 SSE 流式返回聊天回复
+
+    事件类型:
+    - delta: {"content": 新生成的文本片段}
+    - done: {"user_input", "bot_response", "status"}，与 /chat 的返回一致
+    - error: {"detail": 错误信息}
+    """
+    if chat_data.session_id not in session_store:
+        raise HTTPException(status_code=404, detail="会话不存在，请先创建会话")
+
+    async def event_stream():
+        # 流式回复同样占用会话锁，直到整段回复写入 history
+        async with session_gate.lock(chat_data.session_id):
+            chunks = []
+            try:
+                game_master = get_game_master(chat_data.session_id, detail="会话不存在，请先创建会话")
+                async for delta in game_master.astream_chat(chat_data.message):
+                    chunks.append(delta)
+                    yield format_sse("delta", {"content": delta})
+            except HTTPException as e:
+                yield format_sse("error", {"detail": e.detail})
+                return
+            except Exception as e:
+                yield format_sse("error", {"detail": f"聊天处理失败: {str(e)}"})
+                return
+
+            save_game_master(chat_data.session_id, game_master)
+            yield format_sse("done", {
+                "user_input": chat_data.message,
+                "bot_response": "".join(chunks),
+                "status": game_master.get_status()
+            })
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no",  # 关闭 nginx 缓冲，保证逐段下发
+        }
+    )
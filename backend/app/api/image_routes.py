@@ -1,87 +1,218 @@
-from fastapi import APIRouter, HTTPException, UploadFile, File
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel
-from PIL import Image
+from starlette.datastructures import UploadFile
+from starlette.formparsers import MultiPartParser, MultiPartException
 from io import BytesIO
 import base64
+import hashlib
 
-from ..src.resize_img import resize_image
-from .session_routes import game_sessions, update_session_timestamp
+from ..src.resize_img import ImagePyramid
+from ..src.thumbnail_cache import thumbnail_cache
+from ..src.worker_pool import image_worker_pool, WorkerPoolFull
+from ..config.config import get_image_pool_config
+from .session_routes import get_game_master, save_game_master, session_gate, session_store
 
 router = APIRouter()
 
+MAX_UPLOAD_BYTES = int(get_image_pool_config()['max_upload_mb'] * 1024 * 1024)
+CHUNK_SIZE = 64 * 1024
+# multipart 请求体中分隔符、表单头等额外开销的上限
+MULTIPART_OVERHEAD = 64 * 1024
+
 
 class ImageSubmit(BaseModel):
     session_id: str
     image_base64: str
 
 
+class UploadTooLarge(Exception):
+    pass
+
+
+def too_large():
+    return HTTPException(
+        status_code=413,
+        detail=f"图片过大，最大允许 {MAX_UPLOAD_BYTES // (1024 * 1024)}MB"
+    )
+
+
+def pool_full(e: WorkerPoolFull):
+    return HTTPException(
+        status_code=503,
+        detail=str(e),
+        headers={"Retry-After": str(e.retry_after)}
+    )
+
+
+def declared_length(request: Request):
+    """请求头中的 Content-Length，没有时返回 None，格式错误时返回 400"""
+    value = request.headers.get("content-length")
+    if value is None:
+        return None
+    try:
+        length = int(value)
+    except ValueError:
+        length = -1
+    if length < 0:
+        raise HTTPException(status_code=400, detail="Content-Length 格式错误")
+    return length
+
+
+async def capped_stream(request: Request, limit: int):
+    """边接收边计数，超过 limit 字节时立即中止"""
+    received = 0
+    async for chunk in request.stream():
+        received += len(chunk)
+        if received > limit:
+            raise UploadTooLarge()
+        yield chunk
+
+
+def read_upload_file(file_obj):
+    """分块读取上传文件并计算 sha256，超过大小上限时中止"""
+    digest = hashlib.sha256()
+    chunks = []
+    received = 0
+    for chunk in iter(lambda: file_obj.read(CHUNK_SIZE), b""):
+        received += len(chunk)
+        if received > MAX_UPLOAD_BYTES:
+            raise UploadTooLarge()
+        digest.update(chunk)
+        chunks.append(chunk)
+    return b"".join(chunks), digest.hexdigest()
+
+
+def process_image(game_master, image_data, content_hash=None):
+    """解码、缩放、识别并生成展示缩略图，在图片线程池中执行
+
+    image_data 为原始字节，或 base64 字符串；
+    content_hash 为原图内容的 sha256，缺省时在这里计算
+    """
+    if isinstance(image_data, str):
+        image_data = base64.b64decode(image_data)
+    if content_hash is None:
+        content_hash = hashlib.sha256(image_data).hexdigest()
+
+    # 只解码一次（JPEG 在解码时直接缩小），识别用 400 高，展示用 200 高
+    pyramid = ImagePyramid(BytesIO(image_data), heights=(400, 200))
+
+    # 提交图片
+    user_info, response = game_master.submit_image(pyramid.level(400))
+
+    # 返回缩小后图片的链接用于显示
+    display_image_url = thumbnail_cache.thumbnail_for_image(pyramid.level(200), content_hash, max_height=200)
+
+    return {
+        "user_info": user_info,
+        "response": response,
+        "status": game_master.get_status(),
+        "display_image_url": display_image_url
+    }
+
+
+async def run_image_pipeline(session_id, image_data, digest, content_hash=None):
+    """在会话锁内执行图片流程，同一张图片的重复提交共享一次识别结果"""
+    async def handle_image():
+        game_master = get_game_master(session_id, detail="会话不存在，请先创建会话")
+        try:
+            result = await image_worker_pool.run(process_image, game_master, image_data, content_hash)
+        except WorkerPoolFull as e:
+            raise pool_full(e)
+        save_game_master(session_id, game_master)
+        return result
+
+    return await session_gate.run(session_id, ("image", digest), handle_image)
+
+
 @router.post("/image/submit")
 async def submit_image(image_data: ImageSubmit):
     """提交图片识别"""
-    if image_data.session_id not in game_sessions:
-        raise HTTPException(status_code=404, detail="会话不存在，请先创建会话")
-
-    update_session_timestamp(image_data.session_id)
-    game_master = game_sessions[image_data.session_id]
+    if len(image_data.image_base64) * 3 // 4 > MAX_UPLOAD_BYTES:
+        raise too_large()
 
     try:
-        # 解码 base64 图片
-        image_bytes = base64.b64decode(image_data.image_base64)
-        image = Image.open(BytesIO(image_bytes))
-
-        # 调整图片大小
-        resized_img = resize_image(image, max_height=400)
-
-        # 提交图片
-        user_info, response = game_master.submit_image(resized_img)
-
-        # 返回缩小后的图片用于显示
-        display_img = resize_image(image, max_height=200)
-        buffered = BytesIO()
-        display_img.save(buffered, format="PNG")
-        display_img_base64 = base64.b64encode(buffered.getvalue()).decode('utf-8')
-
-        return {
-            "user_info": user_info,
-            "response": response,
-            "status": game_master.get_status(),
-            "display_image_base64": display_img_base64
-        }
+        digest = hashlib.sha1(image_data.image_base64.encode('ascii')).hexdigest()
+        return await run_image_pipeline(image_data.session_id, image_data.image_base64, digest)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"图片提交失败: {str(e)}")
 
 
-@router.post("/image/upload")
-async def upload_image(session_id: str, file: UploadFile = File(...)):
-    """上传图片文件"""
-    if session_id not in game_sessions:
+@router.post("/image/upload", openapi_extra={
+    "requestBody": {
+        "required": True,
+        "content": {"multipart/form-data": {"schema": {
+            "type": "object",
+            "properties": {"file": {"type": "string", "format": "binary"}},
+            "required": ["file"],
+        }}},
+    },
+})
+async def upload_image(session_id: str, request: Request):
+    """上传图片文件（multipart）
+
+    请求体在接收时就检查大小上限，不会先把超大的文件整个暂存下来
+    """
+    if session_id not in session_store:
+        raise HTTPException(status_code=404, detail="会话不存在，请先创建会话")
+    limit = MAX_UPLOAD_BYTES + MULTIPART_OVERHEAD
+    content_length = declared_length(request)
+    if content_length is not None and content_length > limit:
+        raise too_large()
+
+    form = None
+    try:
+        parser = MultiPartParser(request.headers, capped_stream(request, limit), max_files=1, max_fields=10)
+        form = await parser.parse()
+        file = form.get("file")
+        if not isinstance(file, UploadFile):
+            raise HTTPException(status_code=400, detail="缺少图片文件字段 file")
+        # 读取暂存文件只是 I/O，放在通用线程池中，不占用图片处理线程池的名额
+        contents, content_hash = await run_in_threadpool(read_upload_file, file.file)
+        return await run_image_pipeline(session_id, contents, content_hash, content_hash)
+    except UploadTooLarge:
+        raise too_large()
+    except MultiPartException as e:
+        raise HTTPException(status_code=400, detail=f"multipart 请求体格式错误: {e.message}")
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"图片上传失败: {str(e)}")
+    finally:
+        if form is not None:
+            await form.close()
+
+
+@router.post("/image/raw")
+async def upload_raw_image(session_id: str, request: Request):
+    """以原始字节流上传图片（请求体即图片文件）
+
+    边接收边计算哈希，超过大小上限时立即中止，不经过 base64 或 multipart 编码
+    """
+    if session_id not in session_store:
         raise HTTPException(status_code=404, detail="会话不存在，请先创建会话")
 
-    update_session_timestamp(session_id)
-    game_master = game_sessions[session_id]
+    content_length = declared_length(request)
+    if content_length is not None and content_length > MAX_UPLOAD_BYTES:
+        raise too_large()
+
+    digest = hashlib.sha256()
+    chunks = []
+    try:
+        async for chunk in capped_stream(request, MAX_UPLOAD_BYTES):
+            digest.update(chunk)
+            chunks.append(chunk)
+    except UploadTooLarge:
+        raise too_large()
+    if not any(chunks):
+        raise HTTPException(status_code=400, detail="请求体为空")
 
     try:
-        # 读取上传的文件
-        contents = await file.read()
-        image = Image.open(BytesIO(contents))
-
-        # 调整图片大小用于识别
-        resized_img_to_rec = resize_image(image, max_height=400)
-
-        # 提交图片
-        user_info, response = game_master.submit_image(resized_img_to_rec)
-
-        # 返回缩小后的图片用于显示
-        display_img = resize_image(image, max_height=200)
-        buffered = BytesIO()
-        display_img.save(buffered, format="PNG")
-        display_img_base64 = base64.b64encode(buffered.getvalue()).decode('utf-8')
-
-        return {
-            "user_info": user_info,
-            "response": response,
-            "status": game_master.get_status(),
-            "display_image_base64": display_img_base64
-        }
+        content_hash = digest.hexdigest()
+        return await run_image_pipeline(session_id, b"".join(chunks), content_hash, content_hash)
+    except HTTPException:
+        raise
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"图片上传失败: {str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"图片上传失败: {str(e)}")
@@ -1,12 +1,10 @@
 from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
+import asyncio
 import os
-import base64
-from io import BytesIO
-from PIL import Image
 
-from ..src.resize_img import resize_image
-from .session_routes import game_sessions, update_session_timestamp
+from ..src.thumbnail_cache import thumbnail_cache
+from .session_routes import get_game_master, save_game_master, session_gate
 
 router = APIRouter()
 
@@ -19,25 +17,18 @@ class ItemSubmit(BaseModel):
 @router.post("/item/submit")
 async def submit_item(item_data: ItemSubmit):
     """提交物品"""
-    if item_data.session_id not in game_sessions:
-        raise HTTPException(status_code=404, detail="会话不存在，请先创建会话")
-
-    update_session_timestamp(item_data.session_id)
-    game_master = game_sessions[item_data.session_id]
-
-    try:
-        user_info, response_info = game_master.submit_item(item_data.item_name)
+    async def handle_item():
+        game_master = get_game_master(item_data.session_id, detail="会话不存在，请先创建会话")
+        user_info, response_info = await game_master.asubmit_item(item_data.item_name)
+        save_game_master(item_data.session_id, game_master)
 
         # 获取物品图片路径
         img_path = game_master.name2img_path(item_data.item_name)
-        img_base64 = None
+        img_url = None
 
         if img_path and os.path.exists(img_path):
             try:
-                resized_img = resize_image(img_path, max_height=200)
-                buffered = BytesIO()
-                resized_img.save(buffered, format="PNG")
-                img_base64 = base64.b64encode(buffered.getvalue()).decode('utf-8')
+                img_url = await asyncio.to_thread(thumbnail_cache.thumbnail_for_file, img_path, 200)
             except Exception as e:
                 print(f"图片处理失败: {e}")
 
@@ -45,8 +36,13 @@ async def submit_item(item_data: ItemSubmit):
             "user_info": user_info,
             "response_info": response_info,
             "status": game_master.get_status(),
-            "image_base64": img_base64
+            "image_url": img_url
         }
+
+    try:
+        return await session_gate.run(item_data.session_id, ("item", item_data.item_name), handle_item)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"物品提交失败: {str(e)}")
 
@@ -54,11 +50,7 @@ async def submit_item(item_data: ItemSubmit):
 @router.get("/items/{session_id}")
 async def get_items(session_id: str):
     """获取当前可用物品列表"""
-    if session_id not in game_sessions:
-        raise HTTPException(status_code=404, detail="会话不存在")
-
-    update_session_timestamp(session_id)
-    game_master = game_sessions[session_id]
+    game_master = get_game_master(session_id)
     return {
         "items": game_master.get_item_names()
     }
\ No newline at end of file
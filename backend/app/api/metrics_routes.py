@@ -0,0 +1,32 @@
+from fastapi import APIRouter
+
+from ..src.http_client import get_pool_stats
+from ..src.worker_pool import image_worker_pool
+from ..src.scenario import scenario_registry
+from ..src.item_response_cache import item_response_cache
+from ..src.thumbnail_cache import thumbnail_cache
+from ..src.recognition_cache import recognition_cache
+from ..src.recognize_from_vlm import vlm_singleflight
+from ..src.embedding_service import embedding_service
+from ..src.warmup import warmup
+from .session_routes import session_reaper, session_gate
+
+router = APIRouter()
+
+
+@router.get("/metrics")
+async def get_metrics():
+    """获取服务运行指标"""
+    return {
+        "http_pool": get_pool_stats(),
+        "image_worker_pool": image_worker_pool.stats(),
+        "sessions": session_reaper.stats(),
+        "session_gate": session_gate.stats(),
+        "scenarios": scenario_registry.stats(),
+        "item_response_cache": item_response_cache.stats(),
+        "thumbnail_cache": thumbnail_cache.stats(),
+        "recognition_cache": recognition_cache.stats(),
+        "vlm_singleflight": vlm_singleflight.stats(),
+        "embedding_service": embedding_service.stats(),
+        "warmup": warmup.stats(),
+    }
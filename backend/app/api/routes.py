@@ -10,6 +10,8 @@ from .session_routes import router as session_router
 from .chat_routes import router as chat_router
 from .item_routes import router as item_router
 from .image_routes import router as image_router
+from .thumb_routes import router as thumb_router
+from .metrics_routes import router as metrics_router
 
 # 创建主路由器
 router = APIRouter()
@@ -19,3 +21,5 @@ router.include_router(session_router)
 router.include_router(chat_router)
 router.include_router(item_router)
 router.include_router(image_router)
+router.include_router(thumb_router)
+router.include_router(metrics_router)
@@ -5,42 +5,82 @@ import os
 import time
 
 from ..src.GameMaster import GameMaster
+from ..src.session_store import create_session_store
+from ..src.session_reaper import SessionExpiryIndex, SessionReaper
+from ..src.session_gate import SessionGate
 from ..config.config import get_session_config
 
 router = APIRouter()
 
-# 全局游戏状态管理（后续可以改为 Redis 或数据库存储）
-game_sessions = {}
-
-# Session 时间戳管理
-session_timestamps = {}
-
 # 加载session配置
 def load_session_config():
     session_config = get_session_config()
-    return {"session_timeout_minutes": session_config['timeout_minutes']}
+    return {
+        "session_timeout_minutes": session_config['timeout_minutes'],
+        "store": session_config['store'],
+    }
 
 session_config = load_session_config()
 SESSION_TIMEOUT_SECONDS = session_config.get("session_timeout_minutes", 20) * 60
 
-def cleanup_expired_sessions():
-    """清理超时的session"""
-    current_time = time.time()
-    expired_sessions = []
+# 全局游戏状态存储，后端由 config/session.yaml 的 store 指定
+session_store = create_session_store(session_config["store"], ttl_seconds=SESSION_TIMEOUT_SECONDS)
+
+# Session 过期时间索引
+session_expiry = SessionExpiryIndex(SESSION_TIMEOUT_SECONDS)
+
+
+def expire_session(session_id: str) -> bool:
+    """回收一个在本进程看来已过期的session，返回是否真的被回收"""
+    if session_store.self_expiring:
+        # 由存储自身的 TTL 负责删除，这里只移出本地索引，不计入回收数
+        return False
+
+    # 多 worker 共享存储时，其他 worker 可能刚刚刷新过这个session
+    last_active = session_store.last_active(session_id)
+    if last_active is not None and time.time() - last_active < SESSION_TIMEOUT_SECONDS:
+        session_expiry.touch(session_id, last_active)
+        return False
+
+    return session_store.delete(session_id)
+
+
+session_reaper = SessionReaper(session_expiry, expire_session)
+
+# 同一会话的请求串行执行，相同的重复请求合并（仅限本进程）
+session_gate = SessionGate()
 
-    for session_id, timestamp in session_timestamps.items():
-        if current_time - timestamp > SESSION_TIMEOUT_SECONDS:
-            expired_sessions.append(session_id)
 
-    for session_id in expired_sessions:
-        if session_id in game_sessions:
-            del game_sessions[session_id]
-        del session_timestamps[session_id]
-        print(f"清理过期session: {session_id}")
+def start_session_reaper():
+    """载入存储中已有的session并启动后台回收任务，在应用启动时调用"""
+    now = time.time()
+    for session_id in session_store.ids():
+        session_expiry.touch(session_id, session_store.last_active(session_id) or now)
+    session_reaper.start()
+
+
+async def stop_session_reaper():
+    await session_reaper.stop()
+
 
 def update_session_timestamp(session_id: str):
     """更新session的最后活动时间"""
-    session_timestamps[session_id] = time.time()
+    session_expiry.touch(session_id)
+    session_store.touch(session_id)
+
+
+def get_game_master(session_id: str, detail: str = "会话不存在") -> GameMaster:
+    """取出会话并刷新活动时间，会话不存在时返回 404"""
+    game_master = session_store.get(session_id)
+    if game_master is None:
+        raise HTTPException(status_code=404, detail=detail)
+    update_session_timestamp(session_id)
+    return game_master
+
+
+def save_game_master(session_id: str, game_master: GameMaster):
+    """把修改后的会话写回存储"""
+    session_store.put(session_id, game_master)
 
 
 class SessionCreate(BaseModel):
@@ -52,9 +92,6 @@ class SessionCreate(BaseModel):
 async def create_session(session_data: SessionCreate):
     """创建新的游戏会话"""
     try:
-        # 清理过期session
-        cleanup_expired_sessions()
-
         # 构建配置文件的完整路径
         config_path = os.path.join(os.path.dirname(__file__), "..", session_data.config_path)
 
@@ -62,7 +99,7 @@ async def create_session(session_data: SessionCreate):
             raise HTTPException(status_code=404, detail=f"配置文件不存在: {session_data.config_path}")
 
         game_master = GameMaster(config_path)
-        game_sessions[session_data.session_id] = game_master
+        save_game_master(session_data.session_id, game_master)
 
         # 记录session创建时间
         update_session_timestamp(session_data.session_id)
@@ -80,11 +117,7 @@ async def create_session(session_data: SessionCreate):
 @router.get("/session/{session_id}/status")
 async def get_session_status(session_id: str):
     """获取会话状态"""
-    if session_id not in game_sessions:
-        raise HTTPException(status_code=404, detail="会话不存在")
-
-    update_session_timestamp(session_id)
-    game_master = game_sessions[session_id]
+    game_master = get_game_master(session_id)
     return {
         "session_id": session_id,
         "status": game_master.get_status(),
@@ -96,7 +129,7 @@ async def get_session_status(session_id: str):
 @router.post("/session/{session_id}/reset")
 async def reset_session(session_id: str, config_path: Optional[str] = None):
     """重置游戏会话"""
-    if session_id not in game_sessions:
+    if session_id not in session_store:
         raise HTTPException(status_code=404, detail="会话不存在")
 
     update_session_timestamp(session_id)
@@ -108,7 +141,7 @@ async def reset_session(session_id: str, config_path: Optional[str] = None):
 
         full_config_path = os.path.join(os.path.dirname(__file__), "..", config_path)
         game_master = GameMaster(full_config_path)
-        game_sessions[session_id] = game_master
+        save_game_master(session_id, game_master)
 
         return {
             "session_id": session_id,
@@ -122,10 +155,8 @@ async def reset_session(session_id: str, config_path: Optional[str] = None):
 @router.delete("/session/{session_id}")
 async def delete_session(session_id: str):
     """删除会话"""
-    if session_id not in game_sessions:
+    if not session_store.delete(session_id):
         raise HTTPException(status_code=404, detail="会话不存在")
 
-    del game_sessions[session_id]
-    if session_id in session_timestamps:
-        del session_timestamps[session_id]
+    session_expiry.discard(session_id)
     return {"message": "会话已删除", "session_id": session_id}
\ No newline at end of file
@@ -0,0 +1,24 @@
+from fastapi import APIRouter, HTTPException, Request, Response
+
+from ..src.thumbnail_cache import thumbnail_cache
+
+router = APIRouter()
+
+
+@router.get("/thumb/{key}")
+async def get_thumbnail(key: str, request: Request):
+    """获取缩略图，内容按哈希寻址，永不改变，允许客户端长期缓存"""
+    etag = f'"{key}"'
+    headers = {
+        "Cache-Control": "public, max-age=31536000, immutable",
+        "ETag": etag,
+    }
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+
+    thumbnail = thumbnail_cache.get(key)
+    if thumbnail is None:
+        raise HTTPException(status_code=404, detail="缩略图不存在")
+
+    data, media_type = thumbnail
+    return Response(content=data, media_type=media_type, headers=headers)
@@ -28,12 +28,56 @@ class Config:
 
     def _load_env_config(self):
         """加载环境变量配置"""
+        image_workers = int(os.getenv('IMAGE_WORKERS', min(4, os.cpu_count() or 1)))
         self._env_config = {
             'llm': {
                 'base_url': os.getenv('LLM_BASE_URL', 'https://api.openai.com/v1'),
                 'api_key': os.getenv('LLM_API_KEY'),
                 'model_name': os.getenv('LLM_MODEL_NAME', 'gpt-4o-mini'),
             },
+            'http': {
+                'max_connections': int(os.getenv('LLM_HTTP_MAX_CONNECTIONS', 100)),
+                'max_keepalive_connections': int(os.getenv('LLM_HTTP_MAX_KEEPALIVE', 20)),
+                'keepalive_expiry': float(os.getenv('LLM_HTTP_KEEPALIVE_EXPIRY', 60)),
+                'timeout': float(os.getenv('LLM_HTTP_TIMEOUT', 60)),
+                'connect_timeout': float(os.getenv('LLM_HTTP_CONNECT_TIMEOUT', 10)),
+                'http2': os.getenv('LLM_HTTP2', 'false').lower() in ('1', 'true', 'yes'),
+            },
+            'image_pool': {
+                'max_workers': image_workers,
+                'queue_size': int(os.getenv('IMAGE_QUEUE_SIZE', 16)),
+                'retry_after': int(os.getenv('IMAGE_RETRY_AFTER', 5)),
+                'max_upload_mb': float(os.getenv('IMAGE_MAX_UPLOAD_MB', 15)),
+            },
+            'item_cache': {
+                'max_size': int(os.getenv('ITEM_CACHE_SIZE', 1024)),
+                'persist_path': os.getenv('ITEM_CACHE_PATH', ''),
+            },
+            'recognition_cache': {
+                'max_size': int(os.getenv('RECOG_CACHE_SIZE', 4096)),
+                'ttl_seconds': float(os.getenv('RECOG_CACHE_TTL', 3600)),
+                'unknown_ttl_seconds': float(os.getenv('RECOG_CACHE_UNKNOWN_TTL', 600)),
+                'max_distance': int(os.getenv('RECOG_CACHE_MAX_DISTANCE', 4)),
+                'min_texture': float(os.getenv('RECOG_CACHE_MIN_TEXTURE', 2.0)),
+            },
+            'embedding': {
+                'enabled': os.getenv('IMAGE_MASTER_ENABLED', 'false').lower() in ('1', 'true', 'yes'),
+                'use_mirror': os.getenv('IMAGE_MASTER_MIRROR', 'false').lower() in ('1', 'true', 'yes'),
+                # CLIP 调用都在图片线程池中进行，同时提交的请求不会超过 IMAGE_WORKERS，
+                # 批大小超过线程数时永远凑不满，每批都要白等 EMBED_BATCH_WAIT_MS，所以默认与线程数相同
+                'batch_size': int(os.getenv('EMBED_BATCH_SIZE', image_workers)),
+                'batch_wait_ms': float(os.getenv('EMBED_BATCH_WAIT_MS', 5)),
+            },
+            'warmup': {
+                'scenarios': [p.strip() for p in os.getenv('WARMUP_SCENARIOS', 'config/police.yaml').split(',') if p.strip()],
+                'llm': os.getenv('WARMUP_LLM', 'true').lower() in ('1', 'true', 'yes'),
+            },
+            'thumbnail': {
+                'max_mb': int(os.getenv('THUMB_CACHE_MAX_MB', 64)),
+                'cache_dir': os.getenv('THUMB_CACHE_DIR', ''),
+                'format': os.getenv('THUMB_FORMAT', 'webp').lower(),
+                'quality': int(os.getenv('THUMB_QUALITY', 80)),
+            },
             'server': {
                 'port': int(os.getenv('PORT', 8000)),
             }
@@ -80,6 +124,41 @@ class Config:
     def llm_model_name(self) -> str:
         return self._env_config['llm']['model_name']
 
+    # HTTP连接池配置
+    @property
+    def http_client_config(self) -> Dict[str, Any]:
+        return self._env_config['http']
+
+    # 图片处理线程池配置
+    @property
+    def image_pool_config(self) -> Dict[str, Any]:
+        return self._env_config['image_pool']
+
+    # 物品回复缓存配置
+    @property
+    def item_cache_config(self) -> Dict[str, Any]:
+        return self._env_config['item_cache']
+
+    # 图片识别结果缓存配置
+    @property
+    def recognition_cache_config(self) -> Dict[str, Any]:
+        return self._env_config['recognition_cache']
+
+    # 共享图像特征服务配置
+    @property
+    def embedding_config(self) -> Dict[str, Any]:
+        return self._env_config['embedding']
+
+    # 启动预热配置
+    @property
+    def warmup_config(self) -> Dict[str, Any]:
+        return self._env_config['warmup']
+
+    # 缩略图缓存配置
+    @property
+    def thumbnail_config(self) -> Dict[str, Any]:
+        return self._env_config['thumbnail']
+
     # 服务器配置
     @property
     def server_port(self) -> int:
@@ -91,6 +170,11 @@ class Config:
         session_config = self._load_yaml_config('session')
         return session_config.get('session_timeout_minutes', 20)
 
+    @property
+    def session_store_config(self) -> Dict[str, Any]:
+        session_config = self._load_yaml_config('session')
+        return session_config.get('store', {'backend': 'memory'})
+
     # 游戏配置
     def get_game_config(self, config_name: str) -> Dict[str, Any]:
         """获取游戏配置"""
@@ -124,10 +208,39 @@ def get_llm_config():
         'model_name': config.llm_model_name,
     }
 
+def get_http_client_config():
+    """获取LLM/VLM共享HTTP连接池配置"""
+    return dict(config.http_client_config)
+
+def get_image_pool_config():
+    """获取图片处理线程池配置"""
+    return dict(config.image_pool_config)
+
+def get_item_cache_config():
+    """获取跨会话物品回复缓存配置"""
+    return dict(config.item_cache_config)
+
+def get_recognition_cache_config():
+    """获取图片识别结果缓存配置"""
+    return dict(config.recognition_cache_config)
+
+def get_embedding_config():
+    """获取共享图像特征服务配置"""
+    return dict(config.embedding_config)
+
+def get_warmup_config():
+    """获取启动预热配置"""
+    return dict(config.warmup_config)
+
+def get_thumbnail_config():
+    """获取缩略图缓存配置"""
+    return dict(config.thumbnail_config)
+
 def get_session_config():
     """获取Session配置"""
     return {
         'timeout_minutes': config.session_timeout_minutes,
+        'store': config.session_store_config,
     }
 
 def get_game_config(config_name: str):
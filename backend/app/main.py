@@ -1,4 +1,5 @@
 from fastapi import FastAPI
+from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
 import os
@@ -9,13 +10,26 @@ load_dotenv()
 
 # 导入路由
 from .api.routes import router
+from .src.http_client import close_http_clients
+from .src.worker_pool import image_worker_pool
+from .src.warmup import warmup
+from .src.embedding_service import embedding_service
+from .api.session_routes import start_session_reaper, stop_session_reaper
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # 启动时执行
     print("🚀 Starting whale-land-VLM backend server...")
+    start_session_reaper()
+    # 在后台预热（载入 CLIP、建立 LLM 连接、编译默认剧本），完成前 /ready 返回 503
+    warmup.start()
     yield
     # 关闭时执行
+    await warmup.stop()
+    await stop_session_reaper()
+    image_worker_pool.shutdown(wait=False)
+    embedding_service.close()
+    await close_http_clients()
     print("👋 Shutting down whale-land-VLM backend server...")
 
 app = FastAPI(
@@ -53,8 +67,17 @@ async def root():
 
 @app.get("/health")
 async def health_check():
+    """存活检查：进程在运行即可"""
     return {"status": "healthy"}
 
+@app.get("/ready")
+async def ready_check():
+    """就绪检查：预热完成后才返回 200，必需的预热步骤失败时一直返回 503"""
+    if not warmup.ready:
+        status = "failed" if warmup.status == "failed" else "warming_up"
+        return JSONResponse(status_code=503, content={"status": status, "warmup": warmup.stats()})
+    return {"status": "ready" if warmup.status == "done" else "degraded", "warmup": warmup.stats()}
+
 if __name__ == "__main__":
     import uvicorn
     port = int(os.getenv("PORT", 8000))
@@ -1,6 +1,12 @@
-from .llm_response import get_llm_response
+from .llm_response import get_llm_response, aget_llm_response, astream_llm_response
 from .parse_json import parse_json
 from .recognize_from_vlm import get_vlm_response_cot
+from .scenario import scenario_registry
+from .item_response_cache import item_response_cache
+from .recognition_cache import recognition_cache, image_fingerprint
+from .embedding_service import embedding_service
+
+UNKNOWN_OBJECT_TEXT = "一张不知所云的图片。"
 
 
 class GameMaster:
@@ -18,6 +24,9 @@ class GameMaster:
 
         self.item2cache_text = {}
 
+        self.config_path = yaml_file_path
+        self.current_index = 0
+
         self.current_step = {
             # default welcome info
             "welcome_info": "欢迎来到游戏，快来和我一起探索吧",
@@ -25,14 +34,30 @@ class GameMaster:
             "conds": []
         }
         
+        self.scenario = None
+        self.use_record_images = False
+        self.record_image_threshold = 0.89
+        self.use_zero_shot = False
+
         if yaml_file_path is not None:
-            self.prompt_steps, self.items, self.use_record_images = self.load_yaml(yaml_file_path)
+            # 剧本内容由所有会话共享，只读
+            self.scenario = scenario_registry.get(yaml_file_path)
+            self.prompt_steps = self.scenario.prompt_steps
+            self.items = self.scenario.items
+            self.item2text = self.scenario.item2text
+            self.record_image_threshold = self.scenario.record_image_threshold
+            self.use_record_images = self.scenario.use_record_images
+            self.use_zero_shot = self.scenario.use_zero_shot
+            if self.use_record_images:
+                self.init_image_master()
+            elif self.use_zero_shot:
+                self.image_master = embedding_service
+
             if len(self.prompt_steps) > 0:
                 self.current_step = self.prompt_steps[0]
                 self.current_index = 0
             else:
                 print("没有成功从yaml载入关卡 使用了默认的example NPC")
-            self.item2text = self.load_default_item_text_map(self.items)
             welcome_message = {
                 "role": "assistant",
                 "content": self.current_step["welcome_info"]
@@ -41,55 +66,41 @@ class GameMaster:
         else:
             self.item2text = self.load_default_item_text_map()
 
-    def init_image_master(self, config_path=None):
-        from .ImageMaster import ImageMaster
-        print("正在初始化image_master")
-        self.image_master = ImageMaster()
-        if config_path is None:
-            config_path = "config/image_master.yaml"
-        self.image_master.set_from_config(config_path) 
-        self.image_master.init_model()
-        self.image_master.load_database()
-        self.use_record_images = True
-
-    def load_yaml(self, yaml_file_path):
-        '''
-        从yaml中读取prompt_steps和items并返回
-        '''
-        import yaml
-        with open(yaml_file_path, 'r', encoding='utf-8') as f:
-            data = yaml.safe_load(f)
-            
-        prompt_steps = data['prompt_steps']
-        items = []
-        for item in data['items']:
-            items.append({
-                'name': item['name'],
-                'text': item['text'],
-                'img_path': item['img_path']
-            })
-
-        if 'record_image_threshold' in data:
-            self.record_image_threshold = data['record_image_threshold']
-        else:
-            self.record_image_threshold = 0.89
-
-        if 'use_record_images' in data:
-            use_record_images = data['use_record_images']
-        else:
-            use_record_images = False
+    def get_state(self):
+        """导出会话中会变化的部分，用于会话存储持久化"""
+        return {
+            "config_path": self.config_path,
+            "status": sorted(self.status),
+            "current_index": self.current_index,
+            "history": self.history,
+            "item2cache_text": self.item2cache_text,
+        }
 
-        if use_record_images:
-            self.init_image_master()
-        
-        return prompt_steps, items, use_record_images
+    def load_state(self, state):
+        """从 get_state 导出的数据恢复会话进度"""
+        self.status = set(state["status"])
+        self.history = list(state["history"])
+        self.item2cache_text = dict(state["item2cache_text"])
+        self.current_index = state["current_index"]
+        if self.prompt_steps:
+            self.current_step = self.prompt_steps[self.current_index]
+
+    @classmethod
+    def from_state(cls, state):
+        game_master = cls(state["config_path"])
+        game_master.load_state(state)
+        return game_master
+
+    def init_image_master(self):
+        # CLIP 模型和特征库由所有会话共享，在服务启动时载入（IMAGE_MASTER_ENABLED）
+        # 未载入时 extract_object_from_image 直接使用 VLM 识别
+        self.image_master = embedding_service
+        self.use_record_images = True
 
     def name2img_path(self, name):
-        for item in self.items:
-            if item['name'] == name:
-                return item['img_path']
+        if self.scenario is not None:
+            return self.scenario.img_path(name)
         return None
-        
 
     def load_default_item_text_map(self, items=None):
         
@@ -125,7 +136,8 @@ class GameMaster:
 
         return ans
                 
-    def get_item_response(self, item_name):
+    def _update_item_status(self, item_name):
+        """记录提交的物品并推进关卡，返回 (规范化后的物品名, 进入下一阶段的提示)"""
         if item_name in self.item_expand_name2name:
             item_name = self.item_expand_name2name[item_name]
 
@@ -143,14 +155,32 @@ class GameMaster:
                 next_status_info = "\n" + self.current_step["welcome_info"]
                 self.status = set()
 
+        return item_name, next_status_info
+
+    def _get_known_item_text(self, item_name):
         if item_name in self.item2text:
-            return self.item2text[item_name] + next_status_info
-        elif item_name in self.item2cache_text:
-            return self.item2cache_text[item_name] + next_status_info
-        else:
-            return self.generate_item_response(item_name) + next_status_info
+            return self.item2text[item_name]
+        if item_name in self.item2cache_text:
+            return self.item2cache_text[item_name]
+        return None
 
-    def generate_item_response(self, item_name):
+    def get_item_response(self, item_name):
+        item_name, next_status_info = self._update_item_status(item_name)
+
+        known_text = self._get_known_item_text(item_name)
+        if known_text is not None:
+            return known_text + next_status_info
+        return self.generate_item_response(item_name) + next_status_info
+
+    async def aget_item_response(self, item_name):
+        item_name, next_status_info = self._update_item_status(item_name)
+
+        known_text = self._get_known_item_text(item_name)
+        if known_text is not None:
+            return known_text + next_status_info
+        return await self.agenerate_item_response(item_name) + next_status_info
+
+    def _build_item_messages(self, item_name):
         background_info = ""
         for step in self.prompt_steps:
             background_info += f"该游戏阶段的背景设定: {step['prompt']}\n"
@@ -172,38 +202,100 @@ class GameMaster:
         "character_response" - 根据人物性格和剧情设定，输出人物对物品 {item_name} 的反应。如果物品与当前剧情无关，请生成一个引导用户继续调查的回复，至少包含两句对话，确保回复总是有效且相关。
         """
 
-        messages = [
+        return [
             {"role": "system", "content": system_prompt},
             {"role": "user", "content": user_prompt},
         ]
-        response_text = get_llm_response(messages)
 
+    def _parse_item_response(self, response_text):
         response_in_dict = parse_json(response_text, forced_keywords=["character_response"])
 
-        if response_in_dict is not None and "character_response" in response_in_dict:
-            response_text = response_in_dict["character_response"]
-        else:
-            response_text = "这个物品看起来有点奇怪，不太像是案件线索。你们继续仔细搜索现场，看看还有什么其他可疑的东西吗？"
+        if response_in_dict is not None and response_in_dict.get("character_response"):
+            return response_in_dict["character_response"]
+        return None
 
+    def _get_cached_item_response(self, item_name):
+        if self.scenario is None:
+            return None
+        return item_response_cache.get(self.scenario.cache_key, self.current_index, item_name)
+
+    def _remember_item_response(self, item_name, response_text):
+        if response_text is None:
+            # 解析失败时使用兜底台词，不写入缓存，下次仍然重新生成
+            return "这个物品看起来有点奇怪，不太像是案件线索。你们继续仔细搜索现场，看看还有什么其他可疑的东西吗？"
+        self.item2cache_text[item_name] = response_text
+        if self.scenario is not None:
+            item_response_cache.put(self.scenario.cache_key, self.current_index, item_name, response_text)
         return response_text
 
+    def generate_item_response(self, item_name):
+        cached = self._get_cached_item_response(item_name)
+        if cached is not None:
+            self.item2cache_text[item_name] = cached
+            return cached
+
+        messages = self._build_item_messages(item_name)
+        response_text = get_llm_response(messages)
+        return self._remember_item_response(item_name, self._parse_item_response(response_text))
+
+    async def agenerate_item_response(self, item_name):
+        cached = self._get_cached_item_response(item_name)
+        if cached is not None:
+            self.item2cache_text[item_name] = cached
+            return cached
+
+        messages = self._build_item_messages(item_name)
+        response_text = await aget_llm_response(messages)
+        return self._remember_item_response(item_name, self._parse_item_response(response_text))
+
     def get_item_names(self):
-        ans = []
-        for item in self.items:
-            ans.append(item["name"])
-        return ans
+        if self.scenario is not None:
+            return list(self.scenario.item_names)
+        return []
+
+    def get_record_image_names(self):
+        """快速识别时检索的物品范围，None 表示整个特征库"""
+        if self.scenario is None or self.scenario.record_image_scope == 'all':
+            return None
+        if self.scenario.record_image_scope == 'step':
+            return self.scenario.step_item_names[self.current_index]
+        return self.scenario.item_names
+
+    def match_item_by_text(self, feature):
+        """零样本识别：照片与剧本物品名的文字特征比较，第一名与第二名的概率差不小于 zero_shot_margin、
+        且图文相似度不低于 zero_shot_min_similarity 时返回物品名，否则返回 None 交给 VLM"""
+        try:
+            results = self.image_master.zero_shot(feature, self.scenario.zero_shot_items)
+        except Exception as e:
+            print("Warning！ 零样本识别失败！", e)
+            return None
+        if not results:
+            return None
+        top = results[0]
+        margin = top['probability'] - (results[1]['probability'] if len(results) > 1 else 0.0)
+        if margin >= self.scenario.zero_shot_margin and top['similarity'] >= self.scenario.zero_shot_min_similarity:
+            print(f"零样本识别出物体为: {top['name']}（概率 {top['probability']:.2f}，领先 {margin:.2f}）")
+            return top['name']
+        return None
 
     def get_welcome_info(self):
         return self.current_step["welcome_info"]
 
     def extract_object_from_image(self, resized_img):
 
-        if self.use_record_images:
+        feature = None
+        if (self.use_record_images or self.use_zero_shot) and self.image_master.ready:
             try:
                 feature = self.image_master.extract_feature(resized_img)
-                results = self.image_master.extract_item_from_feature(feature)
             except:
                 print("Warning！ 提取图片特征失败！")
+
+        if feature is not None and self.use_record_images:
+            try:
+                # 只在当前剧本的物品中检索，其他剧本的道具不会被误认
+                results = self.image_master.extract_item_from_feature(feature, self.get_record_image_names())
+            except:
+                print("Warning！ 图片特征检索失败！")
                 results = None
 
             if results is not None and len(results) > 0:
@@ -213,17 +305,40 @@ class GameMaster:
                     print("快速识别出物体为:", res)
                     return res
 
+        # 特征库中没有足够相似的记录（例如新剧本还没有录入图片）时，与物品名的文字特征比较
+        if feature is not None and self.use_zero_shot:
+            res = self.match_item_by_text(feature)
+            if res is not None:
+                return res
+
         candidate_object_list_names = self.get_item_names()
-        str_response = get_vlm_response_cot(resized_img, candidate_object_list_names)
+
+        # 同一剧本、同一组候选物品下，几乎相同的照片复用之前的识别结果；
+        # 几乎没有纹理的照片（纯色、镜头被遮住）无法可靠区分，不使用缓存
+        fingerprint = image_fingerprint(resized_img, min_texture=recognition_cache.min_texture)
+        if fingerprint is not None:
+            image_hash, color_signature = fingerprint
+            scenario_key = self.scenario.cache_key if self.scenario is not None else self.config_path
+            context = (scenario_key, tuple(candidate_object_list_names), color_signature)
+            cached = recognition_cache.get(context, image_hash)
+            if cached is not None:
+                print("识别缓存命中:", cached)
+                return cached
+
+        str_response = get_vlm_response_cot(resized_img, candidate_object_list_names, fingerprint=fingerprint)
         dict_response = parse_json(str_response, forced_keywords=["fixed_object_name", "major_object"])
         print(dict_response)
-        if dict_response is not None and "fixed_object_name" in dict_response:
+        if dict_response is not None and dict_response.get("fixed_object_name"):
             response_text = dict_response["fixed_object_name"]
-        elif dict_response is not None and "major_object" in dict_response:
+        elif dict_response is not None and dict_response.get("major_object"):
             response_text = dict_response["major_object"]
         else:
-            response_text = "一张不知所云的图片。"
+            response_text = UNKNOWN_OBJECT_TEXT
 
+        # 无法识别的结果也缓存，避免同一张废片反复调用 VLM
+        if fingerprint is not None:
+            recognition_cache.put(context, image_hash, response_text,
+                                  is_unknown=response_text == UNKNOWN_OBJECT_TEXT)
         return response_text
 
     def submit_image(self, img_name):
@@ -239,7 +354,15 @@ class GameMaster:
         self.history.append({"role": "assistant", "content": response_info})
         return user_info, response_info
 
-    def get_chat_response(self, system_prompt, user_input):
+    async def asubmit_item(self, item_name):
+        user_info = "用户提交了物品：" + item_name
+        print(user_info)
+        response_info = await self.aget_item_response(item_name)
+        self.history.append({"role": "user", "content": user_info})
+        self.history.append({"role": "assistant", "content": response_info})
+        return user_info, response_info
+
+    def _build_chat_messages(self, system_prompt, user_input):
         messages = [
             {"role": "system", "content": system_prompt}
         ]
@@ -248,16 +371,44 @@ class GameMaster:
             messages.append(self.history[-(max_history_len-i)])
 
         messages.append({"role": "user", "content": user_input})
+        return messages
+
+    def get_chat_response(self, system_prompt, user_input):
+        messages = self._build_chat_messages(system_prompt, user_input)
         response = get_llm_response(messages, max_tokens=400)
         self.history.append({"role": "user", "content": user_input})
         self.history.append({"role": "assistant", "content": response})
         return response
 
+    async def aget_chat_response(self, system_prompt, user_input):
+        messages = self._build_chat_messages(system_prompt, user_input)
+        response = await aget_llm_response(messages, max_tokens=400)
+        self.history.append({"role": "user", "content": user_input})
+        self.history.append({"role": "assistant", "content": response})
+        return response
+
+    async def astream_chat(self, user_input):
+        """流式生成NPC回复，生成结束后再把完整回复写入 history"""
+        system_prompt = self.get_system_prompt()
+        messages = self._build_chat_messages(system_prompt, user_input)
+        chunks = []
+        async for delta in astream_llm_response(messages, max_tokens=400):
+            chunks.append(delta)
+            yield delta
+        response = "".join(chunks)
+        self.history.append({"role": "user", "content": user_input})
+        self.history.append({"role": "assistant", "content": response})
+
     def submit_chat(self, user_input):
         system_prompt = self.get_system_prompt()
         response = self.get_chat_response(system_prompt, user_input)
         return user_input, response
 
+    async def asubmit_chat(self, user_input):
+        system_prompt = self.get_system_prompt()
+        response = await self.aget_chat_response(system_prompt, user_input)
+        return user_input, response
+
     def get_system_prompt(self, status=None):
         if status is None:
             status = self.status
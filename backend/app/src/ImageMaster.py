@@ -0,0 +1,617 @@
+import os
+import yaml
+import logging
+import threading
+import numpy as np
+from pathlib import Path
+from collections import OrderedDict
+from PIL import Image
+from typing import List, Tuple, Dict, Optional, Sequence, Union
+from transformers import CLIPProcessor, CLIPModel
+import torch
+
+from .feature_index import FeatureMatrix, QuantizedIndex, create_ivf_index, load_ivf_index, ivf_index_path
+from .feature_store import (FeatureStore, QuantizedStore, migrate_jsonl, names_path_for, deleted_path_for,
+                            manifest_path_for, quantized_path_for, read_deleted)
+
+class ImageMaster:
+    """图像特征提取和相似度匹配类（后端只保留运行时需要的部分，建库请使用 gradio_demo 中的版本）"""
+    
+    def __init__(self):
+        self.config = None
+        self.model = None
+        self.processor = None
+        self.database = FeatureMatrix()  # 归一化后的特征矩阵和物品名
+        self.index = None  # 可选的 IVF 索引或量化副本，None 时直接在 float32 矩阵上精确检索
+        self._unsaved_index_records = 0
+        self._partitions = {}  # 物品名集合 -> (已扫描的记录数, 记录下标)，只对 _partition_source 这个特征库有效
+        self._partition_source = None
+        self._partition_lock = threading.Lock()
+        self.store = None  # 二进制特征文件
+        self.database_path = None
+        self.data_file_path = None
+        self.legacy_file_path = None  # 旧的 JSONL 特征库，存在时自动转换
+        self.logger = None
+        self._batch_supported = True  # OpenVINO 模型是否支持批量输入
+        self._text_model = None  # OpenVINO 后端计算文字特征用的 huggingface 模型，服务预热时载入
+        self._text_model_lock = threading.Lock()
+        self._text_features = OrderedDict()  # 物品列表 -> (物品名, 文字特征矩阵)
+        self._text_lock = threading.Lock()
+        
+    def set_from_config(self, config_file_path: str):
+        """从配置文件载入设置"""
+        try:
+            with open(config_file_path, 'r', encoding='utf-8') as f:
+                self.config = yaml.safe_load(f)
+            
+            # 设置路径
+            self.database_path = Path(self.config['database']['default_path'])
+            self.data_file_path = self.database_path / self.config['database']['data_file']
+            legacy_file = self.config['database'].get('legacy_file')
+            if self.data_file_path.suffix == '.jsonl':
+                # 旧配置直接指向 JSONL，转换后使用同名的 .bin
+                legacy_file = self.data_file_path.name
+                self.data_file_path = self.data_file_path.with_suffix('.bin')
+            self.legacy_file_path = self.database_path / legacy_file if legacy_file else None
+
+            quantization = self._index_settings()['quantization']
+            if quantization not in ('none', 'int8'):
+                raise ValueError(f"不支持的量化方式: {quantization}，可选 none / int8（float16 检索比 float32 更慢，不提供）")
+            
+            # 创建必要的目录
+            self.database_path.mkdir(parents=True, exist_ok=True)
+            Path(self.config['logging']['file']).parent.mkdir(parents=True, exist_ok=True)
+            
+            # 设置日志
+            logging.basicConfig(
+                level=getattr(logging, self.config['logging']['level']),
+                format='%(asctime)s - %(levelname)s - %(message)s',
+                handlers=[
+                    logging.FileHandler(self.config['logging']['file'], encoding='utf-8'),
+                    logging.StreamHandler()
+                ]
+            )
+            self.logger = logging.getLogger(__name__)
+            self.logger.info("配置文件载入成功")
+            
+        except Exception as e:
+            print(f"载入配置文件失败: {e}")
+            raise
+
+    @property
+    def backend(self) -> str:
+        return self.config.get('backend', 'huggingface')
+
+    def init_model(self):
+        if self.backend == 'openvino':
+            self._init_openvino_model()
+        elif self.backend == 'huggingface':
+            self._init_huggingface_model()
+        else:
+            raise ValueError(f"不支持的后端: {self.backend}")
+
+    def _init_openvino_model(self):
+        import openvino as ov
+        try:
+            core = ov.Core()
+            device = self.config['model']['device']
+            model_name = self.config['model']['name']
+            model_path = self.config['model']['path']
+            force_download = self.config['model'].get('force_download', False)
+            self.model = core.compile_model(model_path, device)
+            self.processor = CLIPProcessor.from_pretrained(model_name, force_download=force_download)
+        except Exception as e:
+            self.logger.error(f"OpenVINO模型初始化失败: {e}")
+            raise
+
+    def _init_huggingface_model(self):
+        """初始化CLIP模型"""
+        try:
+            device = self.config['model']['device']
+            model_source = self.config['model'].get('source', 'huggingface')
+            model_name = self.config['model']['name']
+            
+            # 设置HuggingFace镜像
+            if model_source.lower() == 'hf_mirror':
+                mirror_url = self.config['model'].get('mirror_url', 'https://hf-mirror.com')
+                self.logger.info(f"正在从HF镜像载入模型: {model_name}, 镜像: {mirror_url}, 设备: {device}")
+                
+                # 设置环境变量使用镜像
+                import os
+                original_hf_endpoint = os.environ.get('HF_ENDPOINT')
+                os.environ['HF_ENDPOINT'] = mirror_url
+                
+                try:
+                    force_download = self.config['model'].get('force_download', False)
+                    print(f"force_download: {force_download}")
+                    self.model = CLIPModel.from_pretrained(model_name, force_download=force_download)
+                    self.processor = CLIPProcessor.from_pretrained(model_name, force_download=force_download)
+                    self.logger.info(f"成功从镜像站载入模型: {mirror_url}")
+                except Exception as e:
+                    self.logger.warning(f"镜像站加载失败: {e}，回退到官方HuggingFace")
+                    # 恢复原始环境变量
+                    if original_hf_endpoint:
+                        os.environ['HF_ENDPOINT'] = original_hf_endpoint
+                    else:
+                        os.environ.pop('HF_ENDPOINT', None)
+                    
+                    # 回退到官方HuggingFace
+                    force_download = self.config['model'].get('force_download', False)
+                    print(f"force_download: {force_download}")
+                    self.model = CLIPModel.from_pretrained(model_name, force_download=force_download)
+                    self.processor = CLIPProcessor.from_pretrained(model_name, force_download=force_download)
+                    
+            else:
+                # 使用官方HuggingFace
+                self.logger.info(f"正在从官方HuggingFace载入模型: {model_name}, 设备: {device}")
+
+                use_local = self.config['model'].get('use_local', False)
+                print(f"use_local: {use_local}")
+                
+                try:
+                    if use_local:
+                        print("直接载入本地模型")
+                        self.model = CLIPModel.from_pretrained(model_name, force_download=False, local_files_only=True)
+                        self.processor = CLIPProcessor.from_pretrained(model_name, force_download=False, local_files_only=True)
+                    else:
+                        # 尝试强制下载
+                        force_download = self.config['model'].get('force_download', False)
+                        print(f"force_download: {force_download}")
+                        self.model = CLIPModel.from_pretrained(model_name, force_download=force_download)
+                        self.processor = CLIPProcessor.from_pretrained(model_name, force_download=force_download)
+                except Exception as e:
+                    self.logger.warning(f"从官方HuggingFace下载模型失败，尝试使用本地缓存: {e}")
+                    # 尝试使用本地缓存
+                    self.model = CLIPModel.from_pretrained(model_name, force_download=False)
+                    self.processor = CLIPProcessor.from_pretrained(model_name, force_download=False)
+            
+            # 设置设备
+            if device == "cpu":
+                self.model = self.model.to("cpu")
+            else:
+                self.model = self.model.to(device)
+            
+            self.model.eval()  # 设置为评估模式
+            self.logger.info(f"模型初始化成功，来源: {model_source}")
+            
+        except Exception as e:
+            self.logger.error(f"模型初始化失败: {e}")
+            raise
+    
+    def _storage_dtype(self) -> str:
+        """特征文件的存储精度，已有文件以文件头为准"""
+        return (self.config.get('compression') or {}).get('dtype', 'float32')
+
+    def _prepare_image(self, image: Union[str, Image.Image]) -> Image.Image:
+        """把输入统一为缩放后的 RGB 图像"""
+        if isinstance(image, str):
+            if not os.path.exists(image):
+                raise FileNotFoundError(f"图像文件不存在: {image}")
+            pil_image = Image.open(image).convert('RGB')
+        elif isinstance(image, Image.Image):
+            pil_image = image.convert('RGB')
+        else:
+            raise ValueError("输入必须是图像路径字符串或PIL Image对象")
+
+        # 调整图像大小（如果配置中有设置）
+        if 'max_size' in self.config['image']:
+            max_size = tuple(self.config['image']['max_size'])
+            pil_image.thumbnail(max_size, Image.Resampling.LANCZOS)
+        return pil_image
+
+    def _forward(self, pil_images: List[Image.Image]) -> np.ndarray:
+        """一次前向计算一批图像，返回归一化后的特征矩阵 (N, D)"""
+        # 使用CLIP处理器预处理图像
+        inputs = self.processor(images=pil_images, return_tensors="pt")
+
+        if self.backend == 'openvino':
+            # OpenVINO模型需要转换为OpenVINO格式
+            inputs = {k: v.cpu().numpy() for k, v in inputs.items()}
+            image_features = self.model(inputs)[-1]
+            image_features = image_features / np.linalg.norm(image_features, axis=-1, keepdims=True)  # 归一化特征
+            return np.asarray(image_features, dtype=np.float32).reshape(len(pil_images), -1)
+
+        # 提取特征
+        device = next(self.model.parameters()).device
+        inputs = {k: v.to(device) for k, v in inputs.items()}
+        with torch.no_grad():
+            image_features = self.model.get_image_features(**inputs)
+            # 归一化特征
+            image_features = image_features / image_features.norm(dim=-1, keepdim=True)
+        return image_features.cpu().numpy()
+
+    def extract_features(self, images: List[Union[str, Image.Image]]) -> np.ndarray:
+        """批量提取图像特征，一次前向计算整批图像，返回 (N, D) 的特征矩阵"""
+        try:
+            pil_images = [self._prepare_image(image) for image in images]
+            if len(pil_images) > 1 and not self._batch_supported:
+                return np.stack([self._forward([pil_image])[0] for pil_image in pil_images])
+            try:
+                features = self._forward(pil_images)
+            except Exception as e:
+                if len(pil_images) == 1 or self.backend != 'openvino':
+                    raise
+                # 导出时固定了 batch=1 的 OpenVINO 模型不支持批量输入，退回逐张计算
+                self.logger.warning(f"OpenVINO模型不支持批量推理，改为逐张计算: {e}")
+                self._batch_supported = False
+                features = np.stack([self._forward([pil_image])[0] for pil_image in pil_images])
+
+            self.logger.debug(f"成功提取特征，数量: {len(pil_images)}，维度: {features.shape[-1]}")
+            return features
+
+        except Exception as e:
+            self.logger.error(f"特征提取失败: {e}")
+            raise
+
+    def extract_feature(self, image: Union[str, Image.Image]) -> np.ndarray:
+        """提取图像特征"""
+        return self.extract_features([image])[0]
+
+    def _zero_shot_settings(self) -> Dict:
+        settings = {
+            'templates': ["a photo of {}."],
+            'templates_zh': ["{}", "一张{}的照片。"],
+            'logit_scale': 100.0,
+            'cache_size': 32,
+        }
+        settings.update(self.config.get('zero_shot') or {})
+        return settings
+
+    def init_text_model(self):
+        """文字编码器。导出的 OpenVINO 模型只有图像部分，文字特征用同名的 huggingface 模型在 CPU 上计算（每个剧本只算一次）。
+        载入需要几秒，应在服务预热时调用；没有预热时第一次零样本识别时载入，多个请求同时到达也只载入一次"""
+        if self.backend == 'huggingface':
+            return self.model
+        with self._text_model_lock:
+            if self._text_model is None:
+                model_name = self.config['model']['name']
+                force_download = self.config['model'].get('force_download', False)
+                text_model = CLIPModel.from_pretrained(model_name, force_download=force_download)
+                text_model.eval()
+                self._text_model = text_model
+                self.logger.info(f"文字编码器载入完成: {model_name}")
+        return self._text_model
+
+    def extract_text_features(self, texts: Sequence[str]) -> np.ndarray:
+        """批量提取文字特征，返回归一化后的特征矩阵 (N, D)，与图像特征在同一空间"""
+        try:
+            model = self.init_text_model()
+            inputs = self.processor(text=list(texts), return_tensors="pt", padding=True, truncation=True)
+            device = next(model.parameters()).device
+            inputs = {k: v.to(device) for k, v in inputs.items()}
+            with torch.no_grad():
+                text_features = model.get_text_features(**inputs)
+                text_features = text_features / text_features.norm(dim=-1, keepdim=True)
+            return text_features.cpu().numpy().astype(np.float32)
+        except Exception as e:
+            self.logger.error(f"文字特征提取失败: {e}")
+            raise
+
+    @staticmethod
+    def item_prompts(name: str, aliases: Sequence[str], settings: Dict) -> List[str]:
+        """物品的提示：有英文别名（clip_text）时只用别名，否则用物品名；含中文的文字用中文模板，其余用英文模板。
+        CLIP 文字编码器对中文理解有限，中文提示和英文别名取平均会把特征拉偏"""
+        prompts = []
+        for text in (aliases or (name,)):
+            has_chinese = any('\u4e00' <= ch <= '\u9fff' for ch in text)
+            templates = settings['templates_zh'] if has_chinese else settings['templates']
+            prompts.extend(template.format(text) for template in templates)
+        return prompts
+
+    def item_text_features(self, items: Sequence[Tuple[str, Sequence[str]]]) -> Tuple[List[str], np.ndarray]:
+        """物品的文字特征矩阵，items 为 (物品名, 别名列表)；每个物品的提示（见 item_prompts）取平均后归一化。
+        按物品列表缓存，同一个剧本只计算一次"""
+        key = tuple((name, tuple(aliases)) for name, aliases in items)
+        with self._text_lock:
+            cached = self._text_features.get(key)
+            if cached is not None:
+                self._text_features.move_to_end(key)
+                return cached
+
+        settings = self._zero_shot_settings()
+        prompts, owners = [], []
+        for i, (name, aliases) in enumerate(key):
+            item_prompts = self.item_prompts(name, aliases, settings)
+            prompts.extend(item_prompts)
+            owners.extend([i] * len(item_prompts))
+        prompt_features = self.extract_text_features(prompts)
+        matrix = np.zeros((len(key), prompt_features.shape[1]), dtype=np.float32)
+        np.add.at(matrix, np.asarray(owners), prompt_features)
+        matrix /= np.linalg.norm(matrix, axis=1, keepdims=True)
+        result = ([name for name, _ in key], matrix)
+        self.logger.info(f"物品文字特征计算完成: {len(key)} 个物品，{len(prompts)} 条提示")
+
+        with self._text_lock:
+            self._text_features[key] = result
+            while len(self._text_features) > settings['cache_size']:
+                self._text_features.popitem(last=False)
+        return result
+
+    def zero_shot(self, feature: np.ndarray, items: Sequence[Tuple[str, Sequence[str]]]) -> List[Dict]:
+        """零样本识别：图像特征与各物品文字特征的相似度乘以 logit_scale 后做 softmax，按概率从高到低返回"""
+        if not items:
+            return []
+        names, text_matrix = self.item_text_features(items)
+        feature = np.asarray(feature, dtype=np.float32)
+        similarities = text_matrix @ (feature / np.linalg.norm(feature))
+        logits = self._zero_shot_settings()['logit_scale'] * similarities
+        probabilities = np.exp(logits - logits.max())
+        probabilities /= probabilities.sum()
+        return [{
+            'name': names[i],
+            'probability': float(probabilities[i]),
+            'similarity': float(similarities[i]),
+        } for i in np.argsort(-probabilities)]
+    
+    def load_database(self):
+        """从数据文件载入特征数据库。新的特征库准备好之前检索线程继续使用原来的特征库（不用索引）"""
+        self.close_database()
+        self.index = None
+
+        try:
+            if not self.data_file_path.exists() and self.legacy_file_path and self.legacy_file_path.exists():
+                count, backup_path = migrate_jsonl(self.legacy_file_path, self.data_file_path, self._storage_dtype())
+                self.logger.info(f"已将 {self.legacy_file_path.name} 转换为二进制特征文件，共 {count} 条记录，原文件改名为 {backup_path.name}")
+
+            if not self.data_file_path.exists():
+                self.logger.info("数据文件不存在，将创建新的数据库")
+                self.database = FeatureMatrix()
+                return
+
+            # 内存映射特征文件，不逐条解析
+            self.store = FeatureStore(self.data_file_path, dtype=self._storage_dtype())
+            # 标记完已删除的记录再替换，检索线程不会看到标记到一半的特征库
+            database = FeatureMatrix.wrap(self.store.features(), self.store.names)
+            deleted = read_deleted(self.data_file_path)
+            deleted = deleted[deleted < len(database)]
+            if len(deleted):
+                database.mark_deleted(deleted)
+            self.database = database
+            self.logger.info(f"数据库载入完成，共载入 {len(self.database)} 条记录（其中已删除 {len(deleted)} 条）")
+            self._init_index()
+            
+        except Exception as e:
+            self.database = FeatureMatrix()
+            self.logger.error(f"载入数据库失败: {e}")
+            raise
+    
+    def _index_settings(self) -> Dict:
+        """检索索引配置，未配置时使用精确检索"""
+        settings = {
+            'type': 'flat',
+            'backend': 'auto',
+            'nlist': 256,
+            'nprobe': 8,
+            'min_train_size': 4096,
+            'file': 'image_features.ivf',
+            'quantization': 'none',
+            'rerank': 32,
+        }
+        settings.update(self.config.get('index') or {})
+        return settings
+
+    def _init_index(self):
+        """载入持久化的 IVF 索引并补上之后新增的记录；没有索引且数据足够时训练一个。
+        flat 模式下按配置构建量化副本。
+        索引和量化副本只用于全库检索（record_image_scope: all），按剧本或关卡限定范围时走 partition，不经过索引"""
+        self.index = None
+        self._unsaved_index_records = 0
+        settings = self._index_settings()
+        if settings['type'] != 'ivf':
+            if settings['quantization'] == 'int8':
+                self._init_quantized_index(settings)
+            return
+
+        index = None
+        try:
+            index = load_ivf_index(str(self.database_path / settings['file']), settings['backend'])
+        except Exception as e:
+            self.logger.warning(f"载入IVF索引失败，将重新训练: {e}")
+        if index is not None and index.ntotal > len(self.database):
+            self.logger.warning("IVF索引的记录数多于特征库，特征库可能被替换过，将重新训练")
+            index = None
+
+        if index is not None:
+            index.nprobe = settings['nprobe']
+            index.add(self.database.matrix)
+            self.index = index
+            self.logger.info(f"IVF索引载入完成（{index.backend}），共 {index.ntotal} 条记录")
+        elif len(self.database) >= settings['min_train_size']:
+            self.rebuild_index()
+
+    def _init_quantized_index(self, settings: Dict):
+        """内存映射特征文件旁边的 int8 量化副本（.int8）并补上新增的记录，与特征文件对不上时重建"""
+        if self.store is None or len(self.store) == 0:
+            return
+        path = quantized_path_for(self.data_file_path)
+        # 单独映射一份 float32 特征，只用于补量化副本，用完即释放，float32 数据不会因此常驻内存
+        features = self.store.features()
+        try:
+            index = QuantizedIndex(settings['rerank'], store=QuantizedStore(path), features=self.store)
+        except ValueError as e:
+            self.logger.warning(f"量化文件损坏，将重建: {e}")
+            index = None
+        if index is None or not index.matches(features):
+            if index is not None:
+                index.close()
+                self.logger.info("量化副本与特征文件不一致，重建")
+            QuantizedStore(path).remove()
+            index = QuantizedIndex(settings['rerank'], store=QuantizedStore(path), features=self.store)
+        index.add(features)
+        del features
+        self.index = index
+        self.logger.info(f"int8 量化副本载入完成，共 {index.ntotal} 条记录，{index.nbytes / 2 ** 20:.1f}MB")
+
+    def rebuild_index(self):
+        """用当前特征库重新训练 IVF 索引并保存"""
+        settings = self._index_settings()
+        index = create_ivf_index(settings['backend'], settings['nlist'], settings['nprobe'])
+        index.train(self.database.matrix)
+        self.index = index
+        self.save_index()
+        self.logger.info(f"IVF索引训练完成（{index.backend}），{index.nlist} 个簇，{index.ntotal} 条记录")
+
+    def save_index(self):
+        """把 IVF 索引保存到特征库文件旁边；int8 量化副本在追加记录时已经写入 .int8 文件，不需要这里保存"""
+        if self.index is None or self._index_settings()['type'] != 'ivf':
+            return
+        base_path = str(self.database_path / self._index_settings()['file'])
+        self.index.save(ivf_index_path(base_path, self.index.backend))
+        self._unsaved_index_records = 0
+
+    def _update_index(self):
+        """record 之后增量更新索引，每 backup_interval 条保存一次"""
+        settings = self._index_settings()
+        if settings['type'] != 'ivf':
+            if self.index is not None:
+                self.index.add(self.database.matrix)
+            elif settings['quantization'] == 'int8':
+                self._init_quantized_index(settings)
+            return
+        if self.index is None:
+            if len(self.database) >= settings['min_train_size']:
+                self.rebuild_index()
+            return
+
+        self.index.add(self.database.matrix)
+        self._unsaved_index_records += 1
+        if self._unsaved_index_records >= self.config['database'].get('backup_interval', 100):
+            self.save_index()
+
+    def close_database(self):
+        """关闭特征文件"""
+        if self.store is not None:
+            self.store.close()
+            self.store = None
+        if isinstance(self.index, QuantizedIndex):
+            self.index.close()
+
+    def _remove_index_files(self):
+        """删除持久化的 IVF 索引和 int8 量化副本（记录下标变化后需要重建）"""
+        if isinstance(self.index, QuantizedIndex):
+            self.index.close()
+        index_file = str(self.database_path / self._index_settings()['file'])
+        paths = [Path(ivf_index_path(index_file, backend)) for backend in ('numpy', 'faiss')]
+        for path in paths + [quantized_path_for(self.data_file_path)]:
+            if path.exists():
+                path.unlink()
+
+    def reset_database(self):
+        """清空特征库：删除特征文件、物品名文件和 IVF 索引"""
+        self.close_database()
+        for path in (self.data_file_path, names_path_for(self.data_file_path),
+                     deleted_path_for(self.data_file_path), manifest_path_for(self.data_file_path)):
+            if path.exists():
+                path.unlink()
+        self._remove_index_files()
+        self.database = FeatureMatrix()
+        self.index = None
+        self._unsaved_index_records = 0
+
+    def _save_to_database(self, feature: np.ndarray, name: str):
+        """保存单条记录到数据库文件"""
+        try:
+            # 文件句柄保持打开，写入后才提交记录数
+            if self.store is None:
+                self.store = FeatureStore(self.data_file_path, dtype=self._storage_dtype())
+            self.store.append(feature[None], [name])
+
+            self.logger.debug(f"记录已保存: {name}")
+            
+        except Exception as e:
+            self.logger.error(f"保存记录失败: {e}")
+            raise
+    
+    def record(self, image: Union[str, Image.Image], name: str):
+        """记录一张新图片到数据库"""
+        try:
+            # 提取特征
+            feature = self.extract_feature(image)
+            
+            # 保存到文件
+            self._save_to_database(feature, name)
+
+            # 添加到内存数据库；直接使用特征文件内存映射时换成新的映射，不把整个矩阵复制到内存中
+            if self.database.mapped:
+                self.database.extend_mapped(self.store.features(), [name])
+            else:
+                self.database.append(feature, name)
+            self._update_index()
+            
+            self.logger.info(f"成功记录图片: {name}")
+            
+        except Exception as e:
+            self.logger.error(f"记录图片失败: {e}")
+            raise
+    
+    def partition(self, names: Sequence[str], database: Optional[FeatureMatrix] = None) -> np.ndarray:
+        """物品名属于 names 且未删除的记录下标（例如某个剧本的物品），按物品名集合缓存，特征库新增记录后增量补上。
+        database 为调用方拿到的特征库（默认当前特征库）；特征库被重新载入后缓存作废"""
+        database = database if database is not None else self.database
+        key = frozenset(names)
+        with self._partition_lock:
+            if self._partition_source is not database:
+                self._partitions = {}
+                self._partition_source = database
+            scanned, ids = self._partitions.get(key, (0, np.empty(0, dtype=np.int64)))
+            size = len(database)
+            if scanned < size:
+                database_names = database.names
+                new_ids = [i for i in range(scanned, size)
+                           if database_names[i] in key and not database.is_deleted(i)]
+                if new_ids:
+                    ids = np.concatenate([ids, np.asarray(new_ids, dtype=np.int64)])
+                self._partitions[key] = (size, ids)
+        return ids
+
+    def extract_item_from_feature(self, feature: np.ndarray, names: Optional[Sequence[str]] = None) -> List[Dict]:
+        """从特征中提取最相似的物品，给出 names 时只在这些物品的记录中检索"""
+        # 整个检索使用同一个特征库，load_database 在其他线程中替换特征库不影响这次检索
+        database = self.database
+        if not database:
+            self.logger.warning("数据库为空")
+            return []
+        
+        try:
+            # 一次矩阵-向量点积 + argpartition 取前 max_results 个；
+            # 建有 IVF 索引时只比较最接近的几个簇，有量化副本时先粗排再用 float32 重排
+            max_results = self.config['similarity']['max_results']
+            if names is not None:
+                # 分区通常只有几十到几百条记录，直接精确检索
+                top_indices, similarities = database.search(feature, max_results, ids=self.partition(names, database))
+            elif self.index is not None:
+                # 索引里还留着已删除的记录，多取几条再过滤
+                top_indices, similarities = self.index.search(database.matrix, feature,
+                                                              max_results + database.deleted_count)
+            else:
+                top_indices, similarities = database.search(feature, max_results)
+            
+            results = []
+            for idx, similarity in zip(top_indices, similarities):
+                if database.is_deleted(idx):
+                    continue
+                if len(results) >= max_results:
+                    break
+                similarity = float(similarity)
+                name = database.names[idx]
+                
+                results.append({
+                    'name': name,
+                    'similarity': similarity,
+                    'index': int(idx)
+                })
+            
+            return results
+            
+        except Exception as e:
+            self.logger.error(f"特征匹配失败: {e}")
+            raise
+    
+    def extract_item_from_image(self, image: Union[str, Image.Image]) -> List[Dict]:
+        """从图片中提取物品"""
+        try:
+            feature = self.extract_feature(image)
+            return self.extract_item_from_feature(feature)
+        except Exception as e:
+            self.logger.error(f"从图片提取物品失败: {e}")
+            raise
@@ -0,0 +1,181 @@
+"""
+共享的图像特征（CLIP）服务
+CLIP 模型和特征库只在服务启动时载入一次，所有会话只读共享；
+记录模型载入耗时、内存占用以及每次调用的延迟
+"""
+
+import os
+import resource
+import threading
+import time
+from collections import deque
+
+from ..config.config import config, get_embedding_config
+from .micro_batcher import MicroBatcher
+
+
+def _current_rss_bytes():
+    """当前进程的常驻内存，读不到 /proc 时退回到峰值内存"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class LatencyRecorder:
+    """保留最近若干次调用的耗时，用于计算分位数"""
+
+    def __init__(self, window: int = 1024):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self.count = 0
+        self.total_seconds = 0.0
+
+    def record(self, seconds: float):
+        with self._lock:
+            self._samples.append(seconds)
+            self.count += 1
+            self.total_seconds += seconds
+
+    def stats(self):
+        with self._lock:
+            samples = sorted(self._samples)
+            count, total = self.count, self.total_seconds
+        if not samples:
+            return {"count": 0}
+
+        def percentile(pct):
+            return samples[min(len(samples) - 1, int(len(samples) * pct / 100))] * 1000
+
+        return {
+            "count": count,
+            "mean_ms": total / count * 1000,
+            "p50_ms": percentile(50),
+            "p99_ms": percentile(99),
+        }
+
+
+class EmbeddingService:
+    """进程内唯一的 ImageMaster，载入后只读"""
+
+    def __init__(self, config_name: str = "image_master", batch_size: int = 8, batch_wait_ms: float = 5):
+        self.config_name = config_name
+        self.batch_size = batch_size
+        self.batch_wait_ms = batch_wait_ms
+        self.image_master = None
+        self.batcher = None
+        self.error = None
+        self._load_lock = threading.Lock()
+
+        self.load_seconds = None
+        self.load_rss_bytes = None
+        self.warmup_seconds = None
+        self.feature_latency = LatencyRecorder()
+        self.search_latency = LatencyRecorder()
+        self.zero_shot_latency = LatencyRecorder()
+
+    @property
+    def ready(self) -> bool:
+        return self.image_master is not None
+
+    def load(self):
+        """载入模型和特征库，重复调用只会载入一次"""
+        with self._load_lock:
+            if self.image_master is not None:
+                return self.image_master
+
+            print(f"正在载入共享的 image_master ({self.config_name})")
+            rss_before = _current_rss_bytes()
+            start = time.perf_counter()
+            try:
+                # 依赖 torch / transformers，只在真正启用时导入
+                from .ImageMaster import ImageMaster
+
+                image_master = ImageMaster()
+                image_master.set_from_config(str(config.config_dir / f"{self.config_name}.yaml"))
+                image_master.init_model()
+                image_master.load_database()
+            except Exception as e:
+                self.error = str(e)
+                raise
+
+            self.load_seconds = time.perf_counter() - start
+            self.load_rss_bytes = _current_rss_bytes() - rss_before
+            if self.batch_size > 1:
+                # 并发的单张请求合并成一次批量前向计算
+                self.batcher = MicroBatcher(image_master.extract_features, self.batch_size,
+                                            self.batch_wait_ms, name="clip-batcher")
+            self.image_master = image_master
+            self.error = None
+            print(f"image_master 载入完成，耗时 {self.load_seconds:.1f}s，"
+                  f"内存增加 {self.load_rss_bytes / 1024 / 1024:.0f}MB，特征库 {len(image_master.database)} 条")
+            return image_master
+
+    def warm_up(self):
+        """用一张空白图片跑一次推理，触发 OpenVINO 编译和 CLIPProcessor 的首次初始化；
+        同时载入零样本识别用的文字编码器，不在第一个请求的线程里载入"""
+        from PIL import Image
+
+        start = time.perf_counter()
+        self.image_master.extract_feature(Image.new("RGB", (400, 400)))
+        self.image_master.init_text_model()
+        self.warmup_seconds = time.perf_counter() - start
+        return self.warmup_seconds
+
+    def extract_feature(self, image):
+        start = time.perf_counter()
+        if self.batcher is not None:
+            feature = self.batcher(image)
+        else:
+            feature = self.image_master.extract_feature(image)
+        self.feature_latency.record(time.perf_counter() - start)
+        return feature
+
+    def extract_item_from_feature(self, feature, names=None):
+        start = time.perf_counter()
+        results = self.image_master.extract_item_from_feature(feature, names)
+        self.search_latency.record(time.perf_counter() - start)
+        return results
+
+    def zero_shot(self, feature, items):
+        # 物品文字特征按剧本缓存在 image_master 中，只有第一次调用需要计算
+        start = time.perf_counter()
+        results = self.image_master.zero_shot(feature, items)
+        self.zero_shot_latency.record(time.perf_counter() - start)
+        return results
+
+    def close(self):
+        if self.batcher is not None:
+            self.batcher.close(wait=False)
+
+    def stats(self):
+        stats = {
+            "ready": self.ready,
+            "config": self.config_name,
+            "error": self.error,
+        }
+        if self.ready:
+            stats.update({
+                "backend": self.image_master.backend,
+                "database_size": len(self.image_master.database),
+                "load_seconds": self.load_seconds,
+                "load_rss_mb": self.load_rss_bytes / 1024 / 1024,
+                "warmup_seconds": self.warmup_seconds,
+                "rss_mb": _current_rss_bytes() / 1024 / 1024,
+                "extract_feature": self.feature_latency.stats(),
+                "search": self.search_latency.stats(),
+                "zero_shot": self.zero_shot_latency.stats(),
+                "batcher": self.batcher.stats() if self.batcher is not None else None,
+            })
+        return stats
+
+
+_embedding_config = get_embedding_config()
+
+# 全局图像特征服务，IMAGE_MASTER_ENABLED 为 true 时在启动阶段载入
+embedding_service = EmbeddingService(
+    config_name="image_master_mirror" if _embedding_config['use_mirror'] else "image_master",
+    batch_size=_embedding_config['batch_size'],
+    batch_wait_ms=_embedding_config['batch_wait_ms'],
+)
@@ -0,0 +1,155 @@
+"""
+进程级共享的 HTTP / OpenAI 客户端注册表
+LLM 对话和 VLM 图像识别复用同一组 keep-alive 连接池，避免每张图片都重新建立 TLS 连接
+"""
+
+import threading
+import weakref
+from importlib.util import find_spec
+
+import httpx
+from openai import OpenAI, AsyncOpenAI
+
+from ..config.config import get_http_client_config
+
+
+class PoolStats:
+    """统计连接池命中情况
+
+    通过响应的 network_stream 扩展判断请求是否落在已经建立过的连接上：
+    见过的连接记为命中(复用)，第一次出现的连接记为新建
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._seen_streams = weakref.WeakSet()
+        self.requests = 0
+        self.new_connections = 0
+        self.reused_connections = 0
+
+    def observe(self, response: httpx.Response):
+        stream = response.extensions.get("network_stream")
+        with self._lock:
+            self.requests += 1
+            if stream is None:
+                return
+            if stream in self._seen_streams:
+                self.reused_connections += 1
+            else:
+                self._seen_streams.add(stream)
+                self.new_connections += 1
+
+    def snapshot(self):
+        with self._lock:
+            observed = self.new_connections + self.reused_connections
+            return {
+                "requests": self.requests,
+                "new_connections": self.new_connections,
+                "reused_connections": self.reused_connections,
+                "hit_rate": self.reused_connections / observed if observed else 0.0,
+            }
+
+
+_lock = threading.Lock()
+_http_client = None
+_async_http_client = None
+_openai_clients = {}
+_async_openai_clients = {}
+_sync_stats = PoolStats()
+_async_stats = PoolStats()
+
+
+def _client_kwargs():
+    http_config = get_http_client_config()
+    http2 = http_config['http2']
+    if http2 and find_spec("h2") is None:
+        print("警告: 未安装 h2，HTTP/2 已回退为 HTTP/1.1 (pip install httpx[http2])")
+        http2 = False
+
+    return {
+        "limits": httpx.Limits(
+            max_connections=http_config['max_connections'],
+            max_keepalive_connections=http_config['max_keepalive_connections'],
+            keepalive_expiry=http_config['keepalive_expiry'],
+        ),
+        "timeout": httpx.Timeout(http_config['timeout'], connect=http_config['connect_timeout']),
+        "http2": http2,
+    }
+
+
+def get_http_client() -> httpx.Client:
+    """获取共享的同步 HTTP 客户端"""
+    global _http_client
+    with _lock:
+        if _http_client is None:
+            _http_client = httpx.Client(
+                event_hooks={"response": [_sync_stats.observe]},
+                **_client_kwargs()
+            )
+        return _http_client
+
+
+def get_async_http_client() -> httpx.AsyncClient:
+    """获取共享的异步 HTTP 客户端"""
+    global _async_http_client
+
+    async def observe(response):
+        _async_stats.observe(response)
+
+    with _lock:
+        if _async_http_client is None:
+            _async_http_client = httpx.AsyncClient(
+                event_hooks={"response": [observe]},
+                **_client_kwargs()
+            )
+        return _async_http_client
+
+
+def get_openai_client(base_url: str, api_key: str) -> OpenAI:
+    """按 (base_url, api_key) 获取共享连接池的 OpenAI 客户端"""
+    key = (base_url, api_key)
+    client = _openai_clients.get(key)
+    if client is None:
+        http_client = get_http_client()
+        with _lock:
+            client = _openai_clients.get(key)
+            if client is None:
+                client = OpenAI(base_url=base_url, api_key=api_key, http_client=http_client)
+                _openai_clients[key] = client
+    return client
+
+
+def get_async_openai_client(base_url: str, api_key: str) -> AsyncOpenAI:
+    """按 (base_url, api_key) 获取共享连接池的 AsyncOpenAI 客户端"""
+    key = (base_url, api_key)
+    client = _async_openai_clients.get(key)
+    if client is None:
+        http_client = get_async_http_client()
+        with _lock:
+            client = _async_openai_clients.get(key)
+            if client is None:
+                client = AsyncOpenAI(base_url=base_url, api_key=api_key, http_client=http_client)
+                _async_openai_clients[key] = client
+    return client
+
+
+def get_pool_stats():
+    """返回同步/异步连接池的复用统计"""
+    return {
+        "sync": _sync_stats.snapshot(),
+        "async": _async_stats.snapshot(),
+    }
+
+
+async def close_http_clients():
+    """关闭共享客户端，在应用关闭时调用"""
+    global _http_client, _async_http_client
+    with _lock:
+        http_client, _http_client = _http_client, None
+        async_http_client, _async_http_client = _async_http_client, None
+        _openai_clients.clear()
+        _async_openai_clients.clear()
+    if http_client is not None:
+        http_client.close()
+    if async_http_client is not None:
+        await async_http_client.aclose()
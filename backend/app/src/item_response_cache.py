@@ -0,0 +1,110 @@
+"""
+跨会话的物品回复缓存
+剧本外物品（手机、钥匙……）的回复由 LLM 生成，同一剧本、同一阶段下对同一物品的回复可以被所有玩家复用。
+缓存按 LRU 淘汰，可选地写入 SQLite 文件，重启后仍然有效
+"""
+
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional, Tuple
+
+from ..config.config import get_item_cache_config
+
+_IGNORED_CHARS = re.compile(r"[\s\"'“”‘’「」『』《》（）()【】\[\]，,。.！!？?、：:；;~～·]+")
+
+
+def normalize_item_name(name: str) -> str:
+    """统一全角半角、大小写，并去掉空白和标点"""
+    name = unicodedata.normalize("NFKC", name).casefold()
+    return _IGNORED_CHARS.sub("", name)
+
+
+class ItemResponseCache:
+    """以 (剧本, 阶段, 规范化物品名) 为键的 LRU 缓存"""
+
+    def __init__(self, max_size: int = 1024, persist_path: Optional[str] = None):
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[Tuple[str, int, str], str]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._conn = None
+        if persist_path:
+            Path(persist_path).parent.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(persist_path, check_same_thread=False, isolation_level=None)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS item_responses ("
+                "scenario TEXT NOT NULL, step INTEGER NOT NULL, name TEXT NOT NULL, "
+                "response TEXT NOT NULL, created_at REAL NOT NULL, "
+                "PRIMARY KEY (scenario, step, name))"
+            )
+            self._load()
+
+    def _load(self):
+        rows = self._conn.execute(
+            "SELECT scenario, step, name, response FROM item_responses "
+            "ORDER BY created_at DESC LIMIT ?", (self.max_size,)
+        ).fetchall()
+        for scenario, step, name, response in reversed(rows):
+            self._entries[(scenario, step, name)] = response
+
+    def get(self, scenario_key: str, step_index: int, item_name: str) -> Optional[str]:
+        key = (scenario_key, step_index, normalize_item_name(item_name))
+        with self._lock:
+            response = self._entries.get(key)
+            if response is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return response
+
+    def put(self, scenario_key: str, step_index: int, item_name: str, response: str):
+        key = (scenario_key, step_index, normalize_item_name(item_name))
+        evicted = []
+        with self._lock:
+            self._entries[key] = response
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                evicted.append(self._entries.popitem(last=False)[0])
+                self.evictions += 1
+
+            if self._conn is not None:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO item_responses VALUES (?, ?, ?, ?, ?)",
+                    (*key, response, time.time())
+                )
+                self._conn.executemany(
+                    "DELETE FROM item_responses WHERE scenario = ? AND step = ? AND name = ?",
+                    evicted
+                )
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "persistent": self._conn is not None,
+            }
+
+
+_cache_config = get_item_cache_config()
+
+# 全局物品回复缓存，ITEM_CACHE_PATH 为空时只保存在内存中
+item_response_cache = ItemResponseCache(
+    max_size=_cache_config['max_size'],
+    persist_path=_cache_config['persist_path'] or None,
+)
@@ -1,6 +1,6 @@
 import os
-from openai import OpenAI
 from ..config.config import get_llm_config
+from .http_client import get_openai_client, get_async_openai_client
 
 class LLM:
     def __init__(self):
@@ -14,27 +14,50 @@ class LLM:
         if not self.api_key:
             raise ValueError("请在.env文件中设置LLM_API_KEY环境变量")
         
-        self.client = OpenAI(
-            base_url=self.base_url,
-            api_key=self.api_key
-        )
+        # 与 VLM 识别共享进程级连接池
+        self.client = get_openai_client(self.base_url, self.api_key)
 
-    def get_response(self, messages, max_tokens=-1, model_name=None):
+        # 异步客户端，供 FastAPI 路由使用，避免阻塞事件循环
+        self.async_client = get_async_openai_client(self.base_url, self.api_key)
+
+    def _build_params(self, messages, max_tokens=-1, model_name=None, stream=False):
         params = {
             "model": model_name or self.model_name,
             "messages": messages,
-            "stream": False
+            "stream": stream
         }
 
         if max_tokens > 0:
             params["max_tokens"] = max_tokens
 
+        return params
+
+    def get_response(self, messages, max_tokens=-1, model_name=None):
+        params = self._build_params(messages, max_tokens, model_name)
         response = self.client.chat.completions.create(**params)
         return response.choices[0].message.content
+
+    async def aget_response(self, messages, max_tokens=-1, model_name=None):
+        params = self._build_params(messages, max_tokens, model_name)
+        response = await self.async_client.chat.completions.create(**params)
+        return response.choices[0].message.content
+
+    async def astream_response(self, messages, max_tokens=-1, model_name=None):
+        """逐段产出模型生成的文本"""
+        params = self._build_params(messages, max_tokens, model_name, stream=True)
+        stream = await self.async_client.chat.completions.create(**params)
+        async for chunk in stream:
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if delta:
+                yield delta
     
 llm_instance = LLM()
 
 get_llm_response = llm_instance.get_response
+aget_llm_response = llm_instance.aget_response
+astream_llm_response = llm_instance.astream_response
 
 if __name__ == '__main__':
     messages = [
@@ -0,0 +1,144 @@
+"""
+微批处理
+并发到达的单条请求先排队，最多等待 max_wait_ms 或凑满 max_batch_size 条后，
+由后台线程一次性交给批量函数处理，再把结果分发回各自的调用方
+"""
+
+import asyncio
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, List
+
+_STOP = object()
+
+
+class BatcherClosed(RuntimeError):
+    pass
+
+
+class MicroBatcher:
+    """把单条调用合并成批量调用，batch_fn 接收列表并返回等长的结果序列"""
+
+    def __init__(self, batch_fn: Callable[[List[Any]], List[Any]], max_batch_size: int = 8,
+                 max_wait_ms: float = 5, name: str = "micro-batcher"):
+        self.batch_fn = batch_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._closed = False
+
+        self.batches = 0
+        self.items = 0
+        self.fallbacks = 0
+        self.batch_sizes = {}  # 批大小 -> 次数
+
+        self._thread = threading.Thread(target=self._loop, name=name, daemon=True)
+        self._thread.start()
+
+    def submit(self, item) -> Future:
+        future = Future()
+        with self._lock:
+            # 与 close 互斥：关闭之后提交的请求不会排在 _STOP 后面永远得不到结果
+            if self._closed:
+                raise BatcherClosed("MicroBatcher 已关闭")
+            self._queue.put((item, future))
+        return future
+
+    def __call__(self, item):
+        """在线程中同步调用"""
+        return self.submit(item).result()
+
+    async def acall(self, item):
+        """在事件循环中调用，等待期间不阻塞事件循环"""
+        return await asyncio.wrap_future(self.submit(item))
+
+    def _collect(self, first):
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                entry = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if entry is _STOP:
+                # 处理完当前批次后再退出
+                self._queue.put(_STOP)
+                break
+            batch.append(entry)
+        return batch
+
+    def _run_batch(self, batch):
+        # 已被调用方取消的请求不再计算
+        batch = [(item, future) for item, future in batch if future.set_running_or_notify_cancel()]
+        if not batch:
+            return
+        with self._lock:
+            self.batches += 1
+            self.items += len(batch)
+            self.batch_sizes[len(batch)] = self.batch_sizes.get(len(batch), 0) + 1
+
+        try:
+            results = self.batch_fn([item for item, _ in batch])
+        except Exception as e:
+            if len(batch) == 1:
+                batch[0][1].set_exception(e)
+                return
+            # 批量失败时逐条重试，一张坏图片不会连累同批的其他请求
+            with self._lock:
+                self.fallbacks += 1
+            for item, future in batch:
+                try:
+                    future.set_result(self.batch_fn([item])[0])
+                except Exception as item_error:
+                    future.set_exception(item_error)
+            return
+
+        for (_, future), result in zip(batch, results):
+            future.set_result(result)
+
+    def _loop(self):
+        while True:
+            first = self._queue.get()
+            if first is _STOP:
+                self._fail_pending()
+                return
+            self._run_batch(self._collect(first))
+
+    def _fail_pending(self):
+        """退出前让仍在队列中的请求以异常结束，调用方不会一直等待"""
+        while True:
+            try:
+                entry = self._queue.get_nowait()
+            except queue.Empty:
+                return
+            if entry is not _STOP and entry[1].set_running_or_notify_cancel():
+                entry[1].set_exception(BatcherClosed("MicroBatcher 已关闭"))
+
+    def close(self, wait: bool = True):
+        """停止接收新请求；已经排队的请求处理完后后台线程退出"""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._queue.put(_STOP)
+        if wait:
+            self._thread.join()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "max_batch_size": self.max_batch_size,
+                "max_wait_ms": self.max_wait * 1000,
+                "queued": self._queue.qsize(),
+                "batches": self.batches,
+                "items": self.items,
+                "mean_batch_size": self.items / self.batches if self.batches else 0.0,
+                "batch_sizes": dict(sorted(self.batch_sizes.items())),
+                "fallbacks": self.fallbacks,
+            }
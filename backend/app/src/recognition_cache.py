@@ -0,0 +1,178 @@
+"""
+图片识别结果缓存
+很多队伍会拍同一件道具，照片几乎一样。这里用 dHash 感知哈希给 400 高的识别图做指纹，
+在同一剧本、同一组候选物品下，汉明距离足够近的照片直接复用之前的识别结果（包括“不知所云”的结果），
+不再调用 VLM。纯色、过曝等几乎没有纹理的照片 dHash 都接近 0，彼此无法区分，不参与缓存；
+缓存键中还带有粗略的颜色签名，明暗结构相同但颜色不同的照片不会互相命中。近邻查找用多索引哈希：把 64 位指纹切成 max_distance + 1 段，
+距离不超过 max_distance 的两个指纹至少有一段完全相同，只需比较这些段命中的条目
+"""
+
+import itertools
+import threading
+import time
+from collections import OrderedDict
+from typing import Hashable, Optional, Tuple
+
+from PIL import Image
+
+from ..config.config import get_recognition_cache_config
+
+HASH_BITS = 64
+
+
+def _difference_hash(image, hash_size: int = 8):
+    """缩成 (hash_size+1) x hash_size 的灰度图，比较相邻像素的明暗；返回 (哈希, 相邻像素的平均亮度差)"""
+    gray = image.convert("L").resize((hash_size + 1, hash_size), Image.BILINEAR)
+    pixels = gray.tobytes()
+    value = 0
+    total_difference = 0
+    for row in range(hash_size):
+        offset = row * (hash_size + 1)
+        for col in range(hash_size):
+            left, right = pixels[offset + col], pixels[offset + col + 1]
+            value = (value << 1) | (left > right)
+            total_difference += abs(left - right)
+    return value, total_difference / (hash_size * hash_size)
+
+
+def dhash(image, hash_size: int = 8) -> int:
+    """差值哈希"""
+    if isinstance(image, str):
+        image = Image.open(image)
+    return _difference_hash(image, hash_size)[0]
+
+
+def image_fingerprint(image, min_texture: float = 2.0, hash_size: int = 8) -> Optional[Tuple[int, bytes]]:
+    """照片指纹 (dHash, 颜色签名)，纹理太少（相邻像素的平均亮度差低于 min_texture）时返回 None，表示不缓存
+
+    颜色签名是 2x2 网格的平均颜色，每个通道量化为 4 档
+    """
+    if isinstance(image, str):
+        image = Image.open(image)
+    value, texture = _difference_hash(image, hash_size)
+    if texture < min_texture:
+        return None
+    colors = image.convert("RGB").resize((2, 2), Image.BOX).tobytes()
+    return value, bytes(channel >> 6 for channel in colors)
+
+
+def hamming_distance(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+class RecognitionCache:
+    """按 (上下文, 感知哈希) 缓存识别结果，带 TTL 和条数上限（LRU 淘汰）"""
+
+    def __init__(self, max_size: int = 4096, ttl_seconds: float = 3600,
+                 unknown_ttl_seconds: float = 600, max_distance: int = 4, min_texture: float = 2.0):
+        self.max_size = max_size
+        self.min_texture = min_texture  # 纹理低于该值的照片不缓存，见 image_fingerprint
+        self.ttl_seconds = ttl_seconds
+        self.unknown_ttl_seconds = unknown_ttl_seconds
+        self.max_distance = max_distance
+
+        # 每段的 (起始位, 位数)
+        band_count = max_distance + 1
+        band_bits = [HASH_BITS // band_count + (1 if i < HASH_BITS % band_count else 0)
+                     for i in range(band_count)]
+        self._bands = []
+        shift = HASH_BITS
+        for bits in band_bits:
+            shift -= bits
+            self._bands.append((shift, (1 << bits) - 1))
+
+        self._lock = threading.Lock()
+        self._ids = itertools.count()
+        # entry_id -> (context, image_hash, result, is_unknown, expires_at)，按最近使用排序
+        self._entries: "OrderedDict[int, tuple]" = OrderedDict()
+        # (context, 段序号, 段取值) -> entry_id 集合
+        self._buckets = {}
+
+        self.hits = 0
+        self.unknown_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expired = 0
+
+    def _band_keys(self, context, image_hash):
+        for index, (shift, mask) in enumerate(self._bands):
+            yield (context, index, (image_hash >> shift) & mask)
+
+    def _remove(self, entry_id):
+        context, image_hash = self._entries.pop(entry_id)[:2]
+        for key in self._band_keys(context, image_hash):
+            bucket = self._buckets[key]
+            bucket.discard(entry_id)
+            if not bucket:
+                del self._buckets[key]
+
+    def get(self, context: Hashable, image_hash: int) -> Optional[str]:
+        """查找距离最近且未过期的条目，返回识别结果，未命中时返回 None"""
+        now = time.monotonic()
+        with self._lock:
+            candidates = set()
+            for key in self._band_keys(context, image_hash):
+                candidates.update(self._buckets.get(key, ()))
+
+            best_id, best_distance = None, self.max_distance + 1
+            for entry_id in candidates:
+                entry = self._entries[entry_id]
+                if entry[4] <= now:
+                    self._remove(entry_id)
+                    self.expired += 1
+                    continue
+                distance = hamming_distance(entry[1], image_hash)
+                if distance < best_distance:
+                    best_id, best_distance = entry_id, distance
+
+            if best_id is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(best_id)
+            entry = self._entries[best_id]
+            self.hits += 1
+            if entry[3]:
+                self.unknown_hits += 1
+            return entry[2]
+
+    def put(self, context: Hashable, image_hash: int, result: str, is_unknown: bool = False):
+        ttl = self.unknown_ttl_seconds if is_unknown else self.ttl_seconds
+        entry_id = next(self._ids)
+        with self._lock:
+            # 同一指纹只保留最新的一条（并发合并的请求会各自写入一次）
+            first_band = next(self._band_keys(context, image_hash))
+            for old_id in list(self._buckets.get(first_band, ())):
+                if self._entries[old_id][1] == image_hash:
+                    self._remove(old_id)
+            self._entries[entry_id] = (context, image_hash, result, is_unknown, time.monotonic() + ttl)
+            for key in self._band_keys(context, image_hash):
+                self._buckets.setdefault(key, set()).add(entry_id)
+            while len(self._entries) > self.max_size:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "unknown_hits": self.unknown_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expired": self.expired,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+_cache_config = get_recognition_cache_config()
+
+# 全局识别结果缓存
+recognition_cache = RecognitionCache(
+    max_size=_cache_config['max_size'],
+    ttl_seconds=_cache_config['ttl_seconds'],
+    unknown_ttl_seconds=_cache_config['unknown_ttl_seconds'],
+    max_distance=_cache_config['max_distance'],
+    min_texture=_cache_config['min_texture'],
+)
@@ -1,11 +1,81 @@
 import os
 import base64
-from openai import OpenAI
+import threading
+from concurrent.futures import Future
 from io import BytesIO
 from ..config.config import get_llm_config
+from .http_client import get_openai_client
+from .recognition_cache import recognition_cache, image_fingerprint
 
 
-def get_vlm_response_cot(resized_img, candidates, max_tokens=-1):
+class SingleFlight:
+    """相同 key 的并发调用只执行一次，其余调用等待并共享同一个结果（或异常）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.executed = 0
+        self.coalesced = 0
+
+    def do(self, key, fn, *args, **kwargs):
+        with self._lock:
+            future = self._calls.get(key)
+            if future is not None:
+                self.coalesced += 1
+                leader = False
+            else:
+                future = Future()
+                # 置为运行中，等待方不能取消这个共享的 future
+                future.set_running_or_notify_cancel()
+                self._calls[key] = future
+                self.executed += 1
+                leader = True
+
+        if not leader:
+            # 等待方超时或被中断只影响自己，执行方继续运行
+            return future.result()
+
+        try:
+            result = fn(*args, **kwargs)
+        except BaseException as e:
+            # 执行方失败或被中断时，等待方收到同样的异常，不会一直挂起
+            with self._lock:
+                del self._calls[key]
+            future.set_exception(e)
+            raise
+        with self._lock:
+            del self._calls[key]
+        future.set_result(result)
+        return result
+
+    def stats(self):
+        with self._lock:
+            return {
+                "inflight": len(self._calls),
+                "executed": self.executed,
+                "coalesced": self.coalesced,
+            }
+
+
+# 全局 VLM 识别调用合并
+vlm_singleflight = SingleFlight()
+
+
+def get_vlm_response_cot(resized_img, candidates, max_tokens=-1, fingerprint=None):
+    """识别图片中的主要物体；同一时刻几乎相同的照片（指纹相同）、相同候选列表只调用一次 VLM
+
+    fingerprint 为调用方已经算好的 image_fingerprint，缺省时在这里计算；
+    几乎没有纹理的照片没有指纹，各自调用 VLM
+    """
+    if fingerprint is None:
+        fingerprint = image_fingerprint(resized_img, min_texture=recognition_cache.min_texture)
+    if fingerprint is None:
+        return _get_vlm_response_cot(resized_img, candidates, max_tokens)
+    key = (fingerprint, tuple(candidates))
+    return vlm_singleflight.do(key, _get_vlm_response_cot, resized_img, candidates, max_tokens)
+
+
+def _get_vlm_response_cot(resized_img, candidates, max_tokens=-1):
     
     buffered = BytesIO()
     resized_img.save(buffered, format="JPEG")
@@ -29,7 +99,7 @@ Let's think step by step and output in json format, 包括以下字段:
     if not api_key:
         raise ValueError("请在.env文件中设置LLM_API_KEY环境变量")
     
-    client = OpenAI(base_url=base_url, api_key=api_key)
+    client = get_openai_client(base_url, api_key)
 
     response = client.chat.completions.create(
         model=model_name,
@@ -69,7 +139,7 @@ def get_vlm_response(img_path, candidates, max_tokens=2048):
     if not api_key:
         raise ValueError("请在.env文件中设置LLM_API_KEY环境变量")
     
-    client = OpenAI(base_url=base_url, api_key=api_key)
+    client = get_openai_client(base_url, api_key)
     response = client.chat.completions.create(
         model=model_name,
         messages=[
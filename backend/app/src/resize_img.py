@@ -1,4 +1,4 @@
-from PIL import Image
+from PIL import Image, ImageOps
 import base64
 from io import BytesIO
 
@@ -31,3 +31,66 @@ def get_img_html(resized_img):
     # 用 HTML 或 Markdown 插入图片（固定高度）
     img_html = f'<img src="data:image/png;base64,{img_base64}" style="max-height:{max_height}px; width:auto;">'
     return img_html
+
+
+def open_image_downscaled(img_input, max_height=400):
+    """
+    打开图片，JPEG 在解码阶段（DCT 域）直接按 1/2、1/4、1/8 缩小
+    Args:
+        img_input: 文件路径、文件对象或字节流
+        max_height: 之后需要的最大高度，解码结果的高度不会低于它
+    Returns:
+        PIL Image对象（尚未缩放到 max_height）
+    """
+    img = Image.open(img_input)
+    if img.format != "JPEG":
+        return img
+
+    w, h = img.size
+    # EXIF 方向为 5~8 时图片会旋转 90 度，显示高度对应存储的宽度
+    rotated = img.getexif().get(0x0112) in (5, 6, 7, 8)
+    display_w, display_h = (h, w) if rotated else (w, h)
+    if display_h <= max_height:
+        return img
+
+    requested = (max(1, int(display_w * max_height / display_h)), max_height)
+    img.draft("RGB", requested[::-1] if rotated else requested)
+    return img
+
+
+class ImagePyramid:
+    """
+    一次解码、多级尺寸的图片
+    解码时按 EXIF 方向摆正，然后从大到小逐级缩小（每一级都由上一级缩小得到），
+    level() 直接返回缓存的图片对象，不做拷贝，调用方不应原地修改它
+    """
+
+    def __init__(self, img_input, heights=(400, 200)):
+        """
+        Args:
+            img_input: 文件路径、文件对象、字节流或PIL Image对象
+            heights: 需要的各级最大高度
+        """
+        self.heights = tuple(sorted(set(heights), reverse=True))
+        if isinstance(img_input, Image.Image):
+            img = img_input
+        else:
+            img = open_image_downscaled(img_input, max_height=self.heights[0])
+        self.source_size = img.size
+
+        # 只有带旋转/翻转标记时才生成新图片
+        if img.getexif().get(0x0112, 1) != 1:
+            img = ImageOps.exif_transpose(img)
+
+        self._levels = {}
+        current = img
+        for height in self.heights:
+            w, h = current.size
+            if h > height:
+                size = (max(1, int(w * (height / h))), height)
+                current = current.resize(size, Image.LANCZOS, reducing_gap=2.0)
+            self._levels[height] = current
+
+    def level(self, max_height):
+        """取出高度不超过 max_height 的一级"""
+        return self._levels[max_height]
@@ -0,0 +1,127 @@
+"""
+剧本注册表
+剧本 yaml 只在第一次使用（或文件被修改）时解析，编译成只读的 Scenario 对象供所有会话共享，
+每个会话只保存指向 Scenario 的引用和自己的游戏进度
+"""
+
+import os
+import threading
+from collections import OrderedDict
+from types import MappingProxyType
+from typing import Optional
+
+import yaml
+
+
+def _freeze(value):
+    """递归地把 yaml 数据转换为只读结构"""
+    if isinstance(value, dict):
+        return MappingProxyType({k: _freeze(v) for k, v in value.items()})
+    if isinstance(value, list):
+        return tuple(_freeze(v) for v in value)
+    return value
+
+
+def _as_tuple(value):
+    """yaml 中可以写单个字符串或列表"""
+    if value is None:
+        return ()
+    if isinstance(value, str):
+        return (value,)
+    return tuple(value)
+
+
+class Scenario:
+    """编译后的只读剧本"""
+
+    def __init__(self, path: str, mtime: float, data: dict):
+        self.path = path
+        self.mtime = mtime
+        self.name = os.path.splitext(os.path.basename(path))[0]
+        # 剧本内容的标识，文件修改后随之变化，用于跨会话缓存的键
+        self.cache_key = f"{path}@{mtime}"
+
+        self.prompt_steps = _freeze(data['prompt_steps'])
+        self.items = tuple(
+            MappingProxyType({
+                'name': item['name'],
+                'text': item['text'],
+                'img_path': item['img_path'],
+                'clip_text': _as_tuple(item.get('clip_text'))
+            })
+            for item in data['items']
+        )
+        self.item_by_name = MappingProxyType({item['name']: item for item in self.items})
+        self.item_names = tuple(item['name'] for item in self.items)
+        self.item2text = MappingProxyType({item['name']: item['text'] for item in self.items})
+
+        self.record_image_threshold = data.get('record_image_threshold', 0.89)
+        self.use_record_images = data.get('use_record_images', False)
+        # 快速识别的检索范围: scenario 本剧本的物品 / step 当前关卡条件中的物品 / all 整个特征库
+        self.record_image_scope = data.get('record_image_scope', 'scenario')
+        # 零样本识别：照片与物品英文别名 clip_text（没有时用物品名）的文字特征比较，概率差足够大时不调用 VLM
+        self.use_zero_shot = data.get('use_zero_shot', False)
+        self.zero_shot_margin = data.get('zero_shot_margin', 0.3)
+        self.zero_shot_min_similarity = data.get('zero_shot_min_similarity', 0.2)
+        self.zero_shot_items = tuple((item['name'], item['clip_text']) for item in self.items)
+        self.step_item_names = tuple(
+            tuple(dict.fromkeys(name for cond in step['conds'] for name in cond))
+            for step in self.prompt_steps
+        )
+
+    @classmethod
+    def load(cls, path: str) -> "Scenario":
+        mtime = os.stat(path).st_mtime
+        with open(path, 'r', encoding='utf-8') as f:
+            data = yaml.safe_load(f)
+        return cls(path, mtime, data)
+
+    def img_path(self, name: str) -> Optional[str]:
+        item = self.item_by_name.get(name)
+        return item['img_path'] if item is not None else None
+
+
+class ScenarioRegistry:
+    """按路径缓存 Scenario，文件修改后自动重新编译，超出容量时淘汰最久未使用的剧本"""
+
+    def __init__(self, max_size: int = 32):
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._scenarios: "OrderedDict[str, Scenario]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, path: str) -> Scenario:
+        path = os.path.realpath(path)
+        mtime = os.stat(path).st_mtime
+        with self._lock:
+            scenario = self._scenarios.get(path)
+            if scenario is not None and scenario.mtime == mtime:
+                self._scenarios.move_to_end(path)
+                self.hits += 1
+                return scenario
+
+        # 在锁外解析 yaml，避免阻塞其他剧本的读取
+        scenario = Scenario.load(path)
+        with self._lock:
+            self.misses += 1
+            self._scenarios[path] = scenario
+            self._scenarios.move_to_end(path)
+            while len(self._scenarios) > self.max_size:
+                self._scenarios.popitem(last=False)
+                self.evictions += 1
+        return scenario
+
+    def stats(self):
+        with self._lock:
+            return {
+                "cached": len(self._scenarios),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+# 全局剧本注册表
+scenario_registry = ScenarioRegistry()
@@ -0,0 +1,72 @@
+"""
+会话请求闸门
+同一会话的请求按到达顺序串行执行，不同会话之间互不影响；
+同一会话中完全相同、且前一个还没完成的请求直接复用前一个请求的结果，不再重复调用 LLM
+"""
+
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple
+
+
+class SessionGate:
+    """每个会话一把 asyncio 锁，加上按 (session_id, key) 记录的进行中任务"""
+
+    def __init__(self):
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._users: Dict[str, int] = {}  # 正在使用或等待锁的请求数，归零时释放锁对象
+        self._inflight: Dict[Tuple[str, Hashable], asyncio.Task] = {}
+        self.executed = 0
+        self.coalesced = 0
+
+    @asynccontextmanager
+    async def lock(self, session_id: str):
+        """串行执行同一会话的请求"""
+        lock = self._locks.get(session_id)
+        if lock is None:
+            lock = self._locks[session_id] = asyncio.Lock()
+        self._users[session_id] = self._users.get(session_id, 0) + 1
+        try:
+            async with lock:
+                yield
+        finally:
+            self._users[session_id] -= 1
+            if self._users[session_id] == 0:
+                del self._users[session_id]
+                del self._locks[session_id]
+
+    async def _run_locked(self, session_id, fn):
+        async with self.lock(session_id):
+            self.executed += 1
+            return await fn()
+
+    async def run(self, session_id: str, key: Hashable, fn: Callable[[], Awaitable[Any]]):
+        """在会话锁内执行 fn；相同 key 的请求尚未完成时，共享它的结果
+
+        实际工作在独立的 task 中进行，某个调用方断开连接只会取消它自己的等待，
+        不会打断其他共享同一结果的调用方
+        """
+        inflight_key = (session_id, key)
+        task = self._inflight.get(inflight_key)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            task = asyncio.ensure_future(self._run_locked(session_id, fn))
+            self._inflight[inflight_key] = task
+            task.add_done_callback(lambda t: self._on_done(inflight_key, t))
+        return await asyncio.shield(task)
+
+    def _on_done(self, inflight_key, task):
+        if self._inflight.get(inflight_key) is task:
+            del self._inflight[inflight_key]
+        # 所有调用方都已离开时，读取异常以免 asyncio 报告未处理的异常
+        if not task.cancelled():
+            task.exception()
+
+    def stats(self):
+        return {
+            "active_sessions": len(self._locks),
+            "inflight": len(self._inflight),
+            "executed": self.executed,
+            "coalesced": self.coalesced,
+        }
@@ -0,0 +1,121 @@
+"""
+会话过期回收
+用最小堆按过期时间索引会话，刷新活动时间时只压入新条目，旧条目在出堆时按惰性失效丢弃，
+因此 touch 和回收都是 O(log n)，后台任务只在最近的过期时间醒来
+"""
+
+import asyncio
+import heapq
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+
+class SessionExpiryIndex:
+    """会话过期时间索引"""
+
+    def __init__(self, timeout_seconds: float):
+        self.timeout_seconds = timeout_seconds
+        self._lock = threading.Lock()
+        self._heap = []  # [(deadline, session_id)]，可能包含已失效的旧条目
+        self._deadlines: Dict[str, float] = {}  # session_id -> 当前有效的过期时间
+
+    def touch(self, session_id: str, last_active: Optional[float] = None):
+        """记录会话活动，last_active 默认为当前时间"""
+        if last_active is None:
+            last_active = time.time()
+        deadline = last_active + self.timeout_seconds
+        with self._lock:
+            self._deadlines[session_id] = deadline
+            heapq.heappush(self._heap, (deadline, session_id))
+            # 频繁刷新会堆积失效条目，超过有效条目数两倍时重建
+            if len(self._heap) > 2 * len(self._deadlines) + 64:
+                self._heap = [(d, sid) for sid, d in self._deadlines.items()]
+                heapq.heapify(self._heap)
+
+    def discard(self, session_id: str):
+        """移除会话，堆中的条目留待惰性清理"""
+        with self._lock:
+            self._deadlines.pop(session_id, None)
+
+    def pop_expired(self, now: Optional[float] = None) -> List[str]:
+        """弹出所有已过期的会话"""
+        if now is None:
+            now = time.time()
+        expired = []
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now:
+                deadline, session_id = heapq.heappop(self._heap)
+                if self._deadlines.get(session_id) == deadline:
+                    del self._deadlines[session_id]
+                    expired.append(session_id)
+        return expired
+
+    def next_deadline(self) -> Optional[float]:
+        """最近一个有效的过期时间"""
+        with self._lock:
+            while self._heap and self._deadlines.get(self._heap[0][1]) != self._heap[0][0]:
+                heapq.heappop(self._heap)
+            return self._heap[0][0] if self._heap else None
+
+    def __contains__(self, session_id: str) -> bool:
+        return session_id in self._deadlines
+
+    def __len__(self) -> int:
+        return len(self._deadlines)
+
+
+class SessionReaper:
+    """后台回收过期会话的定时任务
+
+    on_expire(session_id) 返回 True 表示会话已被本进程删除，
+    返回 False 表示没有删除（会话被其他 worker 刷新过，或由存储自身的 TTL 删除），不计入回收数
+    """
+
+    def __init__(self, index: SessionExpiryIndex, on_expire: Callable[[str], bool],
+                 max_sleep_seconds: float = 30):
+        self.index = index
+        self.on_expire = on_expire
+        self.max_sleep_seconds = max_sleep_seconds
+        self.reaped_total = 0
+        self._task: Optional[asyncio.Task] = None
+
+    def reap_once(self, now: Optional[float] = None) -> int:
+        reaped = 0
+        for session_id in self.index.pop_expired(now):
+            try:
+                if self.on_expire(session_id):
+                    reaped += 1
+                    print(f"清理过期session: {session_id}")
+            except Exception as e:
+                print(f"清理session {session_id} 失败: {e}")
+        self.reaped_total += reaped
+        return reaped
+
+    async def _run(self):
+        while True:
+            deadline = self.index.next_deadline()
+            sleep_seconds = self.max_sleep_seconds
+            if deadline is not None:
+                sleep_seconds = min(max(deadline - time.time(), 0), self.max_sleep_seconds)
+            await asyncio.sleep(sleep_seconds)
+            self.reap_once()
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self):
+        return {
+            "live_sessions": len(self.index),
+            "reaped_total": self.reaped_total,
+        }
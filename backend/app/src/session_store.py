@@ -0,0 +1,245 @@
+"""
+会话存储
+GameMaster 的剧本数据来自 yaml，只有游戏进度会随请求变化。
+除内存存储外，其他后端只持久化 GameMaster.get_state() 导出的可变部分，
+因此多个 uvicorn worker 可以共享同一批会话，服务重启也不会丢失进行中的房间
+"""
+
+import json
+import sqlite3
+import threading
+import time
+import zlib
+from pathlib import Path
+from typing import Dict, Iterator, Optional
+
+from .GameMaster import GameMaster
+
+# 序列化格式的首字节标记
+_PLAIN = b"j"
+_ZLIB = b"z"
+# 超过该长度的会话才压缩，短会话压缩反而更大
+_COMPRESS_THRESHOLD = 512
+
+
+def serialize_state(state: Dict) -> bytes:
+    """把会话状态编码为紧凑的字节串"""
+    raw = json.dumps(state, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    if len(raw) > _COMPRESS_THRESHOLD:
+        compressed = zlib.compress(raw, 6)
+        if len(compressed) < len(raw):
+            return _ZLIB + compressed
+    return _PLAIN + raw
+
+
+def deserialize_state(data: bytes) -> Dict:
+    """解码 serialize_state 产生的字节串"""
+    flag, payload = data[:1], data[1:]
+    if flag == _ZLIB:
+        payload = zlib.decompress(payload)
+    elif flag != _PLAIN:
+        raise ValueError(f"未知的会话序列化格式: {flag!r}")
+    return json.loads(payload.decode("utf-8"))
+
+
+class SessionStore:
+    """会话存储接口"""
+
+    # 存储自身会让过期会话失效（如 Redis TTL），回收任务无需删除
+    self_expiring = False
+
+    def get(self, session_id: str) -> Optional[GameMaster]:
+        raise NotImplementedError
+
+    def put(self, session_id: str, game_master: GameMaster):
+        raise NotImplementedError
+
+    def delete(self, session_id: str) -> bool:
+        raise NotImplementedError
+
+    def ids(self) -> Iterator[str]:
+        raise NotImplementedError
+
+    def touch(self, session_id: str):
+        """记录一次会话活动，供多个 worker 共享活动时间"""
+
+    def last_active(self, session_id: str) -> Optional[float]:
+        """存储中记录的最后活动时间，不支持时返回 None"""
+        return None
+
+    def __contains__(self, session_id: str) -> bool:
+        return self.get(session_id) is not None
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self.ids())
+
+
+class MemorySessionStore(SessionStore):
+    """进程内存储，直接保存 GameMaster 对象（单 worker 默认方案）"""
+
+    def __init__(self):
+        self._sessions: Dict[str, GameMaster] = {}
+
+    def get(self, session_id):
+        return self._sessions.get(session_id)
+
+    def put(self, session_id, game_master):
+        self._sessions[session_id] = game_master
+
+    def delete(self, session_id):
+        return self._sessions.pop(session_id, None) is not None
+
+    def ids(self):
+        return iter(list(self._sessions))
+
+    def __contains__(self, session_id):
+        return session_id in self._sessions
+
+    def __len__(self):
+        return len(self._sessions)
+
+
+class SerializedSessionStore(SessionStore):
+    """以序列化状态保存会话的存储基类，子类只需实现字节读写"""
+
+    def _get_bytes(self, session_id: str) -> Optional[bytes]:
+        raise NotImplementedError
+
+    def _put_bytes(self, session_id: str, data: bytes):
+        raise NotImplementedError
+
+    def get(self, session_id):
+        data = self._get_bytes(session_id)
+        if data is None:
+            return None
+        return GameMaster.from_state(deserialize_state(data))
+
+    def put(self, session_id, game_master):
+        self._put_bytes(session_id, serialize_state(game_master.get_state()))
+
+
+class SQLiteSessionStore(SerializedSessionStore):
+    """基于 SQLite 的存储，适合单机多 worker"""
+
+    def __init__(self, path: str):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS sessions "
+            "(id TEXT PRIMARY KEY, state BLOB NOT NULL, updated_at REAL NOT NULL DEFAULT 0)"
+        )
+
+    def _get_bytes(self, session_id):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT state FROM sessions WHERE id = ?", (session_id,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def _put_bytes(self, session_id, data):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO sessions (id, state, updated_at) VALUES (?, ?, ?)",
+                (session_id, data, time.time())
+            )
+
+    def touch(self, session_id):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE sessions SET updated_at = ? WHERE id = ?", (time.time(), session_id)
+            )
+
+    def last_active(self, session_id):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT updated_at FROM sessions WHERE id = ?", (session_id,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def delete(self, session_id):
+        with self._lock:
+            cursor = self._conn.execute("DELETE FROM sessions WHERE id = ?", (session_id,))
+        return cursor.rowcount > 0
+
+    def ids(self):
+        with self._lock:
+            rows = self._conn.execute("SELECT id FROM sessions").fetchall()
+        return iter([row[0] for row in rows])
+
+    def __contains__(self, session_id):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT 1 FROM sessions WHERE id = ?", (session_id,)
+            ).fetchone()
+        return row is not None
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+
+
+class RedisSessionStore(SerializedSessionStore):
+    """基于 Redis 协议的存储，适合多机部署
+
+    client 只需提供 get / set / delete / exists / expire / scan_iter，
+    测试时可以传入本地替身；不传时使用 redis 包按 url 连接。
+    设置 ttl_seconds 后由 Redis 自行让空闲会话过期
+    """
+
+    def __init__(self, url: Optional[str] = None, client=None,
+                 key_prefix: str = "whale-land:session:", ttl_seconds: Optional[int] = None):
+        if client is None:
+            try:
+                import redis
+            except ImportError:
+                raise ImportError("使用 Redis 会话存储需要安装 redis 包: pip install redis")
+            client = redis.Redis.from_url(url)
+        self._client = client
+        self._prefix = key_prefix
+        self._ttl_seconds = ttl_seconds
+        self.self_expiring = ttl_seconds is not None
+
+    def _key(self, session_id):
+        return f"{self._prefix}{session_id}"
+
+    def _get_bytes(self, session_id):
+        return self._client.get(self._key(session_id))
+
+    def _put_bytes(self, session_id, data):
+        self._client.set(self._key(session_id), data, ex=self._ttl_seconds)
+
+    def delete(self, session_id):
+        return bool(self._client.delete(self._key(session_id)))
+
+    def touch(self, session_id):
+        if self._ttl_seconds is not None:
+            self._client.expire(self._key(session_id), self._ttl_seconds)
+
+    def ids(self):
+        prefix_len = len(self._prefix)
+        for key in self._client.scan_iter(match=f"{self._prefix}*"):
+            if isinstance(key, bytes):
+                key = key.decode("utf-8")
+            yield key[prefix_len:]
+
+    def __contains__(self, session_id):
+        return bool(self._client.exists(self._key(session_id)))
+
+
+def create_session_store(store_config: Dict, ttl_seconds: Optional[int] = None) -> SessionStore:
+    """根据 session.yaml 中的 store 配置创建会话存储"""
+    backend = store_config.get("backend", "memory")
+    if backend == "memory":
+        return MemorySessionStore()
+    if backend == "sqlite":
+        return SQLiteSessionStore(store_config.get("sqlite_path", "local_data/sessions.sqlite3"))
+    if backend == "redis":
+        return RedisSessionStore(
+            url=store_config.get("redis_url", "redis://localhost:6379/0"),
+            key_prefix=store_config.get("key_prefix", "whale-land:session:"),
+            ttl_seconds=ttl_seconds,
+        )
+    raise ValueError(f"不支持的会话存储后端: {backend}")
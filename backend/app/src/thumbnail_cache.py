@@ -0,0 +1,174 @@
+"""
+缩略图缓存
+缩略图按 (原图内容哈希, 高度, 格式) 寻址，编码结果缓存在内存（可选落盘），
+接口只返回 /api/thumb/{key} 这样的短链接，浏览器可以长期缓存
+"""
+
+import hashlib
+import os
+import re
+import threading
+from collections import OrderedDict
+from io import BytesIO
+from pathlib import Path
+from typing import Optional, Tuple
+
+from PIL import Image, features
+
+from .resize_img import resize_image, ImagePyramid
+from ..config.config import get_thumbnail_config
+
+THUMB_URL_PREFIX = "/api/thumb/"
+
+_MEDIA_TYPES = {"webp": "image/webp", "jpg": "image/jpeg"}
+_KEY_PATTERN = re.compile(r"^[0-9a-f]{32}-\d+\.(webp|jpg)$")
+
+
+def is_valid_key(key: str) -> bool:
+    return _KEY_PATTERN.match(key) is not None
+
+
+class ThumbnailCache:
+    """按字节数上限做 LRU 淘汰的缩略图缓存"""
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024, cache_dir: Optional[str] = None,
+                 image_format: str = "webp", quality: int = 80):
+        if image_format == "webp" and not features.check("webp"):
+            print("警告: 当前 Pillow 不支持 WebP，缩略图改用 JPEG")
+            image_format = "jpg"
+        self.extension = "webp" if image_format == "webp" else "jpg"
+        self.quality = quality
+        self.max_bytes = max_bytes
+        self.cache_dir = Path(cache_dir) if cache_dir else None
+        if self.cache_dir is not None:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, bytes]" = OrderedDict()
+        self._size = 0
+        # (文件路径, 高度) -> (mtime, 文件大小, key)，命中时无需再读取原图；
+        # 每个文件只保留最新的一条，对应的缓存条目被淘汰时一并删除，大小随 LRU 一起受限
+        self._file_keys = {}
+        self._key_files = {}  # key -> {(文件路径, 高度)}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _make_key(self, content_hash: str, max_height: int) -> str:
+        return f"{content_hash[:32]}-{max_height}.{self.extension}"
+
+    def _encode(self, image: Image.Image, max_height: int) -> bytes:
+        # 已经是目标尺寸（例如来自 ImagePyramid）时不再缩放
+        thumb = image if image.height <= max_height else resize_image(image, max_height=max_height)
+        if thumb.mode not in ("RGB", "RGBA") or (self.extension == "jpg" and thumb.mode != "RGB"):
+            thumb = thumb.convert("RGB")
+        buffered = BytesIO()
+        thumb.save(buffered, format="WEBP" if self.extension == "webp" else "JPEG", quality=self.quality)
+        return buffered.getvalue()
+
+    def _store(self, key: str, data: bytes):
+        with self._lock:
+            if key in self._entries:
+                return
+            self._entries[key] = data
+            self._size += len(data)
+            while self._size > self.max_bytes and len(self._entries) > 1:
+                evicted_key, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+                self.evictions += 1
+                for file_key in self._key_files.pop(evicted_key, ()):
+                    if self._file_keys.get(file_key, (None, None, None))[2] == evicted_key:
+                        del self._file_keys[file_key]
+        if self.cache_dir is not None:
+            path = self.cache_dir / key
+            if not path.exists():
+                tmp_path = path.with_suffix(".tmp")
+                tmp_path.write_bytes(data)
+                os.replace(tmp_path, path)
+
+    def _count(self, hit: bool):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def _contains(self, key: str) -> bool:
+        with self._lock:
+            if key in self._entries:
+                return True
+        return self.cache_dir is not None and (self.cache_dir / key).exists()
+
+    def thumbnail_for_image(self, image: Image.Image, content_hash: str, max_height: int = 200) -> str:
+        """为已解码的图片生成缩略图，返回访问链接"""
+        key = self._make_key(content_hash, max_height)
+        if self._contains(key):
+            self._count(hit=True)
+        else:
+            self._count(hit=False)
+            self._store(key, self._encode(image, max_height))
+        return THUMB_URL_PREFIX + key
+
+    def thumbnail_for_file(self, img_path: str, max_height: int = 200) -> str:
+        """为磁盘上的图片生成缩略图，文件未修改时直接复用之前的结果"""
+        stat = os.stat(img_path)
+        file_key = (os.path.realpath(img_path), max_height)
+        with self._lock:
+            cached = self._file_keys.get(file_key)
+        if cached is not None and cached[:2] == (stat.st_mtime, stat.st_size) and self._contains(cached[2]):
+            self._count(hit=True)
+            return THUMB_URL_PREFIX + cached[2]
+
+        with open(img_path, "rb") as f:
+            content = f.read()
+        content_hash = hashlib.sha256(content).hexdigest()
+        image = ImagePyramid(BytesIO(content), heights=(max_height,)).level(max_height)
+        url = self.thumbnail_for_image(image, content_hash, max_height)
+        key = url[len(THUMB_URL_PREFIX):]
+        with self._lock:
+            # 写入后可能已经被淘汰，此时不记录
+            if key in self._entries:
+                self._file_keys[file_key] = (stat.st_mtime, stat.st_size, key)
+                self._key_files.setdefault(key, set()).add(file_key)
+        return url
+
+    def get(self, key: str) -> Optional[Tuple[bytes, str]]:
+        """按 key 取出缩略图，返回 (内容, media_type)"""
+        if not is_valid_key(key):
+            return None
+        media_type = _MEDIA_TYPES[key.rsplit(".", 1)[1]]
+        with self._lock:
+            data = self._entries.get(key)
+            if data is not None:
+                self._entries.move_to_end(key)
+                return data, media_type
+        if self.cache_dir is not None:
+            path = self.cache_dir / key
+            if path.exists():
+                data = path.read_bytes()
+                self._store(key, data)
+                return data, media_type
+        return None
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "file_keys": len(self._file_keys),
+                "bytes": self._size,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+_thumb_config = get_thumbnail_config()
+
+# 全局缩略图缓存
+thumbnail_cache = ThumbnailCache(
+    max_bytes=_thumb_config['max_mb'] * 1024 * 1024,
+    cache_dir=_thumb_config['cache_dir'] or None,
+    image_format=_thumb_config['format'],
+    quality=_thumb_config['quality'],
+)
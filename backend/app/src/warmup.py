@@ -0,0 +1,129 @@
+"""
+启动预热
+服务启动后在后台依次完成：载入共享 CLIP 服务并跑一次空白推理、预先建立到 LLM 服务商的连接、
+预先编译默认剧本。全部完成前 /ready 返回 503，负载均衡不会把请求转给还没预热的实例；
+CLIP 或 LLM 连接预热失败时状态为 failed，/ready 一直返回 503。剧本会在第一次使用时编译，
+预编译失败只把状态标为 degraded，仍然可以接收流量
+"""
+
+import asyncio
+import os
+import time
+
+from openai import APIStatusError
+
+from ..config.config import get_llm_config, get_embedding_config, get_warmup_config
+from .embedding_service import embedding_service
+from .http_client import get_openai_client, get_async_openai_client
+from .scenario import scenario_registry
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class Warmup:
+    """记录每个预热步骤的耗时和结果，单个步骤失败不影响其他步骤"""
+
+    def __init__(self):
+        self.status = "pending"  # pending / running / done / degraded / failed
+        self.steps = {}
+        self.started_at = None
+        self.finished_at = None
+        self._task = None
+
+    @property
+    def ready(self) -> bool:
+        return self.status in ("done", "degraded")
+
+    async def _step(self, name, fn, required=True):
+        start = time.perf_counter()
+        try:
+            detail = await fn()
+            self.steps[name] = {"ok": True, "required": required,
+                                "seconds": time.perf_counter() - start, "detail": detail}
+        except Exception as e:
+            print(f"⚠️ 预热步骤 {name} 失败: {e}")
+            self.steps[name] = {"ok": False, "required": required,
+                                "seconds": time.perf_counter() - start, "error": str(e)}
+
+    async def _warm_embedding(self):
+        await asyncio.to_thread(embedding_service.load)
+        await asyncio.to_thread(embedding_service.warm_up)
+        return f"{len(embedding_service.image_master.database)} features"
+
+    async def _warm_llm_pool(self):
+        """同步（VLM 识别）和异步（对话）连接池各建立一条连接，完成 TLS 握手"""
+        llm_config = get_llm_config()
+        if not llm_config['api_key']:
+            raise ValueError("未设置 LLM_API_KEY")
+
+        async def touch_async():
+            client = get_async_openai_client(llm_config['base_url'], llm_config['api_key'])
+            try:
+                await client.models.list()
+            except APIStatusError:
+                # 服务商不支持 /models 也没关系，连接已经建立并放回连接池
+                pass
+
+        def touch_sync():
+            client = get_openai_client(llm_config['base_url'], llm_config['api_key'])
+            try:
+                client.models.list()
+            except APIStatusError:
+                pass
+
+        await asyncio.gather(touch_async(), asyncio.to_thread(touch_sync))
+        return llm_config['base_url']
+
+    async def _warm_scenarios(self):
+        scenarios = get_warmup_config()['scenarios']
+        for path in scenarios:
+            await asyncio.to_thread(scenario_registry.get, os.path.join(APP_DIR, path))
+        return scenarios
+
+    async def run(self):
+        self.status = "running"
+        self.started_at = time.time()
+        warmup_config = get_warmup_config()
+
+        steps = [self._step("scenarios", self._warm_scenarios, required=False)]
+        if warmup_config['llm']:
+            steps.append(self._step("llm_pool", self._warm_llm_pool))
+        if get_embedding_config()['enabled']:
+            steps.append(self._step("embedding", self._warm_embedding))
+        await asyncio.gather(*steps)
+
+        self.finished_at = time.time()
+        failed = [name for name, step in self.steps.items() if not step["ok"]]
+        if any(self.steps[name]["required"] for name in failed):
+            self.status = "failed"
+            print(f"❌ 预热失败: {', '.join(failed)}，/ready 将返回 503")
+        elif failed:
+            self.status = "degraded"
+            print(f"⚠️ 预热完成，部分可选步骤失败: {', '.join(failed)}")
+        else:
+            self.status = "done"
+            print(f"✅ 预热完成，耗时 {self.finished_at - self.started_at:.1f}s")
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self.run())
+        return self._task
+
+    async def stop(self):
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    def stats(self):
+        return {
+            "status": self.status,
+            "seconds": (self.finished_at or time.time()) - self.started_at if self.started_at else None,
+            "steps": self.steps,
+        }
+
+
+# 全局预热状态
+warmup = Warmup()
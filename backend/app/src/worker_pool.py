@@ -0,0 +1,85 @@
+"""
+有界线程池
+把解码、缩放、编码、识别这类阻塞工作移出事件循环，并限制排队深度：
+队列满时立即拒绝，而不是让请求无限排队拖高延迟
+"""
+
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from ..config.config import get_image_pool_config
+
+
+class WorkerPoolFull(Exception):
+    """线程池和等待队列都已占满"""
+
+    def __init__(self, retry_after: int):
+        super().__init__("服务繁忙，请稍后重试")
+        self.retry_after = retry_after
+
+
+class BoundedWorkerPool:
+    """最多同时容纳 max_workers + queue_size 个任务的线程池"""
+
+    def __init__(self, max_workers: int, queue_size: int, retry_after: int = 5,
+                 thread_name_prefix: str = "worker"):
+        self.max_workers = max_workers
+        self.queue_size = queue_size
+        self.retry_after = retry_after
+        self._executor = ThreadPoolExecutor(max_workers=max_workers,
+                                            thread_name_prefix=thread_name_prefix)
+        self._slots = threading.BoundedSemaphore(max_workers + queue_size)
+        self._lock = threading.Lock()
+        self._pending = 0
+        self.completed = 0
+        self.rejected = 0
+
+    def _release(self, future=None):
+        with self._lock:
+            self._pending -= 1
+            if future is not None:
+                self.completed += 1
+        self._slots.release()
+
+    async def run(self, fn, *args, **kwargs):
+        """在线程池中执行 fn，池满时抛出 WorkerPoolFull"""
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            raise WorkerPoolFull(self.retry_after)
+
+        with self._lock:
+            self._pending += 1
+        try:
+            future = self._executor.submit(fn, *args, **kwargs)
+        except BaseException:
+            self._release()
+            raise
+        # 名额在任务真正结束时归还，调用方被取消也不会提前释放
+        future.add_done_callback(self._release)
+        return await asyncio.wrap_future(future)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "max_workers": self.max_workers,
+                "queue_size": self.queue_size,
+                "pending": self._pending,
+                "completed": self.completed,
+                "rejected": self.rejected,
+            }
+
+    def shutdown(self, wait: bool = True):
+        self._executor.shutdown(wait=wait)
+
+
+_pool_config = get_image_pool_config()
+
+# 全局图片处理线程池
+image_worker_pool = BoundedWorkerPool(
+    max_workers=_pool_config['max_workers'],
+    queue_size=_pool_config['queue_size'],
+    retry_after=_pool_config['retry_after'],
+    thread_name_prefix="image-worker",
+)
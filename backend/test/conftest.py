@@ -0,0 +1,9 @@
+"""
+pytest 公共设置
+"""
+
+import os
+
+# 测试不访问真实上游，只需要一个占位的 key 让 LLM 客户端完成初始化。
+# 配置在第一次导入时读取环境变量，所以要在收集任何测试模块之前设置
+os.environ.setdefault("LLM_API_KEY", "test")
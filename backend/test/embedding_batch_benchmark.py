@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+CLIP 批量推理基准测试
+1. 直接调用 ImageMaster.extract_features，统计批大小 1~32 的吞吐量与单批延迟
+2. 通过 MicroBatcher 模拟并发的单张请求，统计不同 max_batch_size 下的吞吐量与单请求延迟
+
+用法（需要安装 torch / transformers，OpenVINO 后端还需要 openvino 和导出的模型）:
+    python test/embedding_batch_benchmark.py --config image_master_mirror --rounds 5
+    python test/embedding_batch_benchmark.py --batch-sizes 1,4,16 --concurrency 32
+"""
+
+import os
+import sys
+import time
+import argparse
+import statistics
+import threading
+
+# 在这里修正帮助我找到 app
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault("LLM_API_KEY", "benchmark")
+
+from PIL import Image
+
+from app.config.config import config
+from app.src.ImageMaster import ImageMaster
+from app.src.micro_batcher import MicroBatcher
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+def make_images(count):
+    return [Image.effect_noise((533, 400), 40 + i % 40).convert("RGB") for i in range(count)]
+
+
+def bench_direct(image_master, images, batch_sizes, rounds):
+    print("\n[直接批量调用 extract_features]")
+    print(f"  {'batch':>5} {'img/s':>8} {'批延迟p50':>10} {'单张摊销':>10}")
+    for batch_size in batch_sizes:
+        batch = images[:batch_size]
+        image_master.extract_features(batch)  # 预热这个形状
+        latencies = []
+        for _ in range(rounds):
+            start = time.perf_counter()
+            image_master.extract_features(batch)
+            latencies.append(time.perf_counter() - start)
+        p50 = statistics.median(latencies)
+        print(f"  {batch_size:>5} {batch_size / p50:>8.1f} {p50 * 1000:>8.1f}ms {p50 / batch_size * 1000:>8.1f}ms")
+
+
+def bench_batcher(image_master, images, batch_sizes, concurrency, requests_per_worker, wait_ms):
+    print(f"\n[MicroBatcher，{concurrency} 个并发调用方，每批最多等待 {wait_ms}ms]")
+    print(f"  {'max_bs':>6} {'img/s':>8} {'p50':>9} {'p99':>9} {'平均批大小':>10}")
+    for batch_size in batch_sizes:
+        batcher = MicroBatcher(image_master.extract_features, max_batch_size=batch_size, max_wait_ms=wait_ms)
+        latencies = []
+        lock = threading.Lock()
+
+        def worker(offset):
+            for i in range(requests_per_worker):
+                image = images[(offset + i) % len(images)]
+                start = time.perf_counter()
+                batcher(image)
+                with lock:
+                    latencies.append(time.perf_counter() - start)
+
+        threads = [threading.Thread(target=worker, args=(n,)) for n in range(concurrency)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+        stats = batcher.stats()
+        batcher.close()
+
+        print(f"  {batch_size:>6} {len(latencies) / elapsed:>8.1f} "
+              f"{percentile(latencies, 50) * 1000:>7.1f}ms {percentile(latencies, 99) * 1000:>7.1f}ms "
+              f"{stats['mean_batch_size']:>10.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--config", default="image_master", help="app/config 下的 ImageMaster 配置名")
+    parser.add_argument("--batch-sizes", default="1,2,4,8,16,32")
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--requests", type=int, default=8, help="每个并发调用方发出的请求数")
+    parser.add_argument("--wait-ms", type=float, default=5)
+    args = parser.parse_args()
+
+    batch_sizes = [int(size) for size in args.batch_sizes.split(",")]
+
+    image_master = ImageMaster()
+    image_master.set_from_config(str(config.config_dir / f"{args.config}.yaml"))
+    start = time.perf_counter()
+    image_master.init_model()
+    print(f"后端: {image_master.backend}，模型载入耗时 {time.perf_counter() - start:.1f}s")
+
+    images = make_images(max(batch_sizes))
+    bench_direct(image_master, images, batch_sizes, args.rounds)
+    bench_batcher(image_master, images, batch_sizes, args.concurrency, args.requests, args.wait_ms)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+特征检索基准测试
+对比旧的检索方式（每次查询重建 np.array、重新归一化整个库、完整 argsort）
+与 FeatureMatrix（预归一化矩阵、一次点积、argpartition）在不同库大小下的查询延迟
+
+用法:
+    python test/feature_search_benchmark.py --sizes 1000,100000,1000000
+旧方式在每次查询时要额外复制两份整库矩阵，库大小超过 --legacy-max 时跳过（1M x 512 约需 6GB 内存）
+"""
+
+import os
+import sys
+import time
+import argparse
+import statistics
+
+import numpy as np
+
+# 在这里修正帮助我找到 app
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.src.feature_index import FeatureMatrix
+
+
+def legacy_search(database, feature, max_results):
+    """与改动前 ImageMaster.extract_item_from_feature 等价的计算（cosine_similarity 会对两侧做归一化）"""
+    db_features = np.array([item['feature'] for item in database])
+    db_normalized = db_features / np.linalg.norm(db_features, axis=1, keepdims=True)
+    query = feature / np.linalg.norm(feature)
+    similarities = db_normalized @ query
+    return np.argsort(similarities)[::-1][:max_results]
+
+
+def measure(fn, rounds):
+    latencies = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        fn()
+        latencies.append(time.perf_counter() - start)
+    return statistics.median(latencies)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", default="1000,100000,1000000")
+    parser.add_argument("--dim", type=int, default=512)
+    parser.add_argument("--max-results", type=int, default=5)
+    parser.add_argument("--rounds", type=int, default=10)
+    parser.add_argument("--legacy-max", type=int, default=200000)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    print(f"维度 {args.dim}，取前 {args.max_results} 个，每项 {args.rounds} 轮取中位数")
+    print(f"  {'条数':>9} {'旧方式':>10} {'FeatureMatrix':>14} {'加速':>8}")
+    for size in (int(s) for s in args.sizes.split(",")):
+        names = [f"item_{i % 100}" for i in range(size)]
+        if size <= args.legacy_max:
+            features = rng.standard_normal((size, args.dim), dtype=np.float32)
+            query = features[size // 2] + 0.1 * rng.standard_normal(args.dim, dtype=np.float32)
+            matrix = FeatureMatrix.from_features(features, names)
+        else:
+            # 大库分块生成并逐条 append（同时覆盖按容量翻倍扩容的路径），避免同时持有两份整库矩阵
+            matrix = FeatureMatrix(dim=args.dim)
+            for start in range(0, size, 65536):
+                chunk = rng.standard_normal((min(65536, size - start), args.dim), dtype=np.float32)
+                for offset, feature in enumerate(chunk):
+                    matrix.append(feature, names[start + offset])
+            query = matrix.matrix[size // 2] + 0.01 * rng.standard_normal(args.dim, dtype=np.float32)
+        new_ms = measure(lambda: matrix.search(query, args.max_results), args.rounds) * 1000
+
+        if size <= args.legacy_max:
+            # 旧代码把每条特征存成独立的小数组
+            database = [{'name': name, 'feature': feature.copy()} for name, feature in zip(names, features)]
+            legacy_top = legacy_search(database, query, args.max_results)
+            new_top, _ = matrix.search(query, args.max_results)
+            assert list(legacy_top) == list(new_top), "两种方式的检索结果不一致"
+            legacy_ms = measure(lambda: legacy_search(database, query, args.max_results), args.rounds) * 1000
+            del database, features
+            print(f"  {size:>9} {legacy_ms:>8.2f}ms {new_ms:>12.2f}ms {legacy_ms / new_ms:>7.0f}x")
+        else:
+            print(f"  {size:>9} {'(跳过)':>10} {new_ms:>12.2f}ms {'-':>8}")
+        del matrix
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+特征库载入基准测试
+对比旧的 JSONL 特征库（逐行 json.loads + base64 解码，再构建归一化矩阵）
+与二进制特征文件（读文件头和物品名，特征矩阵内存映射）的启动载入耗时，以及单条追加的耗时
+
+用法:
+    python test/feature_store_benchmark.py --size 100000
+"""
+
+import os
+import sys
+import json
+import time
+import base64
+import shutil
+import argparse
+import tempfile
+from pathlib import Path
+
+import numpy as np
+
+# 在这里修正帮助我找到 app
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.src.feature_index import FeatureMatrix
+from app.src.feature_store import FeatureStore, convert_jsonl
+
+
+def write_jsonl(path, size, dim, rng):
+    """按改动前 ImageMaster._save_to_database 的格式生成特征库"""
+    with open(path, "w", encoding="utf-8") as f:
+        for start in range(0, size, 10000):
+            chunk = rng.standard_normal((min(10000, size - start), dim), dtype=np.float32)
+            for offset, feature in enumerate(np.round(chunk, 6)):
+                record = {"name": f"物品_{(start + offset) % 100}", "feature": base64.b64encode(feature.tobytes()).decode("utf-8")}
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+
+def load_jsonl(path):
+    """与改动前 ImageMaster.load_database 等价的载入过程"""
+    features, names = [], []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            data = json.loads(line)
+            features.append(np.frombuffer(base64.b64decode(data["feature"].encode("utf-8")), dtype=np.float32))
+            names.append(data["name"])
+    return FeatureMatrix.from_features(features, names)
+
+
+def load_store(path):
+    store = FeatureStore(path)
+    return FeatureMatrix.wrap(store.features(), store.names)
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size", type=int, default=100000)
+    parser.add_argument("--dim", type=int, default=512)
+    parser.add_argument("--appends", type=int, default=200)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    workdir = Path(tempfile.mkdtemp())
+    try:
+        jsonl_path = workdir / "image_features.jsonl"
+        write_jsonl(jsonl_path, args.size, args.dim, rng)
+        print(f"{args.size} 条 x {args.dim} 维，JSONL {jsonl_path.stat().st_size / 2 ** 20:.0f}MB")
+
+        legacy, legacy_s = timed(load_jsonl, jsonl_path)
+        print(f"  JSONL 载入:      {legacy_s * 1000:>9.1f}ms")
+
+        for dtype in ("float32", "float16"):
+            store_path = workdir / f"image_features_{dtype}.bin"
+            count, convert_s = timed(convert_jsonl, jsonl_path, store_path, dtype)
+            assert count == args.size
+            matrix, load_s = timed(load_store, store_path)
+            # 第一次检索会把内存映射的页读进来，单独计时
+            query = legacy.matrix[args.size // 2]
+            (_, first_s) = timed(matrix.search, query, 5)
+            top, _ = matrix.search(query, 5)
+            assert top[0] == args.size // 2, "转换后的检索结果与 JSONL 不一致"
+            print(f"  {dtype} 特征文件 {store_path.stat().st_size / 2 ** 20:.0f}MB: 转换 {convert_s:.1f}s，"
+                  f"载入 {load_s * 1000:.1f}ms（{legacy_s / load_s:.0f}x），首次检索 {first_s * 1000:.1f}ms")
+            del matrix
+
+        # 单条追加：旧方式每次重新打开 JSONL，新方式文件句柄常开，写入后提交记录数（含 fsync）
+        features = rng.standard_normal((args.appends, args.dim), dtype=np.float32)
+        start = time.perf_counter()
+        for feature in features:
+            with open(jsonl_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps({"name": "追加", "feature": base64.b64encode(feature.tobytes()).decode("utf-8")}, ensure_ascii=False) + "\n")
+        legacy_append_ms = (time.perf_counter() - start) / args.appends * 1000
+        for sync in (True, False):
+            store = FeatureStore(workdir / "image_features_float32.bin", sync=sync)
+            start = time.perf_counter()
+            for feature in features:
+                store.append(feature[None], ["追加"])
+            store.close()
+            append_ms = (time.perf_counter() - start) / args.appends * 1000
+            print(f"  单条追加: JSONL {legacy_append_ms:.3f}ms，特征文件（fsync={sync}） {append_ms:.3f}ms")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+图片解码基准测试
+对比全分辨率解码后再缩放（旧流程）、解码时直接缩小（draft）以及 ImagePyramid 的延迟和峰值内存
+
+用法:
+    python test/image_decode_benchmark.py --width 4032 --height 3024 --rounds 20
+生成测试图片和每种解码方式都在独立的子进程中运行，峰值内存 (ru_maxrss) 互不干扰
+"""
+
+import os
+import sys
+import time
+import argparse
+import resource
+import statistics
+import tempfile
+import subprocess
+from io import BytesIO
+
+# 在这里修正帮助我找到 app
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PIL import Image
+
+
+def make_jpeg(width, height):
+    """生成带噪声的合成照片，避免编码后体积过小"""
+    noise = Image.effect_noise((width, height), 64).convert("RGB")
+    gradient = Image.linear_gradient("L").resize((width, height)).convert("RGB")
+    buffered = BytesIO()
+    Image.blend(noise, gradient, 0.5).save(buffered, format="JPEG", quality=90)
+    return buffered.getvalue()
+
+
+def decode_full(data):
+    from app.src.resize_img import resize_image
+    image = Image.open(BytesIO(data))
+    image.load()
+    resize_image(image, max_height=400)
+    resize_image(image, max_height=200)
+    return image.size
+
+
+def decode_draft(data):
+    from app.src.resize_img import resize_image, open_image_downscaled
+    image = open_image_downscaled(BytesIO(data), max_height=400)
+    image.load()
+    resize_image(image, max_height=400)
+    resize_image(image, max_height=200)
+    return image.size
+
+
+def decode_pyramid(data):
+    from app.src.resize_img import ImagePyramid
+    pyramid = ImagePyramid(BytesIO(data), heights=(400, 200))
+    return pyramid.level(400).size
+
+
+DECODERS = {"full": decode_full, "draft": decode_draft, "pyramid": decode_pyramid}
+
+
+def run_worker(mode, image_path, rounds):
+    with open(image_path, "rb") as f:
+        data = f.read()
+    decode = DECODERS[mode]
+    baseline_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    latencies = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        decoded_size = decode(data)
+        latencies.append(time.perf_counter() - start)
+
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(f"  {mode:<8} 解码尺寸={decoded_size[0]}x{decoded_size[1]:<5} "
+          f"p50={statistics.median(latencies) * 1000:7.1f}ms "
+          f"max={max(latencies) * 1000:7.1f}ms "
+          f"峰值内存增量={(peak_rss - baseline_rss) / 1024:7.1f}MB")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--width", type=int, default=4032)
+    parser.add_argument("--height", type=int, default=3024)
+    parser.add_argument("--rounds", type=int, default=20)
+    parser.add_argument("--worker", choices=["generate", *DECODERS], help=argparse.SUPPRESS)
+    parser.add_argument("--image-path", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker == "generate":
+        with open(args.image_path, "wb") as f:
+            f.write(make_jpeg(args.width, args.height))
+        return
+    if args.worker:
+        run_worker(args.worker, args.image_path, args.rounds)
+        return
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        image_path = os.path.join(tmp_dir, "sample.jpg")
+        for mode in ("generate", *DECODERS):
+            subprocess.run([
+                sys.executable, os.path.abspath(__file__), "--worker", mode, "--image-path", image_path,
+                "--width", str(args.width), "--height", str(args.height), "--rounds", str(args.rounds)
+            ], check=True)
+            if mode == "generate":
+                size_mb = os.path.getsize(image_path) / 1024 / 1024
+                print(f"原图: {args.width}x{args.height} JPEG ({size_mb:.1f}MB), 每种方式 {args.rounds} 轮")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+异步聊天接口压测脚本
+用一个固定延迟的假 LLM 替换上游调用，并发 N 组会话请求 /api/chat 和 /api/item/submit（每组两个会话，各发一个请求），
+验证总耗时约等于一次上游调用的耗时，而不是 N 倍
+
+用法: python test/load_test_async_chat.py --sessions 20 --delay 1.0
+"""
+
+import os
+import sys
+import time
+import asyncio
+import argparse
+
+# 在这里修正帮助我找到 app
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# 压测不访问真实上游，只需要一个占位的 key 让 LLM 客户端完成初始化
+os.environ.setdefault("LLM_API_KEY", "load-test")
+
+import httpx
+from app.main import app
+from app.src import GameMaster as game_master_module
+
+
+def install_fake_llm(delay):
+    """用 asyncio.sleep 模拟一次上游补全"""
+    async def fake_aget_llm_response(messages, max_tokens=-1, model_name=None):
+        await asyncio.sleep(delay)
+        return '{"character_response": "假装这是NPC的回复"}'
+
+    game_master_module.aget_llm_response = fake_aget_llm_response
+
+
+async def run_session(client, session_id):
+    # 聊天和提交物品各用一个会话：同一会话的并发请求会同时修改 GameMaster 的状态，测出的数字不可靠
+    chat_session, item_session = f"{session_id}-chat", f"{session_id}-item"
+    for sid in (chat_session, item_session):
+        (await client.post("/api/session/create", json={"session_id": sid})).raise_for_status()
+    start = time.perf_counter()
+    chat = client.post("/api/chat", json={"session_id": chat_session, "message": "你好"})
+    item = client.post("/api/item/submit", json={"session_id": item_session, "item_name": "一把不在剧本里的钥匙"})
+    responses = await asyncio.gather(chat, item)
+    for response in responses:
+        response.raise_for_status()
+    return time.perf_counter() - start
+
+
+async def main(sessions, delay):
+    install_fake_llm(delay)
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://testserver") as client:
+        start = time.perf_counter()
+        latencies = await asyncio.gather(*[
+            run_session(client, f"load-test-{i}") for i in range(sessions)
+        ])
+        total = time.perf_counter() - start
+
+    print(f"会话数: {sessions * 2}, 单次上游延迟: {delay:.2f}s")
+    print(f"总耗时: {total:.2f}s (串行预计 {sessions * 2 * delay:.2f}s)")
+    print(f"单会话最大耗时: {max(latencies):.2f}s")
+    if total < delay * 3:
+        print("✅ 并发会话没有互相阻塞")
+    else:
+        print("❌ 总耗时明显超过一次上游调用，事件循环可能被阻塞")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sessions", type=int, default=20)
+    parser.add_argument("--delay", type=float, default=1.0)
+    args = parser.parse_args()
+    asyncio.run(main(args.sessions, args.delay))
@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+"""
+量化检索基准测试
+对比 float32 精确检索（内存映射特征文件）与 int8 量化副本（内存映射 .int8 文件）+ float32 重排的
+常驻内存、查询延迟、top-1 一致率和 recall@k（以 float32 精确检索结果为准）。
+每种方式在单独的子进程中运行，常驻内存为子进程映射数据并完成全部查询后 RSS 的增量，
+包括扫描时读入的特征文件页和重排时读入的候选所在的页。
+
+用法:
+    # 使用已记录的特征库（image_features.bin），查询为库中记录加少量噪声；.int8 文件不存在时会在旁边生成
+    python test/quantized_search_benchmark.py --store local_data/official_image/image_features.bin
+    # 没有特征库时把合成的聚簇数据写到临时目录
+    python test/quantized_search_benchmark.py --size 100000 --rerank 8,32,128
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import statistics
+import subprocess
+
+import numpy as np
+
+# 在这里修正帮助我找到 app
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.src.feature_index import FeatureMatrix, QuantizedIndex
+from app.src.feature_store import FeatureStore, QuantizedStore, quantized_path_for
+
+
+def resident_bytes():
+    """当前进程的常驻内存（/proc/self/statm 的第二列）"""
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+
+def write_synthetic_store(path, size, dim, clusters, rng):
+    """CLIP 特征在同类物品之间聚集，这里用带噪声的簇中心模拟"""
+    centers = rng.standard_normal((clusters, dim), dtype=np.float32)
+    store = FeatureStore(path, sync=False)
+    for start in range(0, size, 65536):
+        count = min(65536, size - start)
+        chunk = centers[rng.integers(0, clusters, count)] + 0.6 * rng.standard_normal((count, dim), dtype=np.float32)
+        store.append(chunk, [f"item_{start + offset}" for offset in range(count)])
+    store.close()
+
+
+def run_child(args):
+    """在子进程中映射数据并执行全部查询，输出一行 JSON"""
+    with np.load(args.cases) as cases:
+        queries, exact = cases["queries"], cases["exact"]
+    before = resident_bytes()
+
+    store = FeatureStore(args.store)
+    features = store.features()
+    if args.child == "float32":
+        matrix = FeatureMatrix.wrap(features, store.names)
+        search = lambda query: matrix.search(query, args.k)[0]
+    else:
+        index = QuantizedIndex(int(args.rerank), store=QuantizedStore(quantized_path_for(args.store)), features=store)
+        search = lambda query: index.search(features, query, args.k)[0]
+
+    top1, hits, latencies = 0, 0, []
+    for query, expected in zip(queries, exact):
+        start = time.perf_counter()
+        indices = search(query)
+        latencies.append(time.perf_counter() - start)
+        top1 += int(indices[0] == expected[0])
+        hits += len(set(indices.tolist()) & set(expected.tolist()))
+    print(json.dumps({
+        "resident": resident_bytes() - before,
+        "p50": statistics.median(latencies),
+        "top1": top1 / len(queries),
+        "recall": hits / (len(queries) * args.k),
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--store", help="已记录的特征文件 image_features.bin")
+    parser.add_argument("--size", type=int, default=100000, help="没有 --store 时合成数据的条数")
+    parser.add_argument("--dim", type=int, default=512)
+    parser.add_argument("--clusters", type=int, default=1000)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--rerank", default="8,32,128")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--noise", type=float, default=0.05, help="查询相对库中记录的噪声")
+    parser.add_argument("--child", choices=("float32", "int8"), help=argparse.SUPPRESS)
+    parser.add_argument("--cases", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args)
+        return
+
+    rng = np.random.default_rng(0)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        if args.store:
+            source = args.store
+        else:
+            args.store = os.path.join(tmp_dir, "image_features.bin")
+            write_synthetic_store(args.store, args.size, args.dim, args.clusters, rng)
+            source = "合成数据"
+
+        # 查询和 float32 精确检索的结果由父进程算好，子进程只做检索
+        store = FeatureStore(args.store)
+        matrix = FeatureMatrix.wrap(store.features(), store.names)
+        size, dim = matrix.matrix.shape
+        picks = rng.integers(0, size, args.queries)
+        queries = np.asarray(matrix.matrix[picks], dtype=np.float32)
+        queries += args.noise * rng.standard_normal(queries.shape, dtype=np.float32)
+        exact = np.stack([matrix.search(query, args.k)[0] for query in queries])
+        cases = os.path.join(tmp_dir, "cases.npz")
+        np.savez(cases, queries=queries, exact=exact)
+
+        int8_path = quantized_path_for(args.store)
+        index = QuantizedIndex(store=QuantizedStore(int8_path, sync=False))
+        if not index.matches(store.features()):
+            index.close()
+            QuantizedStore(int8_path).remove()
+            index = QuantizedIndex(store=QuantizedStore(int8_path, sync=False))
+        index.add(store.features())
+        index.close()
+        del matrix
+
+        def child(mode, rerank=0):
+            output = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "--child", mode, "--cases", cases,
+                 "--store", args.store, "--k", str(args.k), "--rerank", str(rerank)],
+                check=True, stdout=subprocess.PIPE, text=True).stdout
+            return json.loads(output.strip().splitlines()[-1])
+
+        print(f"{source}（{store.dtype}）: {size} 条 x {dim} 维，{args.queries} 次查询，recall@{args.k}")
+        print(f"  特征文件 {os.path.getsize(args.store) / 2 ** 20:.1f}MB，"
+              f".int8 文件 {os.path.getsize(int8_path) / 2 ** 20:.1f}MB")
+        print(f"  {'方式':<16} {'常驻内存':>9} {'p50':>9} {'top-1一致':>9} {'recall':>7}")
+        rows = [("float32", child("float32"))]
+        rows += [(f"int8 重排{rerank}", child("int8", int(rerank))) for rerank in args.rerank.split(",")]
+        for label, result in rows:
+            print(f"  {label:<16} {result['resident'] / 2 ** 20:>7.1f}MB {result['p50'] * 1000:>7.2f}ms "
+                  f"{result['top1']:>9.3f} {result['recall']:>7.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+会话存储基准测试
+对 memory / sqlite / redis 三种后端各写入、读取 N 个会话，统计 get/put 延迟和序列化体积
+
+用法:
+    python test/session_store_benchmark.py --sessions 10000
+    python test/session_store_benchmark.py --redis-url redis://localhost:6379/15   # 使用真实 Redis
+不传 --redis-url 时 Redis 后端使用进程内的替身，只衡量序列化与接口开销
+"""
+
+import os
+import sys
+import time
+import fnmatch
+import argparse
+import tempfile
+import statistics
+
+# 在这里修正帮助我找到 app
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# 基准测试不访问真实上游，只需要一个占位的 key 让 LLM 客户端完成初始化
+os.environ.setdefault("LLM_API_KEY", "benchmark")
+
+from app.src.GameMaster import GameMaster
+from app.src.session_store import (
+    MemorySessionStore, SQLiteSessionStore, RedisSessionStore, serialize_state
+)
+
+CONFIG_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app", "config", "police.yaml")
+
+
+class LocalRedisStandIn:
+    """只实现 RedisSessionStore 用到的命令的进程内替身"""
+
+    def __init__(self):
+        self._data = {}
+
+    def get(self, key):
+        return self._data.get(key)
+
+    def set(self, key, value, ex=None):
+        self._data[key] = value
+
+    def delete(self, key):
+        return 1 if self._data.pop(key, None) is not None else 0
+
+    def exists(self, key):
+        return 1 if key in self._data else 0
+
+    def expire(self, key, seconds):
+        return 1 if key in self._data else 0
+
+    def scan_iter(self, match="*"):
+        return [key for key in list(self._data) if fnmatch.fnmatch(key, match)]
+
+
+def build_sample_game_master():
+    """构造一个进行到一半的会话，history 长度与真实对局相近"""
+    game_master = GameMaster(CONFIG_PATH)
+    game_master.status = {"烟头", "会员卡"}
+    for i in range(10):
+        game_master.history.append({"role": "user", "content": f"用户提交了物品：线索{i}"})
+        game_master.history.append({"role": "assistant", "content": "这是一个值得调查的突破口。" * 5})
+    game_master.item2cache_text["手机"] = "一部坏了的手机，这应该是死者的。"
+    return game_master
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+def report(name, op, latencies):
+    print(f"  {name:<8} {op:<4} p50={percentile(latencies, 50) * 1e6:8.1f}us "
+          f"p99={percentile(latencies, 99) * 1e6:8.1f}us "
+          f"mean={statistics.mean(latencies) * 1e6:8.1f}us")
+
+
+def bench_store(name, store, game_master, sessions, get_samples):
+    put_latencies = []
+    for i in range(sessions):
+        start = time.perf_counter()
+        store.put(f"session-{i}", game_master)
+        put_latencies.append(time.perf_counter() - start)
+
+    get_latencies = []
+    step = max(1, sessions // get_samples)
+    for i in range(0, sessions, step):
+        start = time.perf_counter()
+        store.get(f"session-{i}")
+        get_latencies.append(time.perf_counter() - start)
+
+    report(name, "put", put_latencies)
+    report(name, "get", get_latencies)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sessions", type=int, default=10000)
+    parser.add_argument("--get-samples", type=int, default=2000, help="读取多少个会话来统计 get 延迟")
+    parser.add_argument("--redis-url", default=None)
+    args = parser.parse_args()
+
+    game_master = build_sample_game_master()
+    state_bytes = serialize_state(game_master.get_state())
+    print(f"会话数: {args.sessions}, 单会话序列化体积: {len(state_bytes)} bytes")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        if args.redis_url:
+            redis_store = RedisSessionStore(url=args.redis_url, key_prefix="whale-land-bench:")
+        else:
+            redis_store = RedisSessionStore(client=LocalRedisStandIn())
+
+        stores = [
+            ("memory", MemorySessionStore()),
+            ("sqlite", SQLiteSessionStore(os.path.join(tmp_dir, "sessions.sqlite3"))),
+            ("redis", redis_store),
+        ]
+        for name, store in stores:
+            bench_store(name, store, game_master, args.sessions, args.get_samples)
+
+        if args.redis_url:
+            for session_id in list(redis_store.ids()):
+                redis_store.delete(session_id)
+
+
+if __name__ == "__main__":
+    main()
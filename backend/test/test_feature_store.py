@@ -0,0 +1,125 @@
+"""
+二进制特征文件的测试: python -m pytest test/test_feature_store.py
+"""
+
+import base64
+import json
+import os
+import sys
+
+import numpy as np
+import pytest
+
+# 在这里修正帮助我找到 app
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.src.feature_store import HEADER_SIZE, FeatureStore, convert_jsonl, migrate_jsonl, names_path_for
+
+
+def random_features(count, dim=16, seed=0):
+    return np.random.default_rng(seed).standard_normal((count, dim)).astype(np.float32)
+
+
+def normalized(features):
+    return features / np.linalg.norm(features, axis=1, keepdims=True)
+
+
+def test_append_and_reopen(tmp_path):
+    path = tmp_path / "features.bin"
+    features = random_features(5)
+    store = FeatureStore(path)
+    store.append(features[:3], ["烟头", "手串", "钱包"])
+    store.append(features[3:], ["手机", "烟头"])
+    store.close()
+
+    reopened = FeatureStore(path)
+    assert reopened.names == ["烟头", "手串", "钱包", "手机", "烟头"]
+    assert reopened.dim == 16
+    np.testing.assert_allclose(reopened.features(), normalized(features), atol=1e-6)
+
+    # 重新打开后接着追加
+    reopened.append(features[:1], ["钢笔"])
+    reopened.close()
+    assert len(FeatureStore(path)) == 6
+
+
+def test_torn_tail_is_truncated(tmp_path):
+    path = tmp_path / "features.bin"
+    store = FeatureStore(path)
+    store.append(random_features(2), ["a", "b"])
+    store.close()
+    committed_size = os.path.getsize(path)
+    committed_names = names_path_for(path).read_bytes()
+
+    # 模拟写完特征和物品名、还没提交记录数时崩溃
+    with open(path, "ab") as f:
+        f.write(random_features(1, seed=1).tobytes())
+    with open(names_path_for(path), "ab") as f:
+        f.write("c\n".encode("utf-8"))
+
+    store = FeatureStore(path)
+    assert store.names == ["a", "b"]
+    assert os.path.getsize(path) == committed_size
+    assert names_path_for(path).read_bytes() == committed_names
+
+    # 截掉之后追加的记录接在已提交的记录后面
+    store.append(random_features(1, seed=2), ["d"])
+    store.close()
+    store = FeatureStore(path)
+    assert store.names == ["a", "b", "d"]
+    assert os.path.getsize(path) == HEADER_SIZE + 3 * store.row_bytes
+
+
+def test_float16_round_trip(tmp_path):
+    path = tmp_path / "features.bin"
+    features = random_features(4)
+    store = FeatureStore(path, dtype="float16")
+    store.append(features, ["a", "b", "c", "d"])
+    store.close()
+
+    # 已有文件的精度以文件头为准
+    reopened = FeatureStore(path, dtype="float32")
+    assert reopened.dtype == np.float16
+    assert os.path.getsize(path) == HEADER_SIZE + 4 * 16 * 2
+    np.testing.assert_allclose(reopened.features().astype(np.float32), normalized(features), atol=1e-3)
+
+
+def test_migrate_jsonl(tmp_path):
+    jsonl_path = tmp_path / "image_features.jsonl"
+    features = random_features(3)
+    with open(jsonl_path, "w", encoding="utf-8") as f:
+        for name, feature in zip(["烟头", "手串", "钱包"], features):
+            f.write(json.dumps({"name": name, "feature": base64.b64encode(feature.tobytes()).decode()},
+                               ensure_ascii=False) + "\n")
+        f.write("不是 JSON\n")
+
+    store_path = tmp_path / "image_features.bin"
+    count, backup_path = migrate_jsonl(jsonl_path, store_path)
+    assert count == 3
+    assert backup_path == tmp_path / "image_features.jsonl.migrated"
+    assert sorted(os.listdir(tmp_path)) == ["image_features.bin", "image_features.bin.names",
+                                            "image_features.jsonl.migrated"]
+
+    store = FeatureStore(store_path)
+    assert store.names == ["烟头", "手串", "钱包"]
+    np.testing.assert_allclose(store.features(), normalized(features), atol=1e-6)
+
+
+def test_convert_jsonl_without_records_leaves_no_files(tmp_path):
+    jsonl_path = tmp_path / "image_features.jsonl"
+    jsonl_path.write_text("不是 JSON\n\n", encoding="utf-8")
+
+    assert convert_jsonl(jsonl_path, tmp_path / "image_features.bin") == 0
+    assert os.listdir(tmp_path) == ["image_features.jsonl"]
+
+
+def test_convert_jsonl_failure_removes_temporary_files(tmp_path):
+    jsonl_path = tmp_path / "image_features.jsonl"
+    with open(jsonl_path, "w", encoding="utf-8") as f:
+        for dim in (16, 8):
+            f.write(json.dumps({"name": "烟头", "feature": base64.b64encode(random_features(1, dim)[0].tobytes()).decode()}) + "\n")
+
+    # 维度不一致的记录在追加时报错
+    with pytest.raises(ValueError):
+        convert_jsonl(jsonl_path, tmp_path / "image_features.bin", batch_size=1)
+    assert os.listdir(tmp_path) == ["image_features.jsonl"]
@@ -0,0 +1,66 @@
+"""
+识别结果缓存的测试: python -m pytest test/test_recognition_cache.py
+"""
+
+import os
+import sys
+
+import numpy as np
+from PIL import Image
+
+# 在这里修正帮助我找到 app
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.src.recognition_cache import RecognitionCache, image_fingerprint
+
+CONTEXT = ("police.yaml", ("烟头", "手串"))
+
+
+def textured_image(seed, tint=(1.0, 1.0, 1.0)):
+    """带明暗结构的照片，tint 调整颜色但不改变明暗结构"""
+    rng = np.random.default_rng(seed)
+    gray = np.kron(rng.integers(0, 255, (8, 9)), np.ones((50, 50)))
+    rgb = np.stack([gray * t for t in tint], axis=-1)
+    return Image.fromarray(np.clip(rgb, 0, 255).astype(np.uint8))
+
+
+def lookup(cache, image):
+    fingerprint = image_fingerprint(image, min_texture=cache.min_texture)
+    if fingerprint is None:
+        return None
+    image_hash, color_signature = fingerprint
+    return cache.get(CONTEXT + (color_signature,), image_hash)
+
+
+def remember(cache, image, result):
+    fingerprint = image_fingerprint(image, min_texture=cache.min_texture)
+    if fingerprint is not None:
+        image_hash, color_signature = fingerprint
+        cache.put(CONTEXT + (color_signature,), image_hash, result)
+
+
+def test_solid_colour_images_are_not_cached():
+    cache = RecognitionCache()
+    red = Image.new("RGB", (400, 400), (220, 30, 30))
+    green = Image.new("RGB", (400, 400), (30, 200, 30))
+    assert image_fingerprint(red) is None
+
+    remember(cache, red, "烟头")
+    assert lookup(cache, green) is None
+    assert lookup(cache, red) is None
+    assert cache.stats()["size"] == 0
+
+
+def test_same_structure_different_colour_does_not_hit():
+    cache = RecognitionCache()
+    remember(cache, textured_image(0, tint=(1.0, 0.2, 0.2)), "烟头")
+    assert lookup(cache, textured_image(0, tint=(0.2, 1.0, 0.2))) is None
+
+
+def test_near_duplicate_photo_hits():
+    cache = RecognitionCache()
+    photo = textured_image(1)
+    remember(cache, photo, "手串")
+    noisy = np.asarray(photo, dtype=np.int16) + np.random.default_rng(2).integers(-3, 4, (400, 450, 3))
+    assert lookup(cache, Image.fromarray(np.clip(noisy, 0, 255).astype(np.uint8))) == "手串"
+    assert lookup(cache, textured_image(3)) is None
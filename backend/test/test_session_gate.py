@@ -0,0 +1,113 @@
+"""
+会话请求闸门的测试: python -m pytest test/test_session_gate.py
+"""
+
+import asyncio
+import os
+import sys
+
+import pytest
+
+# 在这里修正帮助我找到 app
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.src.session_gate import SessionGate
+
+
+def run(coro):
+    return asyncio.run(asyncio.wait_for(coro, timeout=5))
+
+
+def test_identical_requests_are_coalesced():
+    async def main():
+        gate = SessionGate()
+        release = asyncio.Event()
+        calls = []
+
+        async def fn():
+            calls.append(1)
+            await release.wait()
+            return "回复"
+
+        first = asyncio.create_task(gate.run("s1", ("chat", "你好"), fn))
+        second = asyncio.create_task(gate.run("s1", ("chat", "你好"), fn))
+        await asyncio.sleep(0)
+        release.set()
+        assert await asyncio.gather(first, second) == ["回复", "回复"]
+        assert len(calls) == 1
+        assert (gate.executed, gate.coalesced) == (1, 1)
+        assert gate._locks == {} and gate._inflight == {}
+
+    run(main())
+
+
+def test_different_keys_on_one_session_run_in_order():
+    async def main():
+        gate = SessionGate()
+        release = asyncio.Event()
+        events = []
+
+        async def slow():
+            events.append("slow start")
+            await release.wait()
+            events.append("slow end")
+
+        async def fast():
+            events.append("fast")
+
+        first = asyncio.create_task(gate.run("s1", "a", slow))
+        second = asyncio.create_task(gate.run("s1", "b", fast))
+        await asyncio.sleep(0.01)
+        assert events == ["slow start"]
+        release.set()
+        await asyncio.gather(first, second)
+        assert events == ["slow start", "slow end", "fast"]
+        assert gate._locks == {} and gate._users == {}
+
+    run(main())
+
+
+def test_different_sessions_run_in_parallel():
+    async def main():
+        gate = SessionGate()
+        started = asyncio.Event()
+
+        async def waits_for_other():
+            # 两个会话串行执行时这里会一直等下去
+            await asyncio.wait_for(started.wait(), timeout=1)
+            return "s1"
+
+        async def starts():
+            started.set()
+            return "s2"
+
+        results = await asyncio.gather(gate.run("s1", "k", waits_for_other), gate.run("s2", "k", starts))
+        assert results == ["s1", "s2"]
+        assert gate._locks == {}
+
+    run(main())
+
+
+def test_cancelled_waiter_does_not_cancel_shared_task():
+    async def main():
+        gate = SessionGate()
+        release = asyncio.Event()
+        finished = []
+
+        async def fn():
+            await release.wait()
+            finished.append(1)
+            return "回复"
+
+        leaving = asyncio.create_task(gate.run("s1", "k", fn))
+        staying = asyncio.create_task(gate.run("s1", "k", fn))
+        await asyncio.sleep(0)
+        leaving.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leaving
+        release.set()
+        assert await staying == "回复"
+        assert finished == [1]
+        assert gate._locks == {} and gate._inflight == {}
+
+    run(main())
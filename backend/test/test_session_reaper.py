@@ -0,0 +1,123 @@
+"""
+会话过期回收的测试: python -m pytest test/test_session_reaper.py
+"""
+
+import os
+import sys
+import time
+
+import pytest
+
+# 在这里修正帮助我找到 app
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app.api.session_routes as session_routes
+from app.src.GameMaster import GameMaster
+from app.src.session_reaper import SessionExpiryIndex, SessionReaper
+from app.src.session_store import RedisSessionStore, SQLiteSessionStore
+
+CONFIG_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app", "config", "police.yaml")
+TIMEOUT = session_routes.SESSION_TIMEOUT_SECONDS
+
+
+class LocalRedisStandIn:
+    """只实现 RedisSessionStore 用到的命令的进程内替身"""
+
+    def __init__(self):
+        self._data = {}
+
+    def get(self, key):
+        return self._data.get(key)
+
+    def set(self, key, value, ex=None):
+        self._data[key] = value
+
+    def delete(self, key):
+        return 1 if self._data.pop(key, None) is not None else 0
+
+    def exists(self, key):
+        return int(key in self._data)
+
+    def expire(self, key, seconds):
+        return int(key in self._data)
+
+    def scan_iter(self, match=None):
+        return iter(list(self._data))
+
+
+def test_touched_session_is_not_reaped_at_old_deadline():
+    index = SessionExpiryIndex(10)
+    reaped = []
+    reaper = SessionReaper(index, lambda session_id: reaped.append(session_id) or True)
+    index.touch("s1", last_active=0)
+    index.touch("s2", last_active=0)
+    index.touch("s1", last_active=5)
+
+    assert reaper.reap_once(now=10) == 1
+    assert reaped == ["s2"]
+    assert "s1" in index
+    assert index.next_deadline() == 15
+
+    assert reaper.reap_once(now=15) == 1
+    assert reaped == ["s2", "s1"]
+    assert reaper.stats() == {"live_sessions": 0, "reaped_total": 2}
+
+
+def test_stale_heap_entries_are_dropped():
+    index = SessionExpiryIndex(10)
+    for t in range(5):
+        index.touch("s1", last_active=t)
+    index.touch("s2", last_active=0)
+    index.discard("s2")
+
+    # 旧条目和已移除会话的条目不会被当作过期会话返回
+    assert index.next_deadline() == 14
+    assert index.pop_expired(now=13) == []
+    assert index._heap == [(14, "s1")]
+    assert index.pop_expired(now=14) == ["s1"]
+    assert index._heap == [] and len(index) == 0
+
+    # 反复刷新同一会话时堆会被重建，不会无限增长
+    for t in range(1000):
+        index.touch("s1", last_active=t)
+    assert len(index._heap) <= 2 * len(index) + 64
+
+
+@pytest.fixture
+def routes_with(monkeypatch):
+    """把 session_routes 的存储和索引换成测试用的实例"""
+    def apply(store):
+        index = SessionExpiryIndex(TIMEOUT)
+        monkeypatch.setattr(session_routes, "session_store", store)
+        monkeypatch.setattr(session_routes, "session_expiry", index)
+        return index, SessionReaper(index, session_routes.expire_session)
+    return apply
+
+
+def test_sqlite_session_refreshed_elsewhere_is_kept(tmp_path, routes_with):
+    store = SQLiteSessionStore(str(tmp_path / "sessions.db"))
+    store.put("s1", GameMaster(CONFIG_PATH))
+    index, reaper = routes_with(store)
+
+    # 本进程记录的活动时间已过期，但存储里的活动时间是其他 worker 刚刚写入的
+    index.touch("s1", last_active=time.time() - 2 * TIMEOUT)
+    assert reaper.reap_once() == 0
+    assert "s1" in store
+    assert index._deadlines["s1"] == pytest.approx(store.last_active("s1") + TIMEOUT)
+
+    # 存储里的活动时间也过期后才真正删除
+    store._conn.execute("UPDATE sessions SET updated_at = ?", (time.time() - 2 * TIMEOUT,))
+    assert reaper.reap_once(now=time.time() + 2 * TIMEOUT) == 1
+    assert "s1" not in store
+    assert reaper.stats() == {"live_sessions": 0, "reaped_total": 1}
+
+
+def test_self_expiring_store_is_not_counted(routes_with):
+    store = RedisSessionStore(client=LocalRedisStandIn(), ttl_seconds=TIMEOUT)
+    store.put("s1", GameMaster(CONFIG_PATH))
+    index, reaper = routes_with(store)
+
+    index.touch("s1", last_active=time.time() - 2 * TIMEOUT)
+    assert reaper.reap_once() == 0
+    assert "s1" not in index
+    assert reaper.stats() == {"live_sessions": 0, "reaped_total": 0}
@@ -0,0 +1,60 @@
+"""
+会话存储的测试: python -m pytest test/test_session_store.py
+"""
+
+import os
+import sys
+
+# 在这里修正帮助我找到 app
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.src.GameMaster import GameMaster
+from app.src.session_store import SQLiteSessionStore, serialize_state
+
+CONFIG_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app", "config", "police.yaml")
+
+
+def play(game_master, turns):
+    game_master.status = {"烟头", "手串"}
+    game_master.current_index = 1
+    game_master.current_step = game_master.prompt_steps[1]
+    game_master.item2cache_text = {"烟头": "一个还没熄灭的烟头"}
+    for i in range(turns):
+        game_master.history.append({"role": "user", "content": f"第{i}轮：我在现场找到了什么？"})
+        game_master.history.append({"role": "assistant", "content": f"第{i}轮：警官，请继续搜查。"})
+
+
+def assert_same_progress(restored, original):
+    assert restored.config_path == original.config_path
+    assert restored.status == original.status
+    assert restored.current_index == original.current_index
+    assert restored.current_step is original.prompt_steps[original.current_index]
+    assert restored.history == original.history
+    assert restored.item2cache_text == original.item2cache_text
+
+
+def test_sqlite_round_trip(tmp_path):
+    game_master = GameMaster(CONFIG_PATH)
+    play(game_master, turns=1)
+    assert serialize_state(game_master.get_state())[:1] == b"j"
+
+    store = SQLiteSessionStore(str(tmp_path / "sessions.db"))
+    store.put("s1", game_master)
+    assert_same_progress(store.get("s1"), game_master)
+    assert store.get("missing") is None
+
+
+def test_sqlite_round_trip_compressed(tmp_path):
+    game_master = GameMaster(CONFIG_PATH)
+    play(game_master, turns=20)
+    assert serialize_state(game_master.get_state())[:1] == b"z"
+
+    path = str(tmp_path / "sessions.db")
+    SQLiteSessionStore(path).put("s1", game_master)
+
+    # 重新连接，模拟另一个 worker 读取
+    store = SQLiteSessionStore(path)
+    assert list(store.ids()) == ["s1"]
+    restored = store.get("s1")
+    assert_same_progress(restored, game_master)
+    assert GameMaster.from_state(restored.get_state()).get_state() == game_master.get_state()
@@ -1,7 +1,7 @@
 import { useState, useEffect, useRef } from 'react';
 import { useLocation, useNavigate } from 'react-router-dom';
 import { Camera, Send, Image as ImageIcon, RotateCcw } from 'lucide-react';
-import { gameService } from '../services/api';
+import { gameService, resolveApiUrl } from '../services/api';
 import type { Message } from '../types';
 import './Chat.css';
 
@@ -78,41 +78,45 @@ const Chat = () => {
     setInputText('');
     setIsLoading(true);
 
+    // 先放一个空的回复气泡，流式收到的文本逐段追加进去
+    const botMessageId = `msg_${Date.now()}_bot`;
+    setMessages(prev => [...prev, {
+      id: botMessageId,
+      type: 'assistant',
+      content: '',
+      timestamp: new Date(),
+    }]);
+
+    const updateBotMessage = (update: (content: string) => string) => {
+      setMessages(prev => prev.map(msg =>
+        msg.id === botMessageId ? { ...msg, content: update(msg.content) } : msg
+      ));
+    };
+
     try {
-      const response = await gameService.sendMessage(sessionId, inputText);
-      
-      const botMessage: Message = {
-        id: `msg_${Date.now()}_bot`,
-        type: 'assistant',
-        content: response.bot_response,
-        timestamp: new Date(),
-      };
-      
-      setMessages(prev => [...prev, botMessage]);
+      const response = await gameService.sendMessageStream(sessionId, inputText, (delta) => {
+        updateBotMessage(content => content + delta);
+      });
+
+      updateBotMessage(() => response.bot_response);
       setStatus(response.status);
     } catch (error: any) {
       console.error('Failed to send message:', error);
       
       const errorMessage = getErrorMessage(error, '消息发送失败');
-      
-      const botMessage: Message = {
-        id: `msg_${Date.now()}_error`,
-        type: 'assistant',
-        content: errorMessage,
-        timestamp: new Date(),
-      };
-      setMessages(prev => [...prev, botMessage]);
+      updateBotMessage(() => errorMessage);
     } finally {
       setIsLoading(false);
     }
   };
 
   const handleImageUpload = async (file: File) => {
+    const localImageUrl = URL.createObjectURL(file);
     const userMessage: Message = {
       id: `msg_${Date.now()}`,
       type: 'user',
       content: '发送了一张图片',
-      imageUrl: URL.createObjectURL(file),
+      imageUrl: localImageUrl,
       timestamp: new Date(),
     };
 
@@ -129,7 +133,17 @@ const Chat = () => {
         timestamp: new Date(),
       };
       
-      setMessages(prev => [...prev, botMessage]);
+      // 上传成功后改用服务器的缩略图（浏览器可长期缓存），释放本地原图
+      const displayImageUrl = response.display_image_url ? resolveApiUrl(response.display_image_url) : null;
+      setMessages(prev => [
+        ...prev.map(message =>
+          message.id === userMessage.id && displayImageUrl ? { ...message, imageUrl: displayImageUrl } : message
+        ),
+        botMessage,
+      ]);
+      if (displayImageUrl) {
+        URL.revokeObjectURL(localImageUrl);
+      }
       setStatus(response.status);
     } catch (error: any) {
       console.error('Failed to upload image:', error);
@@ -1,5 +1,5 @@
 import axios from 'axios';
-import type { SessionInfo, ChatResponse, ImageUploadResponse } from '../types';
+import type { SessionInfo, ChatResponse, ImageUploadResponse, ItemSubmitResponse } from '../types';
 
 const API_BASE_URL = import.meta.env.VITE_API_BASE_URL || 'http://localhost:8000/api';
 
@@ -10,6 +10,23 @@ const api = axios.create({
   },
 });
 
+const parseSSEEvent = (rawEvent: string): { name: string; data: any } => {
+  let name = 'message';
+  const dataLines: string[] = [];
+  for (const line of rawEvent.split('\n')) {
+    if (line.startsWith('event:')) {
+      name = line.slice(6).trim();
+    } else if (line.startsWith('data:')) {
+      dataLines.push(line.slice(5).trim());
+    }
+  }
+  return { name, data: dataLines.length ? JSON.parse(dataLines.join('\n')) : {} };
+};
+
+// 后端返回的站内链接（例如缩略图 /api/thumb/...）拼上 API 服务器的地址
+export const resolveApiUrl = (path: string) =>
+  new URL(path, new URL(API_BASE_URL, window.location.origin)).toString();
+
 export const gameService = {
   // 创建会话
   createSession: async (sessionId: string, configPath?: string): Promise<SessionInfo> => {
@@ -43,21 +60,69 @@ export const gameService = {
     return response.data;
   },
 
+  // 流式发送聊天消息（SSE），每收到一段文本就回调 onDelta
+  sendMessageStream: async (
+    sessionId: string,
+    message: string,
+    onDelta: (delta: string) => void,
+  ): Promise<ChatResponse> => {
+    const response = await fetch(`${API_BASE_URL}/chat/stream`, {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json' },
+      body: JSON.stringify({ session_id: sessionId, message }),
+    });
+    if (!response.ok || !response.body) {
+      const data = await response.json().catch(() => ({}));
+      throw new Error(data.detail || `HTTP ${response.status}`);
+    }
+
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    let result: ChatResponse | null = null;
+
+    while (true) {
+      const { done, value } = await reader.read();
+      if (done) break;
+      buffer += decoder.decode(value, { stream: true });
+
+      // 事件之间以空行分隔
+      let boundary = buffer.indexOf('\n\n');
+      while (boundary !== -1) {
+        const rawEvent = buffer.slice(0, boundary);
+        buffer = buffer.slice(boundary + 2);
+        boundary = buffer.indexOf('\n\n');
+
+        const event = parseSSEEvent(rawEvent);
+        if (event.name === 'delta') {
+          onDelta(event.data.content);
+        } else if (event.name === 'done') {
+          result = event.data as ChatResponse;
+        } else if (event.name === 'error') {
+          throw new Error(event.data.detail);
+        }
+      }
+    }
+
+    if (!result) {
+      throw new Error('流式响应意外中断');
+    }
+    return result;
+  },
+
   // 上传图片
   uploadImage: async (sessionId: string, file: File): Promise<ImageUploadResponse> => {
-    const formData = new FormData();
-    formData.append('file', file);
-    
-    const response = await api.post(`/image/upload?session_id=${sessionId}`, formData, {
+    // 直接以原始字节发送文件，不经过 multipart 编码
+    const response = await api.post(`/image/raw?session_id=${sessionId}`, file, {
       headers: {
-        'Content-Type': 'multipart/form-data',
+        'Content-Type': file.type || 'application/octet-stream',
       },
     });
     return response.data;
   },
 
   // 提交物品
-  submitItem: async (sessionId: string, itemName: string) => {
+  submitItem: async (sessionId: string, itemName: string): Promise<ItemSubmitResponse> => {
     const response = await api.post('/item/submit', {
       session_id: sessionId,
       item_name: itemName,
@@ -23,12 +23,12 @@ export interface ItemSubmitResponse {
   user_info: string;
   response_info: string;
   status: string;
-  image_base64?: string;
+  image_url?: string | null;
 }
 
 export interface ImageUploadResponse {
   user_info: string;
   response: string;
   status: string;
-  display_image_base64?: string;
+  display_image_url?: string;
 }
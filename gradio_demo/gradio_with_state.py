@@ -1,7 +1,7 @@
 import gradio as gr
 from src.GameMaster import GameMaster
 import os
-from src.resize_img import resize_image, get_img_html
+from src.resize_img import resize_image, get_img_html, ImagePyramid
 from src.fishTTS import get_audio
 
 yaml_path = "config/police.yaml"
@@ -42,10 +42,10 @@ def item_submit_callback(item_name, chat_history, state: SessionState):
 
 def img_submit_callback(image_input, chatbot, state: SessionState):
     if image_input:
-        resized_img_to_rec = resize_image(image_input, max_height=400)
-        resized_img = resize_image(image_input, max_height=200)
-        img_html = get_img_html(resized_img)
-        user_info, response = state.game_master.submit_image(resized_img_to_rec)
+        # 只解码一次，识别用 400 高，展示用 200 高
+        pyramid = ImagePyramid(image_input, heights=(400, 200))
+        img_html = get_img_html(pyramid.level(200))
+        user_info, response = state.game_master.submit_image(pyramid.level(400))
         chatbot.append((gr.HTML(img_html), response))
     return chatbot
 
@@ -25,6 +25,14 @@ class GameMaster:
             "prompt": "",
             "conds": []
         }
+
+        # 快速识别和零样本识别的设置，默认值与 load_yaml 一致
+        self.use_record_images = False
+        self.record_image_threshold = 0.89
+        self.record_image_scope = 'scenario'
+        self.use_zero_shot = False
+        self.zero_shot_margin = 0.3
+        self.zero_shot_min_similarity = 0.2
         
         if yaml_file_path is not None:
             self.prompt_steps, self.items, self.use_record_images = self.load_yaml(yaml_file_path)
@@ -68,7 +76,8 @@ class GameMaster:
             items.append({
                 'name': item['name'],
                 'text': item['text'],
-                'img_path' : item['img_path']
+                'img_path' : item['img_path'],
+                'clip_text' : item.get('clip_text', [])
             })
 
         if 'record_image_threshold' in data:
@@ -76,13 +85,24 @@ class GameMaster:
         else:
             self.record_image_threshold = 0.89
 
+        # 快速识别的检索范围: scenario 本剧本的物品 / step 当前关卡条件中的物品 / all 整个特征库
+        self.record_image_scope = data.get('record_image_scope', 'scenario')
+
+        # 零样本识别：照片与物品英文别名 clip_text（没有时用物品名）的文字特征比较，概率差足够大时不调用 VLM
+        self.use_zero_shot = data.get('use_zero_shot', False)
+        self.zero_shot_margin = data.get('zero_shot_margin', 0.3)
+        self.zero_shot_min_similarity = data.get('zero_shot_min_similarity', 0.2)
+
         if 'use_record_images' in data:
             use_record_images = data['use_record_images']
         else:
             use_record_images = False
 
-        if use_record_images:
+        if use_record_images or self.use_zero_shot:
             self.init_image_master()
+        if self.use_zero_shot:
+            # 文字编码器在载入剧本时就载入，不等到第一张照片
+            self.image_master.init_text_model()
         
         return prompt_steps, items, use_record_images
 
@@ -199,18 +219,62 @@ class GameMaster:
             ans.append(item["name"])
         return ans
 
+    def get_record_image_names(self):
+        """快速识别时检索的物品范围，None 表示整个特征库"""
+        scope = self.record_image_scope
+        if scope == 'all':
+            return None
+        if scope == 'step':
+            return list(dict.fromkeys(name for cond in self.current_step['conds'] for name in cond))
+        return self.get_item_names()
+
+    def get_zero_shot_items(self):
+        """(物品名, 英文别名) 列表，clip_text 可以写单个字符串或列表"""
+        ans = []
+        for item in self.items:
+            aliases = item.get('clip_text') or []
+            if isinstance(aliases, str):
+                aliases = [aliases]
+            ans.append((item['name'], tuple(aliases)))
+        return ans
+
+    def match_item_by_text(self, feature):
+        """零样本识别：照片与剧本物品名的文字特征比较，第一名与第二名的概率差不小于 zero_shot_margin、
+        且图文相似度不低于 zero_shot_min_similarity 时返回物品名，否则返回 None 交给 VLM"""
+        try:
+            # 物品文字特征按物品列表缓存在 image_master 中，只有第一次调用需要计算
+            results = self.image_master.zero_shot(feature, self.get_zero_shot_items())
+        except Exception as e:
+            print("Warning！ 零样本识别失败！", e)
+            return None
+        if not results:
+            return None
+        top = results[0]
+        margin = top['probability'] - (results[1]['probability'] if len(results) > 1 else 0.0)
+        if margin >= self.zero_shot_margin and top['similarity'] >= self.zero_shot_min_similarity:
+            print(f"零样本识别出物体为: {top['name']}（概率 {top['probability']:.2f}，领先 {margin:.2f}）")
+            return top['name']
+        return None
+
     def get_welcome_info(self):
         return self.current_step["welcome_info"]
         # return "欢迎来到游戏，这是一个默认信息，之后应该随着GameMaster指定不同的游戏而改变。"
 
     def extract_object_from_image(self,resized_img):
 
-        if self.use_record_images:
+        feature = None
+        if self.use_record_images or self.use_zero_shot:
             try:
                 feature = self.image_master.extract_feature(resized_img)
-                results = self.image_master.extract_item_from_feature(feature)
             except:
                 print("Warning！ 提取图片特征失败！")
+
+        if feature is not None and self.use_record_images:
+            try:
+                # 只在当前剧本的物品中检索，其他剧本的道具不会被误认
+                results = self.image_master.extract_item_from_feature(feature, self.get_record_image_names())
+            except:
+                print("Warning！ 图片特征检索失败！")
                 results = None
 
             # print("使用快速图片识别的开关已经打开")
@@ -221,6 +285,12 @@ class GameMaster:
                     print("快速识别出物体为:", res)
                     return res
 
+        # 特征库中没有足够相似的记录（例如新剧本还没有录入图片）时，与物品名的文字特征比较
+        if feature is not None and self.use_zero_shot:
+            res = self.match_item_by_text(feature)
+            if res is not None:
+                return res
+
         # img_name为img的path路径
         candidate_object_list_names = self.get_item_names()
         str_response = get_vlm_response_cot(resized_img, candidate_object_list_names)
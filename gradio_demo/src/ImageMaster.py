@@ -1,17 +1,19 @@
 import os
-import json
 import yaml
-import base64
 import logging
+import threading
 import numpy as np
 from pathlib import Path
+from collections import OrderedDict
 from PIL import Image
-from typing import List, Tuple, Dict, Optional, Union
-from sklearn.metrics.pairwise import cosine_similarity
+from typing import List, Tuple, Dict, Optional, Sequence, Union
 from transformers import CLIPProcessor, CLIPModel
 import torch
 
-from tqdm import tqdm
+from .feature_index import FeatureMatrix, QuantizedIndex, create_ivf_index, load_ivf_index, ivf_index_path
+from .feature_store import (FeatureStore, QuantizedStore, migrate_jsonl, names_path_for, deleted_path_for,
+                            manifest_path_for, quantized_path_for, read_deleted, append_deleted, compact_store)
+from .bulk_ingest import BulkIngester
 
 class ImageMaster:
     """图像特征提取和相似度匹配类"""
@@ -20,10 +22,22 @@ class ImageMaster:
         self.config = None
         self.model = None
         self.processor = None
-        self.database = []  # [{"feature": np.array, "name": str}, ...]
+        self.database = FeatureMatrix()  # 归一化后的特征矩阵和物品名
+        self.index = None  # 可选的 IVF 索引或量化副本，None 时直接在 float32 矩阵上精确检索
+        self._unsaved_index_records = 0
+        self._partitions = {}  # 物品名集合 -> (已扫描的记录数, 记录下标)，只对 _partition_source 这个特征库有效
+        self._partition_source = None
+        self._partition_lock = threading.Lock()
+        self.store = None  # 二进制特征文件
         self.database_path = None
         self.data_file_path = None
+        self.legacy_file_path = None  # 旧的 JSONL 特征库，存在时自动转换
         self.logger = None
+        self._batch_supported = True  # OpenVINO 模型是否支持批量输入
+        self._text_model = None  # OpenVINO 后端计算文字特征用的 huggingface 模型，服务预热时载入
+        self._text_model_lock = threading.Lock()
+        self._text_features = OrderedDict()  # 物品列表 -> (物品名, 文字特征矩阵)
+        self._text_lock = threading.Lock()
         
     def set_from_config(self, config_file_path: str):
         """从配置文件载入设置"""
@@ -34,6 +48,16 @@ class ImageMaster:
             # 设置路径
             self.database_path = Path(self.config['database']['default_path'])
             self.data_file_path = self.database_path / self.config['database']['data_file']
+            legacy_file = self.config['database'].get('legacy_file')
+            if self.data_file_path.suffix == '.jsonl':
+                # 旧配置直接指向 JSONL，转换后使用同名的 .bin
+                legacy_file = self.data_file_path.name
+                self.data_file_path = self.data_file_path.with_suffix('.bin')
+            self.legacy_file_path = self.database_path / legacy_file if legacy_file else None
+
+            quantization = self._index_settings()['quantization']
+            if quantization not in ('none', 'int8'):
+                raise ValueError(f"不支持的量化方式: {quantization}，可选 none / int8（float16 检索比 float32 更慢，不提供）")
             
             # 创建必要的目录
             self.database_path.mkdir(parents=True, exist_ok=True)
@@ -151,114 +175,344 @@ class ImageMaster:
             self.logger.error(f"模型初始化失败: {e}")
             raise
     
-    def _encode_feature(self, feature: np.ndarray) -> str:
-        """将特征向量编码为压缩字符串"""
-        # 将特征转换为指定精度的浮点数
-        precision = self.config['compression']['feature_precision']
-        feature_rounded = np.round(feature, precision)
-        
-        # 转换为字节并编码
-        feature_bytes = feature_rounded.astype(np.float32).tobytes()
-        encoded = base64.b64encode(feature_bytes).decode('utf-8')
-        return encoded
-    
-    def _decode_feature(self, encoded_feature: str) -> np.ndarray:
-        """将编码字符串解码为特征向量"""
-        feature_bytes = base64.b64decode(encoded_feature.encode('utf-8'))
-        feature = np.frombuffer(feature_bytes, dtype=np.float32)
-        return feature
-    
+    def _storage_dtype(self) -> str:
+        """特征文件的存储精度，已有文件以文件头为准"""
+        return (self.config.get('compression') or {}).get('dtype', 'float32')
+
+    def _prepare_image(self, image: Union[str, Image.Image]) -> Image.Image:
+        """把输入统一为缩放后的 RGB 图像"""
+        if isinstance(image, str):
+            if not os.path.exists(image):
+                raise FileNotFoundError(f"图像文件不存在: {image}")
+            pil_image = Image.open(image).convert('RGB')
+        elif isinstance(image, Image.Image):
+            pil_image = image.convert('RGB')
+        else:
+            raise ValueError("输入必须是图像路径字符串或PIL Image对象")
+
+        # 调整图像大小（如果配置中有设置）
+        if 'max_size' in self.config['image']:
+            max_size = tuple(self.config['image']['max_size'])
+            pil_image.thumbnail(max_size, Image.Resampling.LANCZOS)
+        return pil_image
+
+    def _forward(self, pil_images: List[Image.Image]) -> np.ndarray:
+        """一次前向计算一批图像，返回归一化后的特征矩阵 (N, D)"""
+        # 使用CLIP处理器预处理图像
+        inputs = self.processor(images=pil_images, return_tensors="pt")
+
+        if self.config['backend'] == 'openvino':
+            # OpenVINO模型需要转换为OpenVINO格式
+            inputs = {k: v.cpu().numpy() for k, v in inputs.items()}
+            image_features = self.model(inputs)[-1]
+            image_features = image_features / np.linalg.norm(image_features, axis=-1, keepdims=True)  # 归一化特征
+            return np.asarray(image_features, dtype=np.float32).reshape(len(pil_images), -1)
+
+        # 提取特征
+        device = next(self.model.parameters()).device
+        inputs = {k: v.to(device) for k, v in inputs.items()}
+        with torch.no_grad():
+            image_features = self.model.get_image_features(**inputs)
+            # 归一化特征
+            image_features = image_features / image_features.norm(dim=-1, keepdim=True)
+        return image_features.cpu().numpy()
+
+    def extract_features(self, images: List[Union[str, Image.Image]]) -> np.ndarray:
+        """批量提取图像特征，一次前向计算整批图像，返回 (N, D) 的特征矩阵"""
+        try:
+            pil_images = [self._prepare_image(image) for image in images]
+            if len(pil_images) > 1 and not self._batch_supported:
+                return np.stack([self._forward([pil_image])[0] for pil_image in pil_images])
+            try:
+                features = self._forward(pil_images)
+            except Exception as e:
+                if len(pil_images) == 1 or self.config['backend'] != 'openvino':
+                    raise
+                # 导出时固定了 batch=1 的 OpenVINO 模型不支持批量输入，退回逐张计算
+                self.logger.warning(f"OpenVINO模型不支持批量推理，改为逐张计算: {e}")
+                self._batch_supported = False
+                features = np.stack([self._forward([pil_image])[0] for pil_image in pil_images])
+
+            self.logger.debug(f"成功提取特征，数量: {len(pil_images)}，维度: {features.shape[-1]}")
+            return features
+
+        except Exception as e:
+            self.logger.error(f"特征提取失败: {e}")
+            raise
+
     def extract_feature(self, image: Union[str, Image.Image]) -> np.ndarray:
         """提取图像特征"""
+        return self.extract_features([image])[0]
+
+    def _zero_shot_settings(self) -> Dict:
+        settings = {
+            'templates': ["a photo of {}."],
+            'templates_zh': ["{}", "一张{}的照片。"],
+            'logit_scale': 100.0,
+            'cache_size': 32,
+        }
+        settings.update(self.config.get('zero_shot') or {})
+        return settings
+
+    def init_text_model(self):
+        """文字编码器。导出的 OpenVINO 模型只有图像部分，文字特征用同名的 huggingface 模型在 CPU 上计算（每个剧本只算一次）。
+        载入需要几秒，应在服务预热时调用；没有预热时第一次零样本识别时载入，多个请求同时到达也只载入一次"""
+        if self.config['backend'] == 'huggingface':
+            return self.model
+        with self._text_model_lock:
+            if self._text_model is None:
+                model_name = self.config['model']['name']
+                force_download = self.config['model'].get('force_download', False)
+                text_model = CLIPModel.from_pretrained(model_name, force_download=force_download)
+                text_model.eval()
+                self._text_model = text_model
+                self.logger.info(f"文字编码器载入完成: {model_name}")
+        return self._text_model
+
+    def extract_text_features(self, texts: Sequence[str]) -> np.ndarray:
+        """批量提取文字特征，返回归一化后的特征矩阵 (N, D)，与图像特征在同一空间"""
         try:
-            # 处理输入图像
-            if isinstance(image, str):
-                if not os.path.exists(image):
-                    raise FileNotFoundError(f"图像文件不存在: {image}")
-                pil_image = Image.open(image).convert('RGB')
-            elif isinstance(image, Image.Image):
-                pil_image = image.convert('RGB')
-            else:
-                raise ValueError("输入必须是图像路径字符串或PIL Image对象")
-            
-            # 调整图像大小（如果配置中有设置）
-            if 'max_size' in self.config['image']:
-                max_size = tuple(self.config['image']['max_size'])
-                pil_image.thumbnail(max_size, Image.Resampling.LANCZOS)
-            
-            # 使用CLIP处理器预处理图像
-            inputs = self.processor(images=pil_image, return_tensors="pt")
-
-            if self.config['backend'] == 'openvino':
-                # OpenVINO模型需要转换为OpenVINO格式
-                inputs = {k: v.cpu().numpy() for k, v in inputs.items()}
-                image_features = self.model(inputs)[-1]
-                image_features = image_features / np.linalg.norm(image_features, axis=-1, keepdims=True)  # 归一化特征
-                feature = image_features.flatten()
-            else:
-                # 提取特征
-                device = next(self.model.parameters()).device
-                inputs = {k: v.to(device) for k, v in inputs.items()}
-                with torch.no_grad():
-                    image_features = self.model.get_image_features(**inputs)
-                    # 归一化特征
-                    image_features = image_features / image_features.norm(dim=-1, keepdim=True)
-                feature = image_features.cpu().numpy().flatten()
-            
-            self.logger.debug(f"成功提取特征，维度: {feature.shape}")
-            return feature
-            
+            model = self.init_text_model()
+            inputs = self.processor(text=list(texts), return_tensors="pt", padding=True, truncation=True)
+            device = next(model.parameters()).device
+            inputs = {k: v.to(device) for k, v in inputs.items()}
+            with torch.no_grad():
+                text_features = model.get_text_features(**inputs)
+                text_features = text_features / text_features.norm(dim=-1, keepdim=True)
+            return text_features.cpu().numpy().astype(np.float32)
         except Exception as e:
-            self.logger.error(f"特征提取失败: {e}")
+            self.logger.error(f"文字特征提取失败: {e}")
             raise
+
+    @staticmethod
+    def item_prompts(name: str, aliases: Sequence[str], settings: Dict) -> List[str]:
+        """物品的提示：有英文别名（clip_text）时只用别名，否则用物品名；含中文的文字用中文模板，其余用英文模板。
+        CLIP 文字编码器对中文理解有限，中文提示和英文别名取平均会把特征拉偏"""
+        prompts = []
+        for text in (aliases or (name,)):
+            has_chinese = any('\u4e00' <= ch <= '\u9fff' for ch in text)
+            templates = settings['templates_zh'] if has_chinese else settings['templates']
+            prompts.extend(template.format(text) for template in templates)
+        return prompts
+
+    def item_text_features(self, items: Sequence[Tuple[str, Sequence[str]]]) -> Tuple[List[str], np.ndarray]:
+        """物品的文字特征矩阵，items 为 (物品名, 别名列表)；每个物品的提示（见 item_prompts）取平均后归一化。
+        按物品列表缓存，同一个剧本只计算一次"""
+        key = tuple((name, tuple(aliases)) for name, aliases in items)
+        with self._text_lock:
+            cached = self._text_features.get(key)
+            if cached is not None:
+                self._text_features.move_to_end(key)
+                return cached
+
+        settings = self._zero_shot_settings()
+        prompts, owners = [], []
+        for i, (name, aliases) in enumerate(key):
+            item_prompts = self.item_prompts(name, aliases, settings)
+            prompts.extend(item_prompts)
+            owners.extend([i] * len(item_prompts))
+        prompt_features = self.extract_text_features(prompts)
+        matrix = np.zeros((len(key), prompt_features.shape[1]), dtype=np.float32)
+        np.add.at(matrix, np.asarray(owners), prompt_features)
+        matrix /= np.linalg.norm(matrix, axis=1, keepdims=True)
+        result = ([name for name, _ in key], matrix)
+        self.logger.info(f"物品文字特征计算完成: {len(key)} 个物品，{len(prompts)} 条提示")
+
+        with self._text_lock:
+            self._text_features[key] = result
+            while len(self._text_features) > settings['cache_size']:
+                self._text_features.popitem(last=False)
+        return result
+
+    def zero_shot(self, feature: np.ndarray, items: Sequence[Tuple[str, Sequence[str]]]) -> List[Dict]:
+        """零样本识别：图像特征与各物品文字特征的相似度乘以 logit_scale 后做 softmax，按概率从高到低返回"""
+        if not items:
+            return []
+        names, text_matrix = self.item_text_features(items)
+        feature = np.asarray(feature, dtype=np.float32)
+        similarities = text_matrix @ (feature / np.linalg.norm(feature))
+        logits = self._zero_shot_settings()['logit_scale'] * similarities
+        probabilities = np.exp(logits - logits.max())
+        probabilities /= probabilities.sum()
+        return [{
+            'name': names[i],
+            'probability': float(probabilities[i]),
+            'similarity': float(similarities[i]),
+        } for i in np.argsort(-probabilities)]
     
     def load_database(self):
-        """从数据文件载入特征数据库"""
-        self.database = []
-        
-        if not self.data_file_path.exists():
-            self.logger.info("数据文件不存在，将创建新的数据库")
-            return
-        
+        """从数据文件载入特征数据库。新的特征库准备好之前检索线程继续使用原来的特征库（不用索引）"""
+        self.close_database()
+        self.index = None
+
         try:
-            with open(self.data_file_path, 'r', encoding='utf-8') as f:
-                for line_num, line in enumerate(f, 1):
-                    try:
-                        line = line.strip()
-                        if not line:
-                            continue
-                        
-                        data = json.loads(line)
-                        feature = self._decode_feature(data['feature'])
-                        name = data['name']
-                        
-                        self.database.append({
-                            'name': name,
-                            'feature': feature
-                        })
-                        
-                    except Exception as e:
-                        self.logger.warning(f"载入第{line_num}行数据失败: {e}")
-                        continue
-            
-            self.logger.info(f"数据库载入完成，共载入 {len(self.database)} 条记录")
+            if not self.data_file_path.exists() and self.legacy_file_path and self.legacy_file_path.exists():
+                count, backup_path = migrate_jsonl(self.legacy_file_path, self.data_file_path, self._storage_dtype())
+                self.logger.info(f"已将 {self.legacy_file_path.name} 转换为二进制特征文件，共 {count} 条记录，原文件改名为 {backup_path.name}")
+
+            if not self.data_file_path.exists():
+                self.logger.info("数据文件不存在，将创建新的数据库")
+                self.database = FeatureMatrix()
+                return
+
+            # 内存映射特征文件，不逐条解析
+            self.store = FeatureStore(self.data_file_path, dtype=self._storage_dtype())
+            # 标记完已删除的记录再替换，检索线程不会看到标记到一半的特征库
+            database = FeatureMatrix.wrap(self.store.features(), self.store.names)
+            deleted = read_deleted(self.data_file_path)
+            deleted = deleted[deleted < len(database)]
+            if len(deleted):
+                database.mark_deleted(deleted)
+            self.database = database
+            self.logger.info(f"数据库载入完成，共载入 {len(self.database)} 条记录（其中已删除 {len(deleted)} 条）")
+            self._init_index()
             
         except Exception as e:
+            self.database = FeatureMatrix()
             self.logger.error(f"载入数据库失败: {e}")
             raise
     
+    def _index_settings(self) -> Dict:
+        """检索索引配置，未配置时使用精确检索"""
+        settings = {
+            'type': 'flat',
+            'backend': 'auto',
+            'nlist': 256,
+            'nprobe': 8,
+            'min_train_size': 4096,
+            'file': 'image_features.ivf',
+            'quantization': 'none',
+            'rerank': 32,
+        }
+        settings.update(self.config.get('index') or {})
+        return settings
+
+    def _init_index(self):
+        """载入持久化的 IVF 索引并补上之后新增的记录；没有索引且数据足够时训练一个。
+        flat 模式下按配置构建量化副本。
+        索引和量化副本只用于全库检索（record_image_scope: all），按剧本或关卡限定范围时走 partition，不经过索引"""
+        self.index = None
+        self._unsaved_index_records = 0
+        settings = self._index_settings()
+        if settings['type'] != 'ivf':
+            if settings['quantization'] == 'int8':
+                self._init_quantized_index(settings)
+            return
+
+        index = None
+        try:
+            index = load_ivf_index(str(self.database_path / settings['file']), settings['backend'])
+        except Exception as e:
+            self.logger.warning(f"载入IVF索引失败，将重新训练: {e}")
+        if index is not None and index.ntotal > len(self.database):
+            self.logger.warning("IVF索引的记录数多于特征库，特征库可能被替换过，将重新训练")
+            index = None
+
+        if index is not None:
+            index.nprobe = settings['nprobe']
+            index.add(self.database.matrix)
+            self.index = index
+            self.logger.info(f"IVF索引载入完成（{index.backend}），共 {index.ntotal} 条记录")
+        elif len(self.database) >= settings['min_train_size']:
+            self.rebuild_index()
+
+    def _init_quantized_index(self, settings: Dict):
+        """内存映射特征文件旁边的 int8 量化副本（.int8）并补上新增的记录，与特征文件对不上时重建"""
+        if self.store is None or len(self.store) == 0:
+            return
+        path = quantized_path_for(self.data_file_path)
+        # 单独映射一份 float32 特征，只用于补量化副本，用完即释放，float32 数据不会因此常驻内存
+        features = self.store.features()
+        try:
+            index = QuantizedIndex(settings['rerank'], store=QuantizedStore(path), features=self.store)
+        except ValueError as e:
+            self.logger.warning(f"量化文件损坏，将重建: {e}")
+            index = None
+        if index is None or not index.matches(features):
+            if index is not None:
+                index.close()
+                self.logger.info("量化副本与特征文件不一致，重建")
+            QuantizedStore(path).remove()
+            index = QuantizedIndex(settings['rerank'], store=QuantizedStore(path), features=self.store)
+        index.add(features)
+        del features
+        self.index = index
+        self.logger.info(f"int8 量化副本载入完成，共 {index.ntotal} 条记录，{index.nbytes / 2 ** 20:.1f}MB")
+
+    def rebuild_index(self):
+        """用当前特征库重新训练 IVF 索引并保存"""
+        settings = self._index_settings()
+        index = create_ivf_index(settings['backend'], settings['nlist'], settings['nprobe'])
+        index.train(self.database.matrix)
+        self.index = index
+        self.save_index()
+        self.logger.info(f"IVF索引训练完成（{index.backend}），{index.nlist} 个簇，{index.ntotal} 条记录")
+
+    def save_index(self):
+        """把 IVF 索引保存到特征库文件旁边；int8 量化副本在追加记录时已经写入 .int8 文件，不需要这里保存"""
+        if self.index is None or self._index_settings()['type'] != 'ivf':
+            return
+        base_path = str(self.database_path / self._index_settings()['file'])
+        self.index.save(ivf_index_path(base_path, self.index.backend))
+        self._unsaved_index_records = 0
+
+    def _update_index(self):
+        """record 之后增量更新索引，每 backup_interval 条保存一次"""
+        settings = self._index_settings()
+        if settings['type'] != 'ivf':
+            if self.index is not None:
+                self.index.add(self.database.matrix)
+            elif settings['quantization'] == 'int8':
+                self._init_quantized_index(settings)
+            return
+        if self.index is None:
+            if len(self.database) >= settings['min_train_size']:
+                self.rebuild_index()
+            return
+
+        self.index.add(self.database.matrix)
+        self._unsaved_index_records += 1
+        if self._unsaved_index_records >= self.config['database'].get('backup_interval', 100):
+            self.save_index()
+
+    def close_database(self):
+        """关闭特征文件"""
+        if self.store is not None:
+            self.store.close()
+            self.store = None
+        if isinstance(self.index, QuantizedIndex):
+            self.index.close()
+
+    def _remove_index_files(self):
+        """删除持久化的 IVF 索引和 int8 量化副本（记录下标变化后需要重建）"""
+        if isinstance(self.index, QuantizedIndex):
+            self.index.close()
+        index_file = str(self.database_path / self._index_settings()['file'])
+        paths = [Path(ivf_index_path(index_file, backend)) for backend in ('numpy', 'faiss')]
+        for path in paths + [quantized_path_for(self.data_file_path)]:
+            if path.exists():
+                path.unlink()
+
+    def reset_database(self):
+        """清空特征库：删除特征文件、物品名文件和 IVF 索引"""
+        self.close_database()
+        for path in (self.data_file_path, names_path_for(self.data_file_path),
+                     deleted_path_for(self.data_file_path), manifest_path_for(self.data_file_path)):
+            if path.exists():
+                path.unlink()
+        self._remove_index_files()
+        self.database = FeatureMatrix()
+        self.index = None
+        self._unsaved_index_records = 0
+
     def _save_to_database(self, feature: np.ndarray, name: str):
         """保存单条记录到数据库文件"""
         try:
-            record = {
-                'name': name,
-                'feature': self._encode_feature(feature)
-            }
-            
-            # 追加到文件
-            with open(self.data_file_path, 'a', encoding='utf-8') as f:
-                f.write(json.dumps(record, ensure_ascii=False) + '\n')
-            
+            # 文件句柄保持打开，写入后才提交记录数
+            if self.store is None:
+                self.store = FeatureStore(self.data_file_path, dtype=self._storage_dtype())
+            self.store.append(feature[None], [name])
+
             self.logger.debug(f"记录已保存: {name}")
             
         except Exception as e:
@@ -271,14 +525,15 @@ class ImageMaster:
             # 提取特征
             feature = self.extract_feature(image)
             
-            # 添加到内存数据库
-            self.database.append({
-                'name': name,
-                'feature': feature
-            })
-            
             # 保存到文件
             self._save_to_database(feature, name)
+
+            # 添加到内存数据库；直接使用特征文件内存映射时换成新的映射，不把整个矩阵复制到内存中
+            if self.database.mapped:
+                self.database.extend_mapped(self.store.features(), [name])
+            else:
+                self.database.append(feature, name)
+            self._update_index()
             
             self.logger.info(f"成功记录图片: {name}")
             
@@ -286,27 +541,56 @@ class ImageMaster:
             self.logger.error(f"记录图片失败: {e}")
             raise
     
-    def extract_item_from_feature(self, feature: np.ndarray) -> List[Dict]:
-        """从特征中提取最相似的物品"""
-        if not self.database:
+    def partition(self, names: Sequence[str], database: Optional[FeatureMatrix] = None) -> np.ndarray:
+        """物品名属于 names 且未删除的记录下标（例如某个剧本的物品），按物品名集合缓存，特征库新增记录后增量补上。
+        database 为调用方拿到的特征库（默认当前特征库）；特征库被重新载入后缓存作废"""
+        database = database if database is not None else self.database
+        key = frozenset(names)
+        with self._partition_lock:
+            if self._partition_source is not database:
+                self._partitions = {}
+                self._partition_source = database
+            scanned, ids = self._partitions.get(key, (0, np.empty(0, dtype=np.int64)))
+            size = len(database)
+            if scanned < size:
+                database_names = database.names
+                new_ids = [i for i in range(scanned, size)
+                           if database_names[i] in key and not database.is_deleted(i)]
+                if new_ids:
+                    ids = np.concatenate([ids, np.asarray(new_ids, dtype=np.int64)])
+                self._partitions[key] = (size, ids)
+        return ids
+
+    def extract_item_from_feature(self, feature: np.ndarray, names: Optional[Sequence[str]] = None) -> List[Dict]:
+        """从特征中提取最相似的物品，给出 names 时只在这些物品的记录中检索"""
+        # 整个检索使用同一个特征库，load_database 在其他线程中替换特征库不影响这次检索
+        database = self.database
+        if not database:
             self.logger.warning("数据库为空")
             return []
         
         try:
-            # 准备所有数据库特征
-            db_features = np.array([item['feature'] for item in self.database])
-            
-            # 计算余弦相似度
-            similarities = cosine_similarity([feature], db_features)[0]
-            
-            # 获取最相似的结果
+            # 一次矩阵-向量点积 + argpartition 取前 max_results 个；
+            # 建有 IVF 索引时只比较最接近的几个簇，有量化副本时先粗排再用 float32 重排
             max_results = self.config['similarity']['max_results']
-            top_indices = np.argsort(similarities)[::-1][:max_results]
+            if names is not None:
+                # 分区通常只有几十到几百条记录，直接精确检索
+                top_indices, similarities = database.search(feature, max_results, ids=self.partition(names, database))
+            elif self.index is not None:
+                # 索引里还留着已删除的记录，多取几条再过滤
+                top_indices, similarities = self.index.search(database.matrix, feature,
+                                                              max_results + database.deleted_count)
+            else:
+                top_indices, similarities = database.search(feature, max_results)
             
             results = []
-            for idx in top_indices:
-                similarity = float(similarities[idx])
-                name = self.database[idx]['name']
+            for idx, similarity in zip(top_indices, similarities):
+                if database.is_deleted(idx):
+                    continue
+                if len(results) >= max_results:
+                    break
+                similarity = float(similarity)
+                name = database.names[idx]
                 
                 results.append({
                     'name': name,
@@ -340,45 +624,123 @@ class ImageMaster:
         
         return name
     
-    def add_images(self, new_image_paths: Union[str, List[str]]):
-        """从文件夹或文件列表批量添加图片"""
+    def _list_images(self, image_dir: Union[str, Path]) -> List[Path]:
+        """目录中所有支持格式的图片"""
+        image_dir = Path(image_dir)
+        supported_formats = self.config['image']['supported_formats']
+        image_files = []
+        for fmt in supported_formats:
+            image_files.extend(image_dir.glob(f"*{fmt}"))
+            # image_files.extend(image_dir.glob(f"*{fmt.upper()}"))
+        return image_files
+
+    def _create_ingester(self, workers: Optional[int] = None, batch_size: Optional[int] = None) -> BulkIngester:
+        ingest_config = self.config.get('ingest') or {}
+        if self.store is None:
+            self.store = FeatureStore(self.data_file_path, dtype=self._storage_dtype())
+        max_size = tuple(self.config['image']['max_size']) if 'max_size' in self.config['image'] else None
+        return BulkIngester(
+            self.extract_features,
+            self.store,
+            name_for_path=lambda path: self._extract_name_from_filename(Path(path).name),
+            max_size=max_size,
+            workers=workers or ingest_config.get('workers', 0),
+            batch_size=batch_size or ingest_config.get('batch_size', 32),
+            flush_rows=ingest_config.get('flush_rows', 256),
+            logger=self.logger,
+        )
+
+    def add_images(self, new_image_paths: Union[str, List[str]], workers: Optional[int] = None,
+                   batch_size: Optional[int] = None) -> Dict:
+        """从文件夹或文件列表批量添加图片：多进程解码、批量推理、缓冲写入，按内容哈希跳过已入库的图片"""
         if isinstance(new_image_paths, str):
             # 如果是目录路径，获取所有支持的图片文件
-            image_dir = Path(new_image_paths)
-            if not image_dir.exists():
+            if not Path(new_image_paths).exists():
                 self.logger.error(f"目录不存在: {new_image_paths}")
-                return
-            
-            supported_formats = self.config['image']['supported_formats']
-            image_files = []
-            for fmt in supported_formats:
-                image_files.extend(image_dir.glob(f"*{fmt}"))
-                # image_files.extend(image_dir.glob(f"*{fmt.upper()}"))
-            
+                return {}
+            image_files = self._list_images(new_image_paths)
         else:
             # 如果是文件列表
             image_files = [Path(p) for p in new_image_paths]
-        
-        success_count = 0
-        error_count = 0
-        
-        for image_path in tqdm(image_files, desc="添加图片"):
-            try:
-                # 提取物品名
-                item_name = self._extract_name_from_filename(image_path.name)
-                
-                # 记录图片
-                self.record(str(image_path), item_name)
-                success_count += 1
-                
-                self.logger.info(f"成功添加: {image_path.name} -> {item_name}")
-                
-            except Exception as e:
-                error_count += 1
-                self.logger.warning(f"添加图片失败 {image_path.name}: {e}")
+
+        stats = self._create_ingester(workers, batch_size).run(image_files)
+
+        # 重新载入特征文件，内存映射、索引和分区缓存随之更新
+        self.load_database()
+        return stats
+
+    def sync(self, image_dir: Union[str, Path], compact_ratio: Optional[float] = None) -> Dict:
+        """按 manifest 增量同步图片目录：路径、大小、修改时间都没变的文件直接跳过，
+        只为新增或内容改变的文件计算特征，目录中已不存在的文件标记为已删除；
+        已删除的比例超过 compact_ratio 时压缩特征库"""
+        image_dir = Path(image_dir)
+        if not image_dir.exists():
+            self.logger.error(f"目录不存在: {image_dir}")
+            return {}
+        files = [str(path) for path in self._list_images(image_dir)]
+        ingester = self._create_ingester()
+        manifest = ingester.manifest
+        live = manifest.live_by_path()
+
+        changed = []
+        for path in files:
+            entry = live.get(path)
+            stat = os.stat(path)
+            if entry is None or entry['size'] != stat.st_size or entry['mtime'] != stat.st_mtime:
+                changed.append(path)
+        self.logger.info(f"同步 {image_dir}: 共 {len(files)} 张图片，{len(files) - len(changed)} 张未变化，{len(changed)} 张需要检查")
+        stats = ingester.run(changed)
+
+        # 目录中每个文件当前的内容哈希（未变化的文件沿用 manifest 中的哈希）；
+        # 读取失败的文件还在目录中，按未变化处理，保留原来的记录和文件信息，下次同步时再检查
+        changed_set = set(changed)
+        failed = {path for path in changed if path not in ingester.digests and path in live}
+        current = {path: live[path]['hash'] for path in files if path not in changed_set or path in failed}
+        current.update(ingester.digests)
+        path_of_hash = {}
+        for path, digest in current.items():
+            path_of_hash.setdefault(digest, path)
+
+        updates, tombstones = [], []
+        for digest, entry in manifest.entries.items():
+            if entry.get('deleted'):
                 continue
-        
-        self.logger.info(f"批量添加完成: 成功 {success_count} 张，失败 {error_count} 张")
+            if digest not in path_of_hash:
+                # 文件被删除或内容已改变
+                tombstones.append(dict(entry, deleted=True))
+                continue
+            # 内容还在：文件被改名或只是修改时间变了，更新 manifest 中的路径和文件信息
+            path = entry['path'] if current.get(entry['path']) == digest else path_of_hash[digest]
+            if path in failed:
+                continue
+            stat = os.stat(path)
+            if (path, stat.st_size, stat.st_mtime) != (entry['path'], entry['size'], entry['mtime']):
+                updates.append(dict(entry, path=path, size=stat.st_size, mtime=stat.st_mtime))
+
+        # 先记下已删除的记录下标，再更新 manifest；中断后重跑会再次标记，重复的下标没有影响
+        append_deleted(self.data_file_path, [entry['id'] for entry in tombstones])
+        manifest.append(updates + tombstones)
+        manifest.close()
+        stats.update({'unchanged': len(files) - len(changed), 'updated': len(updates), 'deleted': len(tombstones)})
+
+        self.load_database()
+        if compact_ratio is None:
+            compact_ratio = (self.config.get('ingest') or {}).get('compact_ratio', 0.2)
+        if len(self.database) and self.database.deleted_count / len(self.database) > compact_ratio:
+            stats['compacted'] = self.compact()
+        self.logger.info(f"同步完成: 新增 {stats['added']} 张，更新 {len(updates)} 条，删除 {len(tombstones)} 条，"
+                         f"未变化 {stats['unchanged']} 张")
+        return stats
+
+    def compact(self) -> int:
+        """压缩特征库：从特征文件中真正去掉已删除的记录，返回去掉的条数。记录下标变化后 IVF 索引需要重新训练"""
+        self.close_database()
+        kept, removed = compact_store(self.data_file_path)
+        if removed:
+            self._remove_index_files()
+            self.logger.info(f"特征库压缩完成: 保留 {kept} 条，去掉 {removed} 条已删除的记录")
+        self.load_database()
+        return removed
 
 
 # 使用示例和测试函数
@@ -389,7 +751,6 @@ def test_image_master():
 
     # 定义路径
     base_dir = Path("C:/Users/Sirly/PycharmProjects/whale-land-VLM")
-    db_file = base_dir / "official_image" / "image_features.jsonl"
     image_dir = base_dir / "base_image"
     
     
@@ -400,57 +761,11 @@ def test_image_master():
     print("正在初始化模型...")
     im.init_model()
     
-    
-    # 检查数据库文件和图片数量是否匹配
-    rebuild_db = False
-    
-    if db_file.exists():
-        # 计算数据库条目数
-        with open(db_file, 'r', encoding='utf-8') as f:
-            db_count = sum(1 for line in f if line.strip())
-        
-        # 计算图片数量
-        supported_formats = im.config['image']['supported_formats']
-        image_count = 0
-        for fmt in supported_formats:
-            image_count += len(list(image_dir.glob(f"*{fmt}")))
-            # image_count += len(list(image_dir.glob(f"*{fmt.upper()}")))
-        
-        print(f"数据库条目数: {db_count}, 图片数量: {image_count}")
-        
-        if db_count != image_count:
-            print("数据库条目数与图片数量不匹配，准备重新建库...")
-            # 重命名原数据库文件
-            backup_file = base_dir / "official_image" / "image_features_backup.jsonl"
-            if backup_file.exists():
-                backup_file.unlink()
-            db_file.rename(backup_file)
-            print(f"原数据库已备份至: {backup_file}")
-            rebuild_db = True
-    else:
-        print("数据库文件不存在，准备建库...")
-        rebuild_db = True
-    
-    # 重新建库
-    if rebuild_db:
-        print(f"开始从目录建库: {image_dir}")
-        # 确保数据库目录存在
-        db_dir = base_dir / "official_image"
-        db_dir.mkdir(parents=True, exist_ok=True)
-        
-        # 清空内存数据库
-        im.database = []
-        # 如果数据文件已存在，删除它
-        if db_file.exists():
-            db_file.unlink()
-        
-        # 添加图片到数据库
-        im.add_images(str(image_dir))
-        print("建库完成")
-    else:
-        # 载入现有数据库
-        print("数据库条目数与图片数量匹配，载入现有数据库...")
-        im.load_database()
+    # 载入现有数据库，再按 manifest 增量同步图片目录：只处理新增、改动和删除的图片
+    im.load_database()
+    print(f"开始同步图片目录: {image_dir}")
+    stats = im.sync(image_dir)
+    print(f"同步完成: {stats}")
     
     # 测试搜索功能
     test_image = "../asset/images/烟头.jpg"
@@ -468,4 +783,27 @@ def test_image_master():
 
 
 if __name__ == "__main__":
-    test_image_master()
+    # python -m src.ImageMaster sync local_data/base_image
+    # python -m src.ImageMaster compact
+    import argparse
+
+    parser = argparse.ArgumentParser(description="ImageMaster 特征库维护")
+    parser.add_argument("command", nargs="?", choices=["sync", "compact"], help="不指定时运行 test_image_master")
+    parser.add_argument("image_dir", nargs="?", help="sync 的图片目录")
+    parser.add_argument("--config", default="config/image_master.yaml")
+    args = parser.parse_args()
+
+    if args.command is None:
+        test_image_master()
+    else:
+        im = ImageMaster()
+        im.set_from_config(args.config)
+        if args.command == "sync":
+            if args.image_dir is None:
+                parser.error("sync 需要指定图片目录")
+            im.init_model()
+            im.load_database()
+            print(im.sync(args.image_dir))
+        else:
+            im.load_database()
+            print(f"去掉 {im.compact()} 条已删除的记录")
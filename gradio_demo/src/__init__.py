@@ -1,4 +1,4 @@
-from .resize_img import resize_image, get_img_html
+from .resize_img import resize_image, get_img_html, ImagePyramid
 from .llm_response import get_llm_response
 from .parse_json import parse_json
 from .fishTTS import get_audio
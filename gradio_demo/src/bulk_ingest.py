@@ -0,0 +1,213 @@
+"""
+批量建库
+多进程读取、计算内容哈希并解码缩放图片，主进程按批做模型推理，后台线程缓冲后成批写入特征文件。
+每张图片的内容哈希记录在特征文件旁边的 manifest 中，重复运行时跳过已入库的图片，中断后可以接着跑。
+manifest 先于特征文件写入，载入时丢弃记录下标超出特征文件已提交条数的条目，两者不会错位。
+"""
+
+import os
+import time
+import queue
+import hashlib
+import threading
+from io import BytesIO
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+from PIL import Image
+
+try:
+    from tqdm import tqdm
+except ImportError:  # tqdm 只用来显示进度条，没有安装时不显示
+    tqdm = None
+
+from .feature_store import IngestManifest, manifest_path_for
+
+
+def file_digest(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+# 子进程中的只读状态，由 _init_worker 设置一次，避免每个任务都传一遍
+_known_hashes = frozenset()
+_max_size = None
+
+
+def _init_worker(known_hashes, max_size):
+    global _known_hashes, _max_size
+    _known_hashes = known_hashes
+    _max_size = max_size
+
+
+def _load_image(path: str):
+    """在子进程中读取图片：先算内容哈希，已入库的不解码；返回 (path, hash, size, mtime, 图片, 错误)"""
+    try:
+        stat = os.stat(path)
+        with open(path, "rb") as f:
+            data = f.read()
+    except OSError as e:
+        return path, None, 0, 0.0, None, str(e)
+    digest = file_digest(data)
+    if digest in _known_hashes:
+        return path, digest, stat.st_size, stat.st_mtime, None, None
+    try:
+        image = Image.open(BytesIO(data)).convert("RGB")
+        if _max_size is not None:
+            image.thumbnail(_max_size, Image.Resampling.LANCZOS)
+        return path, digest, stat.st_size, stat.st_mtime, image, None
+    except Exception as e:
+        return path, digest, stat.st_size, stat.st_mtime, None, str(e)
+
+
+class _BufferedWriter:
+    """后台写入线程：攒够 flush_rows 条后先写 manifest，再一次性追加并提交到特征文件"""
+
+    def __init__(self, store, manifest: IngestManifest, flush_rows: int = 256):
+        self.store = store
+        self.manifest = manifest
+        self.flush_rows = flush_rows
+        self.written = 0
+        self.error = None
+        self._queue = queue.Queue(maxsize=64)
+        self._thread = threading.Thread(target=self._loop, name="ingest-writer", daemon=True)
+        self._thread.start()
+
+    def put(self, features: np.ndarray, entries: List[Dict]):
+        if self.error is not None:
+            raise self.error
+        self._queue.put((features, entries))
+
+    def _flush(self, features: List[np.ndarray], entries: List[Dict]):
+        start_id = len(self.store)
+        for offset, entry in enumerate(entries):
+            entry["id"] = start_id + offset
+        self.manifest.append(entries)
+        self.store.append(np.concatenate(features), [entry["name"] for entry in entries])
+        self.written += len(entries)
+
+    def _loop(self):
+        features, entries = [], []
+        while True:
+            item = self._queue.get()
+            if item is not None:
+                features.append(item[0])
+                entries.extend(item[1])
+            if entries and (item is None or len(entries) >= self.flush_rows):
+                try:
+                    self._flush(features, entries)
+                except Exception as e:
+                    self.error = e
+                    return
+                features, entries = [], []
+            if item is None:
+                return
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+        if self.error is not None:
+            raise self.error
+
+
+class BulkIngester:
+    """把一批图片文件写入特征库，返回新增、跳过、失败的数量和吞吐量"""
+
+    def __init__(self, extract_features: Callable[[List[Image.Image]], np.ndarray], store,
+                 name_for_path: Callable[[str], str], max_size: Optional[Tuple[int, int]] = None,
+                 workers: int = 0, batch_size: int = 32, flush_rows: int = 256, logger=None):
+        self.extract_features = extract_features
+        self.store = store
+        self.manifest = IngestManifest(manifest_path_for(store.path))
+        # 上次中断时 manifest 可能比特征文件多出几条
+        self.manifest.prune(len(store))
+        self.name_for_path = name_for_path
+        self.max_size = max_size
+        self.workers = workers or os.cpu_count() or 1
+        self.batch_size = batch_size
+        self.flush_rows = flush_rows
+        self.logger = logger
+        self.digests: Dict[str, str] = {}  # 本次成功读取的文件路径 -> 内容哈希
+
+    def _log(self, message: str):
+        if self.logger is not None:
+            self.logger.info(message)
+        else:
+            print(message)
+
+    def _embed(self, batch: List[Tuple]) -> Tuple[np.ndarray, List[Tuple]]:
+        """整批推理，失败时逐张重试，坏图片不影响同批的其他图片"""
+        try:
+            return self.extract_features([item[4] for item in batch]), batch
+        except Exception as e:
+            self._log(f"批量推理失败，改为逐张计算: {e}")
+        features, ok = [], []
+        for item in batch:
+            try:
+                features.append(self.extract_features([item[4]])[0])
+                ok.append(item)
+            except Exception as e:
+                self._log(f"特征提取失败 {item[0]}: {e}")
+        return (np.stack(features) if features else None), ok
+
+    def run(self, image_paths: Sequence[Union[str, Path]]) -> Dict:
+        image_paths = [str(path) for path in image_paths]
+        stats = {"total": len(image_paths), "added": 0, "skipped": 0, "failed": 0}
+        start = time.perf_counter()
+        # 已删除的内容重新出现时按新图片入库
+        known = frozenset(digest for digest, entry in self.manifest.entries.items() if not entry.get("deleted"))
+        seen = set(known)
+        writer = _BufferedWriter(self.store, self.manifest, self.flush_rows)
+
+        batch = []
+
+        def flush_batch():
+            features, ok = self._embed(batch)
+            stats["failed"] += len(batch) - len(ok)
+            if ok:
+                writer.put(features, [{
+                    "hash": digest,
+                    "path": path,
+                    "size": size,
+                    "mtime": mtime,
+                    "name": self.name_for_path(path),
+                } for path, digest, size, mtime, _ in ok])
+                stats["added"] += len(ok)
+            batch.clear()
+
+        try:
+            with ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker,
+                                     initargs=(known, self.max_size)) as pool:
+                progress = pool.map(_load_image, image_paths, chunksize=4)
+                if tqdm is not None:
+                    progress = tqdm(progress, total=len(image_paths), desc="建库")
+                for path, digest, size, mtime, image, error in progress:
+                    if digest is not None and error is None:
+                        self.digests[path] = digest
+                    if error is not None:
+                        self._log(f"读取图片失败 {path}: {error}")
+                        stats["failed"] += 1
+                    elif digest in seen:
+                        # 已入库，或本次运行中出现了内容相同的文件
+                        stats["skipped"] += 1
+                    else:
+                        seen.add(digest)
+                        batch.append((path, digest, size, mtime, image))
+                        if len(batch) >= self.batch_size:
+                            flush_batch()
+                    if tqdm is not None:
+                        elapsed = time.perf_counter() - start
+                        progress.set_postfix(added=stats["added"], skipped=stats["skipped"],
+                                             rate=f"{stats['added'] / elapsed:.1f}/s" if elapsed else "-")
+                if batch:
+                    flush_batch()
+        finally:
+            writer.close()
+            self.manifest.close()
+
+        stats["seconds"] = time.perf_counter() - start
+        stats["images_per_second"] = stats["added"] / stats["seconds"] if stats["seconds"] else 0.0
+        self._log(f"批量建库完成: 新增 {stats['added']} 张，跳过 {stats['skipped']} 张（已入库），"
+                  f"失败 {stats['failed']} 张，耗时 {stats['seconds']:.1f}s，{stats['images_per_second']:.1f} 张/秒")
+        return stats
@@ -0,0 +1,477 @@
+"""
+特征库的内存索引
+所有特征保存在一块预分配、已归一化的 float32 矩阵中，record 时按容量翻倍扩容；
+检索只做一次矩阵-向量点积，再用 argpartition 取前 k 个。
+库很大时可以在矩阵之上建立 IVF-flat 倒排索引（NumPy 实现，安装了 faiss 时可用 faiss），只比较最接近的几个簇；
+也可以保存一份 int8 量化副本（内存映射），在量化数据上粗排后再用 float32 重排前几个候选
+"""
+
+import os
+import threading
+from importlib.util import find_spec
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+
+def normalize_rows(features: np.ndarray) -> np.ndarray:
+    """按行做 L2 归一化，返回 float32"""
+    features = np.asarray(features, dtype=np.float32)
+    norms = np.linalg.norm(features, axis=-1, keepdims=True)
+    return features / np.maximum(norms, 1e-12)
+
+
+def top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """返回得分最高的 k 个下标（按得分从高到低）"""
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    if k < len(scores):
+        candidates = np.argpartition(scores, -k)[-k:]
+    else:
+        candidates = np.arange(len(scores))
+    return candidates[np.argsort(scores[candidates])[::-1]]
+
+
+class FeatureMatrix:
+    """预分配、已归一化的特征矩阵和对应的物品名"""
+
+    def __init__(self, dim: Optional[int] = None, capacity: int = 1024):
+        self.dim = dim
+        self.names: List[str] = []
+        self._size = 0
+        self._data = np.empty((capacity, dim), dtype=np.float32) if dim else None
+        self._deleted = None  # 已删除（尚未压缩）的记录，检索时跳过
+
+    @classmethod
+    def from_features(cls, features: Sequence[np.ndarray], names: Sequence[str]) -> "FeatureMatrix":
+        """一次性构建，容量取不小于条数的 2 的幂"""
+        matrix = cls()
+        if len(names) > 0:
+            if not isinstance(features, np.ndarray):
+                features = np.stack(features)
+            size = len(names)
+            capacity = 1 << max(10, (size - 1).bit_length())
+            matrix.dim = features.shape[1]
+            matrix._data = np.empty((capacity, matrix.dim), dtype=np.float32)
+            # 直接在预分配的矩阵里归一化，不产生额外的整库拷贝
+            data = matrix._data[:size]
+            data[:] = features
+            data /= np.maximum(np.linalg.norm(data, axis=1, keepdims=True), 1e-12)
+            matrix._size = size
+            matrix.names = list(names)
+        return matrix
+
+    @classmethod
+    def wrap(cls, data: np.ndarray, names: Sequence[str]) -> "FeatureMatrix":
+        """直接使用已归一化的 float32 矩阵（例如特征文件的只读内存映射），不做拷贝；
+        第一次 append 时才复制到可写的内存中。其他精度转换为 float32"""
+        if data.dtype != np.float32:
+            return cls.from_features(data, names)
+        matrix = cls(dim=data.shape[1], capacity=0)
+        matrix._data = data
+        matrix._size = len(names)
+        matrix.names = list(names)
+        return matrix
+
+    @property
+    def mapped(self) -> bool:
+        """是否直接使用特征文件的只读内存映射"""
+        return isinstance(self._data, np.memmap)
+
+    def extend_mapped(self, data: np.ndarray, names: Sequence[str]):
+        """特征文件追加记录后换成新的内存映射（data 已包含新记录），不把整个矩阵复制到内存中"""
+        self._data = data
+        self.names.extend(names)
+        self._size = len(self.names)
+
+    @property
+    def matrix(self) -> np.ndarray:
+        """有效部分的视图 (N, D)，不做拷贝"""
+        if self._data is None:
+            return np.empty((0, self.dim or 0), dtype=np.float32)
+        return self._data[:self._size]
+
+    @property
+    def capacity(self) -> int:
+        return 0 if self._data is None else self._data.shape[0]
+
+    def _grow(self, min_capacity: int):
+        capacity = max(1024, self.capacity)
+        while capacity < min_capacity:
+            capacity *= 2
+        data = np.empty((capacity, self.dim), dtype=np.float32)
+        if self._size:
+            data[:self._size] = self._data[:self._size]
+        self._data = data
+
+    def append(self, feature: np.ndarray, name: str) -> int:
+        """追加一条记录，返回它的下标"""
+        feature = np.asarray(feature, dtype=np.float32).reshape(-1)
+        if self.dim is None:
+            self.dim = feature.shape[0]
+        elif feature.shape[0] != self.dim:
+            raise ValueError(f"特征维度不一致: {feature.shape[0]} != {self.dim}")
+        if self._size >= self.capacity:
+            self._grow(self._size + 1)
+        self._data[self._size] = normalize_rows(feature)
+        self.names.append(name)
+        self._size += 1
+        return self._size - 1
+
+    def clear(self):
+        self.names = []
+        self._size = 0
+        self._data = None
+        self._deleted = None
+
+    def mark_deleted(self, ids: Sequence[int]):
+        """标记已删除的记录，之后的检索不再返回它们"""
+        self._deleted_mask()[np.asarray(ids, dtype=np.int64)] = True
+
+    @property
+    def deleted_count(self) -> int:
+        return 0 if self._deleted is None else int(self._deleted.sum())
+
+    def is_deleted(self, index: int) -> bool:
+        return self._deleted is not None and index < len(self._deleted) and bool(self._deleted[index])
+
+    def _deleted_mask(self) -> np.ndarray:
+        if self._deleted is None:
+            self._deleted = np.zeros(self._size, dtype=bool)
+        elif len(self._deleted) < self._size:
+            # 标记之后追加的记录都未删除
+            self._deleted = np.concatenate([self._deleted, np.zeros(self._size - len(self._deleted), dtype=bool)])
+        return self._deleted
+
+    def search(self, feature: np.ndarray, k: int,
+               ids: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """余弦相似度检索，返回 (下标, 相似度)，按相似度从高到低；给出 ids 时只在这些记录中检索"""
+        if self._size == 0 or (ids is not None and len(ids) == 0):
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        query = normalize_rows(np.asarray(feature).reshape(-1))
+        if ids is not None:
+            scores = self.matrix[ids] @ query
+            if self._deleted is not None:
+                scores[self._deleted_mask()[ids]] = -np.inf
+            best = top_k(scores, k)
+            best = best[np.isfinite(scores[best])]
+            return ids[best], scores[best]
+        scores = self.matrix @ query
+        if self._deleted is not None:
+            scores[self._deleted_mask()] = -np.inf
+        indices = top_k(scores, k)
+        indices = indices[np.isfinite(scores[indices])]
+        return indices, scores[indices]
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __getitem__(self, index: int) -> Dict:
+        if not -self._size <= index < self._size:
+            raise IndexError(index)
+        return {'name': self.names[index], 'feature': self.matrix[index]}
+
+    def __iter__(self) -> Iterator[Dict]:
+        for index in range(self._size):
+            yield self[index]
+
+
+def quantize_int8(features: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """每条向量单独缩放到 [-127, 127]，返回 (int8 编码, float32 缩放系数)"""
+    features = np.asarray(features, dtype=np.float32)
+    scales = np.maximum(np.abs(features).max(axis=1), 1e-12) / 127
+    codes = np.rint(features / scales[:, None]).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+
+class QuantizedIndex:
+    """特征矩阵的 int8 量化副本，精确检索时代替 float32 矩阵做全库扫描，再用原始特征重排前 rerank 个候选。
+
+    给出 store（feature_store.QuantizedStore）时量化数据保存在磁盘上并内存映射，常驻内存的只有 int8 数据；
+    给出 features（feature_store.FeatureStore）时重排用 pread 从 float32 特征文件读取候选，不经过内存映射。
+    这是用检索速度换内存的做法：几千条记录时比 float32 精确检索略慢，只在特征库大到内存吃紧时使用。
+    只有全库检索（record_image_scope: all）会用到；默认的按剧本检索走 partition，不经过量化副本。
+    float16 副本在 NumPy 中没有快速点积，比 float32 还慢，不提供
+    """
+
+    backend = "quantized"
+    # 量化数据按块转换为 float32 后再做点积，块小一些可以留在 CPU 缓存里
+    CHUNK_ROWS = 256
+
+    def __init__(self, rerank: int = 32, store=None, features=None):
+        self.rerank = rerank
+        self.store = store
+        self.features = features
+        # (int8 编码 (N, D), 缩放系数 (N,))，整体替换，检索线程拿到的总是一致的一份
+        self._data = (None, None)
+        self._capacity_codes = None  # 没有 store 时预分配的内存
+        self._capacity_scales = None
+        if store is not None and len(store):
+            rows = store.rows()
+            self._data = (rows["codes"], rows["scale"])
+
+    @property
+    def ntotal(self) -> int:
+        codes = self._data[0]
+        return 0 if codes is None else len(codes)
+
+    @property
+    def nbytes(self) -> int:
+        """量化数据的大小（内存映射时即全库扫描后常驻的内存）"""
+        codes, scales = self._data
+        return 0 if codes is None else len(codes) * (codes.shape[1] + scales.itemsize)
+
+    def matches(self, matrix: np.ndarray) -> bool:
+        """量化副本是否与 matrix 对应：条数不多于 matrix，且最后一条解码后与原始特征一致（特征文件被替换或压缩过时不一致）"""
+        size = self.ntotal
+        if size > len(matrix):
+            return False
+        if size == 0:
+            return True
+        codes, scales = self._data
+        decoded = codes[size - 1].astype(np.float32) * scales[size - 1]
+        original = np.asarray(matrix[size - 1], dtype=np.float32)
+        return float(decoded @ original) > 0.99 * float(np.linalg.norm(decoded) * np.linalg.norm(original))
+
+    def add(self, matrix: np.ndarray):
+        """量化 matrix 中尚未加入的记录（下标 ntotal 之后），只读取这些新记录"""
+        start = self.ntotal
+        end = len(matrix)
+        if start >= end:
+            return
+        if self.store is not None:
+            for chunk_start in range(start, end, 65536):
+                chunk_end = min(end, chunk_start + 65536)
+                self.store.append(*quantize_int8(matrix[chunk_start:chunk_end]))
+            rows = self.store.rows()
+            self._data = (rows["codes"], rows["scale"])
+            return
+
+        if self._capacity_codes is None or end > len(self._capacity_codes):
+            capacity = max(1024, len(self._capacity_codes) if self._capacity_codes is not None else 0)
+            while capacity < end:
+                capacity *= 2
+            codes = np.empty((capacity, matrix.shape[1]), dtype=np.int8)
+            scales = np.empty(capacity, dtype=np.float32)
+            if start:
+                codes[:start] = self._capacity_codes[:start]
+                scales[:start] = self._capacity_scales[:start]
+            self._capacity_codes, self._capacity_scales = codes, scales
+        for chunk_start in range(start, end, 65536):
+            chunk_end = min(end, chunk_start + 65536)
+            codes, scales = quantize_int8(matrix[chunk_start:chunk_end])
+            self._capacity_codes[chunk_start:chunk_end] = codes
+            self._capacity_scales[chunk_start:chunk_end] = scales
+        self._data = (self._capacity_codes[:end], self._capacity_scales[:end])
+
+    def scores(self, query: np.ndarray) -> np.ndarray:
+        """在量化数据上计算近似的余弦相似度"""
+        codes, scales = self._data
+        size = len(codes)
+        scores = np.empty(size, dtype=np.float32)
+        buffer = np.empty((self.CHUNK_ROWS, codes.shape[1]), dtype=np.float32)
+        for start in range(0, size, self.CHUNK_ROWS):
+            count = min(self.CHUNK_ROWS, size - start)
+            buffer[:count] = codes[start:start + count]
+            np.dot(buffer[:count], query, out=scores[start:start + count])
+        scores *= scales
+        return scores
+
+    def search(self, matrix: np.ndarray, query: np.ndarray, k: int,
+               rerank: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """量化数据粗排取前 rerank 个候选，再用原始特征（features 或 matrix）重新计算相似度并排序"""
+        if self.ntotal == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        query = normalize_rows(np.asarray(query).reshape(-1))
+        candidates = np.sort(top_k(self.scores(query), max(k, rerank or self.rerank)))
+        if self.features is not None:
+            exact = self.features.read_rows(candidates) @ query
+        else:
+            exact = np.asarray(matrix[candidates], dtype=np.float32) @ query
+        best = top_k(exact, k)
+        return candidates[best], exact[best]
+
+    def close(self):
+        if self.store is not None:
+            self.store.close()
+
+
+def spherical_kmeans(data: np.ndarray, nlist: int, iterations: int = 10,
+                     sample_per_list: int = 64, seed: int = 0) -> np.ndarray:
+    """在归一化数据上做球面 k-means，返回归一化的聚类中心 (nlist, D)"""
+    rng = np.random.default_rng(seed)
+    sample_size = min(len(data), nlist * sample_per_list)
+    sample = data[np.sort(rng.choice(len(data), sample_size, replace=False))]
+    centroids = sample[rng.choice(sample_size, nlist, replace=False)].copy()
+    for _ in range(iterations):
+        assignments = np.argmax(sample @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignments, sample)
+        counts = np.bincount(assignments, minlength=nlist)
+        # 空簇重新随机选一个样本作为中心
+        empty = counts == 0
+        if empty.any():
+            sums[empty] = sample[rng.choice(sample_size, int(empty.sum()), replace=False)]
+        centroids = normalize_rows(sums)
+    return centroids
+
+
+class NumpyIVFIndex:
+    """纯 NumPy 实现的 IVF-flat 倒排索引，向量本身仍保存在 FeatureMatrix 中，这里只记录每条记录所属的簇"""
+
+    backend = "numpy"
+
+    def __init__(self, nlist: int = 256, nprobe: int = 8):
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.centroids = None
+        self._assignments = np.empty(0, dtype=np.int32)
+        # 每个簇的记录下标；add 时整体换成新的列表，检索线程拿到的总是完整的一份，不需要加锁
+        self._lists: List[np.ndarray] = []
+        self._write_lock = threading.Lock()
+
+    @property
+    def is_trained(self) -> bool:
+        return self.centroids is not None
+
+    @property
+    def ntotal(self) -> int:
+        return len(self._assignments)
+
+    def _assign(self, vectors: np.ndarray) -> np.ndarray:
+        assignments = np.empty(len(vectors), dtype=np.int32)
+        for start in range(0, len(vectors), 65536):
+            chunk = vectors[start:start + 65536]
+            assignments[start:start + len(chunk)] = np.argmax(chunk @ self.centroids.T, axis=1)
+        return assignments
+
+    def _rebuild_lists(self):
+        order = np.argsort(self._assignments, kind="stable")
+        bounds = np.searchsorted(self._assignments[order], np.arange(self.nlist + 1))
+        self._lists = [order[bounds[i]:bounds[i + 1]] for i in range(self.nlist)]
+
+    def train(self, matrix: np.ndarray):
+        """用现有数据训练聚类中心，并把所有记录分配到各自的簇"""
+        self.nlist = min(self.nlist, len(matrix))
+        self.centroids = spherical_kmeans(matrix, self.nlist)
+        self._assignments = self._assign(matrix)
+        self._rebuild_lists()
+
+    def add(self, matrix: np.ndarray):
+        """把 matrix 中尚未加入索引的记录（下标 ntotal 之后）分配到各自的簇"""
+        with self._write_lock:
+            start = self.ntotal
+            if start >= len(matrix):
+                return
+            new_assignments = self._assign(matrix[start:])
+            new_ids = np.arange(start, start + len(new_assignments), dtype=np.int64)
+            lists = list(self._lists)
+            for list_id in np.unique(new_assignments):
+                lists[list_id] = np.concatenate([lists[list_id], new_ids[new_assignments == list_id]])
+            self._lists = lists
+            self._assignments = np.concatenate([self._assignments, new_assignments])
+
+    def search(self, matrix: np.ndarray, query: np.ndarray, k: int,
+               nprobe: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """只在与查询最接近的 nprobe 个簇中做精确比较"""
+        query = normalize_rows(np.asarray(query).reshape(-1))
+        probes = top_k(self.centroids @ query, nprobe or self.nprobe)
+        lists = self._lists
+        ids = np.concatenate([lists[int(list_id)] for list_id in probes])
+        if len(ids) == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        scores = matrix[ids] @ query
+        best = top_k(scores, k)
+        return ids[best], scores[best]
+
+    def save(self, path: str):
+        tmp_path = f"{path}.tmp.npz"
+        np.savez(tmp_path, centroids=self.centroids, assignments=self._assignments,
+                 nprobe=np.int32(self.nprobe))
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "NumpyIVFIndex":
+        with np.load(path) as data:
+            index = cls(nlist=len(data['centroids']), nprobe=int(data['nprobe']))
+            index.centroids = data['centroids']
+            index._assignments = data['assignments']
+        index._rebuild_lists()
+        return index
+
+
+class FaissIVFIndex:
+    """faiss 的 IndexIVFFlat（内积），安装了 faiss 时使用"""
+
+    backend = "faiss"
+
+    def __init__(self, nlist: int = 256, nprobe: int = 8, index=None):
+        import faiss
+
+        self._faiss = faiss
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self._index = index
+
+    @property
+    def is_trained(self) -> bool:
+        return self._index is not None and self._index.is_trained
+
+    @property
+    def ntotal(self) -> int:
+        return 0 if self._index is None else self._index.ntotal
+
+    def train(self, matrix: np.ndarray):
+        faiss = self._faiss
+        self.nlist = min(self.nlist, len(matrix))
+        quantizer = faiss.IndexFlatIP(matrix.shape[1])
+        self._index = faiss.IndexIVFFlat(quantizer, matrix.shape[1], self.nlist, faiss.METRIC_INNER_PRODUCT)
+        self._index.train(np.ascontiguousarray(matrix))
+        self._index.add(np.ascontiguousarray(matrix))
+
+    def add(self, matrix: np.ndarray):
+        if self.ntotal < len(matrix):
+            self._index.add(np.ascontiguousarray(matrix[self.ntotal:]))
+
+    def search(self, matrix: np.ndarray, query: np.ndarray, k: int,
+               nprobe: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+        self._index.nprobe = nprobe or self.nprobe
+        query = normalize_rows(np.asarray(query).reshape(1, -1))
+        scores, ids = self._index.search(query, k)
+        valid = ids[0] >= 0
+        return ids[0][valid], scores[0][valid]
+
+    def save(self, path: str):
+        tmp_path = f"{path}.tmp"
+        self._faiss.write_index(self._index, tmp_path)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "FaissIVFIndex":
+        import faiss
+
+        index = faiss.read_index(path)
+        return cls(nlist=index.nlist, nprobe=index.nprobe, index=index)
+
+
+def create_ivf_index(backend: str = "auto", nlist: int = 256, nprobe: int = 8):
+    """按配置创建 IVF 索引，auto 时优先使用 faiss"""
+    if backend in ("auto", "faiss") and find_spec("faiss") is not None:
+        return FaissIVFIndex(nlist=nlist, nprobe=nprobe)
+    if backend == "faiss":
+        print("警告: 未安装 faiss，IVF 索引改用 NumPy 实现")
+    return NumpyIVFIndex(nlist=nlist, nprobe=nprobe)
+
+
+def ivf_index_path(base_path: str, backend: str) -> str:
+    return f"{base_path}.faiss" if backend == "faiss" else f"{base_path}.npz"
+
+
+def load_ivf_index(base_path: str, backend: str = "auto"):
+    """载入持久化的 IVF 索引，不存在时返回 None"""
+    use_faiss = backend in ("auto", "faiss") and find_spec("faiss") is not None
+    path = ivf_index_path(base_path, "faiss" if use_faiss else "numpy")
+    if not os.path.exists(path):
+        return None
+    return FaissIVFIndex.load(path) if use_faiss else NumpyIVFIndex.load(path)
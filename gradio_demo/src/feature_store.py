@@ -0,0 +1,492 @@
+"""
+二进制特征文件
+文件头（64 字节）之后按行存放已归一化的特征矩阵（float32 / float16），载入时直接内存映射，不逐条解析；
+物品名每行一个，保存在旁边的 .names 文件中。
+追加时先写入特征和物品名并刷盘，最后才改写文件头中的记录数：写到一半崩溃时，
+文件头之外多出来的尾部会在下次打开时截掉，已提交的记录不受影响。
+删除的记录先记在 .deleted 文件中（检索时跳过），压缩时才真正从特征文件中去掉；
+批量建库的 manifest（内容哈希 -> 文件路径、记录下标）也保存在特征文件旁边。
+int8 量化副本保存在 .int8 文件中，格式与特征文件相同，每行是 int8 编码加一个 float32 缩放系数，同样内存映射载入。
+"""
+
+import os
+import json
+import base64
+import struct
+import argparse
+from pathlib import Path
+from typing import Dict, List, Sequence, Tuple, Union
+
+import numpy as np
+
+from .feature_index import normalize_rows
+
+MAGIC = b"WLFEAT\x00\x00"
+VERSION = 1
+HEADER_SIZE = 64
+# magic, 版本, dtype 编号, 维度, 保留, 已提交的记录数
+_HEADER = struct.Struct("<8sIIIIQ")
+_COUNT = struct.Struct("<Q")
+_COUNT_OFFSET = _HEADER.size - _COUNT.size
+_DTYPES = {0: np.dtype(np.float32), 1: np.dtype(np.float16)}
+_DTYPE_CODES = {dtype: code for code, dtype in _DTYPES.items()}
+QUANTIZED_MAGIC = b"WLINT8\x00\x00"
+
+
+def names_path_for(path: Union[str, Path]) -> Path:
+    path = Path(path)
+    return path.with_name(path.name + ".names")
+
+
+def deleted_path_for(path: Union[str, Path]) -> Path:
+    path = Path(path)
+    return path.with_name(path.name + ".deleted")
+
+
+def manifest_path_for(path: Union[str, Path]) -> Path:
+    path = Path(path)
+    return path.with_name(path.name + ".manifest")
+
+
+def quantized_path_for(path: Union[str, Path]) -> Path:
+    path = Path(path)
+    return path.with_name(path.name + ".int8")
+
+
+def read_deleted(path: Union[str, Path]) -> np.ndarray:
+    """已删除（尚未压缩）的记录下标"""
+    deleted_path = deleted_path_for(path)
+    if not deleted_path.exists():
+        return np.empty(0, dtype=np.int64)
+    raw = deleted_path.read_bytes()
+    # 写到一半中断时忽略不完整的最后一个下标
+    return np.unique(np.frombuffer(raw[:len(raw) // 8 * 8], dtype="<i8").astype(np.int64))
+
+
+def append_deleted(path: Union[str, Path], ids: Sequence[int]):
+    if len(ids) == 0:
+        return
+    with open(deleted_path_for(path), "ab") as f:
+        f.write(np.asarray(ids, dtype="<i8").tobytes())
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def _compaction_files(path: Path) -> List[Tuple[Path, Path]]:
+    tmp_path = path.with_name(path.name + ".compact")
+    return [(tmp_path, path),
+            (names_path_for(tmp_path), names_path_for(path)),
+            (manifest_path_for(tmp_path), manifest_path_for(path))]
+
+
+def finish_compaction(path: Union[str, Path]) -> bool:
+    """压缩在替换文件的途中中断时，把已经写好的新文件替换完"""
+    path = Path(path)
+    marker = path.with_name(path.name + ".compacting")
+    if not marker.exists():
+        return False
+    for src, dst in _compaction_files(path):
+        if src.exists():
+            os.replace(src, dst)
+    deleted_path = deleted_path_for(path)
+    if deleted_path.exists():
+        deleted_path.unlink()
+    marker.unlink()
+    return True
+
+
+class FeatureStore:
+    """追加写入的二进制特征文件，记录数以文件头为准"""
+
+    def __init__(self, path: Union[str, Path], dtype: str = "float32", sync: bool = True):
+        self.path = Path(path)
+        self.names_path = names_path_for(self.path)
+        self.dtype = np.dtype(dtype)
+        if self.dtype not in _DTYPE_CODES:
+            raise ValueError(f"不支持的特征存储精度: {dtype}")
+        self.sync = sync
+        self.dim = None
+        self.names: List[str] = []
+        self._data_file = None
+        self._names_file = None
+        finish_compaction(self.path)
+        if self.path.exists():
+            self._open_existing()
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    @property
+    def row_bytes(self) -> int:
+        return self.dim * self.dtype.itemsize
+
+    def _open_existing(self):
+        with open(self.path, "rb") as f:
+            header = f.read(HEADER_SIZE)
+        if len(header) < HEADER_SIZE:
+            raise ValueError(f"特征文件头不完整: {self.path}")
+        magic, version, dtype_code, dim, _, count = _HEADER.unpack_from(header)
+        if magic != MAGIC:
+            raise ValueError(f"不是特征文件: {self.path}")
+        if version > VERSION:
+            raise ValueError(f"特征文件版本 {version} 高于当前支持的版本 {VERSION}: {self.path}")
+        # 已有文件的精度以文件头为准
+        self.dtype = _DTYPES[dtype_code]
+        self.dim = dim
+
+        # 截掉未提交的尾部
+        data_size = HEADER_SIZE + count * self.row_bytes
+        if self.path.stat().st_size < data_size:
+            raise ValueError(f"特征文件被截断: 文件头记录 {count} 条，实际不足")
+        if self.path.stat().st_size > data_size:
+            os.truncate(self.path, data_size)
+
+        raw = self.names_path.read_bytes() if self.names_path.exists() else b""
+        lines = raw.split(b"\n")
+        if len(lines) - 1 < count:
+            raise ValueError(f"物品名文件被截断: 需要 {count} 条，实际 {len(lines) - 1} 条")
+        names_size = sum(len(line) + 1 for line in lines[:count])
+        if len(raw) > names_size:
+            os.truncate(self.names_path, names_size)
+        self.names = b"\n".join(lines[:count]).decode("utf-8").split("\n") if count else []
+
+    def _create(self, dim: int):
+        self.dim = dim
+        with open(self.path, "wb") as f:
+            f.write(_HEADER.pack(MAGIC, VERSION, _DTYPE_CODES[self.dtype], dim, 0, 0).ljust(HEADER_SIZE, b"\x00"))
+        open(self.names_path, "wb").close()
+
+    def _flush(self, f):
+        f.flush()
+        if self.sync:
+            os.fsync(f.fileno())
+
+    def features(self) -> np.ndarray:
+        """已提交记录的只读内存映射 (N, D)"""
+        if not self.names:
+            return np.empty((0, self.dim or 0), dtype=self.dtype)
+        return np.memmap(self.path, dtype=self.dtype, mode="r", offset=HEADER_SIZE, shape=(len(self.names), self.dim))
+
+    def read_rows(self, ids: Sequence[int]) -> np.ndarray:
+        """用 pread 读取若干条记录，转换为 float32 (len(ids), D)。
+        只读几十行时比内存映射省内存：映射的页缺页时会连同相邻的页一起计入进程常驻内存"""
+        rows = np.empty((len(ids), self.dim or 0), dtype=np.float32)
+        with open(self.path, "rb") as f:
+            for row, index in enumerate(ids):
+                raw = os.pread(f.fileno(), self.row_bytes, HEADER_SIZE + int(index) * self.row_bytes)
+                rows[row] = np.frombuffer(raw, dtype=self.dtype)
+        return rows
+
+    def append(self, features: np.ndarray, names: Sequence[str]):
+        """追加若干条记录，特征会先做归一化；全部写入并刷盘后才提交记录数"""
+        features = normalize_rows(np.asarray(features).reshape(len(names), -1))
+        if len(names) == 0:
+            return
+        if self.dim is None:
+            self._create(features.shape[1])
+        elif features.shape[1] != self.dim:
+            raise ValueError(f"特征维度不一致: {features.shape[1]} != {self.dim}")
+        names = [str(name).replace("\n", " ") for name in names]
+
+        if self._data_file is None:
+            self._data_file = open(self.path, "r+b")
+            self._names_file = open(self.names_path, "ab")
+        count = len(self.names)
+        self._data_file.seek(HEADER_SIZE + count * self.row_bytes)
+        self._data_file.write(features.astype(self.dtype).tobytes())
+        self._flush(self._data_file)
+        self._names_file.write("".join(name + "\n" for name in names).encode("utf-8"))
+        self._flush(self._names_file)
+
+        # 提交
+        self._data_file.seek(_COUNT_OFFSET)
+        self._data_file.write(_COUNT.pack(count + len(names)))
+        self._flush(self._data_file)
+        self.names.extend(names)
+
+    def close(self):
+        for f in (self._data_file, self._names_file):
+            if f is not None:
+                f.close()
+        self._data_file = None
+        self._names_file = None
+
+    def remove(self):
+        """删除特征文件和物品名文件"""
+        self.close()
+        for path in (self.path, self.names_path):
+            if path.exists():
+                path.unlink()
+        self.dim = None
+        self.names = []
+
+
+class QuantizedStore:
+    """特征文件的 int8 量化副本，追加写入，记录数以文件头为准（与 FeatureStore 相同的提交方式）"""
+
+    def __init__(self, path: Union[str, Path], sync: bool = True):
+        self.path = Path(path)
+        self.sync = sync
+        self.dim = None
+        self._count = 0
+        self._file = None
+        if self.path.exists():
+            self._open_existing()
+
+    def __len__(self) -> int:
+        return self._count
+
+    @property
+    def row_dtype(self) -> np.dtype:
+        return np.dtype([("codes", np.int8, (self.dim,)), ("scale", "<f4")])
+
+    def _open_existing(self):
+        with open(self.path, "rb") as f:
+            header = f.read(HEADER_SIZE)
+        if len(header) < HEADER_SIZE:
+            raise ValueError(f"量化文件头不完整: {self.path}")
+        magic, version, _, dim, _, count = _HEADER.unpack_from(header)
+        if magic != QUANTIZED_MAGIC:
+            raise ValueError(f"不是量化特征文件: {self.path}")
+        if version > VERSION:
+            raise ValueError(f"量化文件版本 {version} 高于当前支持的版本 {VERSION}: {self.path}")
+        self.dim = dim
+        data_size = HEADER_SIZE + count * self.row_dtype.itemsize
+        if self.path.stat().st_size < data_size:
+            raise ValueError(f"量化文件被截断: 文件头记录 {count} 条，实际不足")
+        if self.path.stat().st_size > data_size:
+            os.truncate(self.path, data_size)
+        self._count = count
+
+    def rows(self) -> np.ndarray:
+        """已提交记录的只读内存映射，字段 codes (N, D) 和 scale (N,)"""
+        if self._count == 0:
+            return np.empty(0, dtype=self.row_dtype if self.dim else [("codes", np.int8, (0,)), ("scale", "<f4")])
+        return np.memmap(self.path, dtype=self.row_dtype, mode="r", offset=HEADER_SIZE, shape=(self._count,))
+
+    def append(self, codes: np.ndarray, scales: np.ndarray):
+        """追加若干条量化记录，写入并刷盘后才提交记录数"""
+        if len(codes) == 0:
+            return
+        if self.dim is None:
+            self.dim = codes.shape[1]
+            with open(self.path, "wb") as f:
+                f.write(_HEADER.pack(QUANTIZED_MAGIC, VERSION, 0, self.dim, 0, 0).ljust(HEADER_SIZE, b"\x00"))
+        elif codes.shape[1] != self.dim:
+            raise ValueError(f"特征维度不一致: {codes.shape[1]} != {self.dim}")
+        rows = np.empty(len(codes), dtype=self.row_dtype)
+        rows["codes"] = codes
+        rows["scale"] = scales
+
+        if self._file is None:
+            self._file = open(self.path, "r+b")
+        self._file.seek(HEADER_SIZE + self._count * self.row_dtype.itemsize)
+        self._file.write(rows.tobytes())
+        self._flush()
+        self._file.seek(_COUNT_OFFSET)
+        self._file.write(_COUNT.pack(self._count + len(rows)))
+        self._flush()
+        self._count += len(rows)
+
+    def _flush(self):
+        self._file.flush()
+        if self.sync:
+            os.fsync(self._file.fileno())
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def remove(self):
+        self.close()
+        if self.path.exists():
+            self.path.unlink()
+        self.dim = None
+        self._count = 0
+
+
+class IngestManifest:
+    """内容哈希 -> 入库记录（path、size、mtime、name、id、deleted），按行追加保存为 JSONL，同一哈希以最后一行为准"""
+
+    def __init__(self, path: Union[str, Path]):
+        self.path = Path(path)
+        self.entries: Dict[str, Dict] = {}
+        self._file = None
+        self._damaged = False
+        if self.path.exists():
+            with open(self.path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # 写到一半中断的最后一行，重写文件，避免之后追加的内容接在半行后面
+                        self._damaged = True
+                        continue
+                    self.entries[entry["hash"]] = entry
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def __contains__(self, digest: str) -> bool:
+        return digest in self.entries
+
+    def live_by_path(self) -> Dict[str, Dict]:
+        """未删除的条目，按文件路径索引"""
+        return {entry["path"]: entry for entry in self.entries.values() if not entry.get("deleted")}
+
+    def prune(self, committed: int):
+        """丢弃记录下标 >= committed 的条目（特征还没来得及提交），有变化时重写文件"""
+        stale = [digest for digest, entry in self.entries.items() if entry["id"] >= committed]
+        if not stale and not self._damaged:
+            return
+        for digest in stale:
+            del self.entries[digest]
+        self.rewrite()
+
+    def rewrite(self, path: Union[str, Path, None] = None):
+        """把当前条目重写到 path（默认原文件），每个哈希只保留一行"""
+        self.close()
+        path = Path(path) if path is not None else self.path
+        tmp_path = path.with_name(path.name + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for entry in self.entries.values():
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+        self._damaged = False
+
+    def append(self, entries: Sequence[Dict]):
+        """追加新条目，或追加一行覆盖已有条目（更新路径、标记删除）"""
+        if not entries:
+            return
+        if self._file is None:
+            self._file = open(self.path, "a", encoding="utf-8")
+        self._file.write("".join(json.dumps(entry, ensure_ascii=False) + "\n" for entry in entries))
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        for entry in entries:
+            self.entries[entry["hash"]] = entry
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+def compact_store(path: Union[str, Path], chunk_rows: int = 65536) -> Tuple[int, int]:
+    """去掉已删除的记录，重写特征文件、物品名文件和 manifest（记录下标重新编号），返回 (保留条数, 删除条数)。
+    新文件全部写好后才创建 .compacting 标记再逐个替换，替换途中中断时下次打开会接着完成"""
+    path = Path(path)
+    store = FeatureStore(path)
+    deleted = read_deleted(path)
+    deleted = deleted[deleted < len(store)]
+    if len(deleted) == 0:
+        return len(store), 0
+    keep = np.setdiff1d(np.arange(len(store)), deleted)
+    new_ids = np.full(len(store), -1, dtype=np.int64)
+    new_ids[keep] = np.arange(len(keep))
+
+    for tmp_path, _ in _compaction_files(path):
+        if tmp_path.exists():
+            tmp_path.unlink()
+    tmp_path = _compaction_files(path)[0][0]
+    compacted = FeatureStore(tmp_path, dtype=store.dtype.name, sync=False)
+    features = store.features()
+    for start in range(0, len(keep), chunk_rows):
+        rows = keep[start:start + chunk_rows]
+        compacted.append(features[rows], [store.names[i] for i in rows])
+    if len(keep) == 0:
+        compacted._create(store.dim)
+    compacted.close()
+    for written in (tmp_path, names_path_for(tmp_path)):
+        with open(written, "rb+") as f:
+            os.fsync(f.fileno())
+
+    manifest = IngestManifest(manifest_path_for(path))
+    manifest.entries = {
+        digest: dict(entry, id=int(new_ids[entry["id"]]))
+        for digest, entry in manifest.entries.items()
+        if not entry.get("deleted") and entry["id"] < len(store) and new_ids[entry["id"]] >= 0
+    }
+    manifest.rewrite(manifest_path_for(tmp_path))
+
+    marker = path.with_name(path.name + ".compacting")
+    with open(marker, "wb") as f:
+        os.fsync(f.fileno())
+    finish_compaction(path)
+    return len(keep), len(deleted)
+
+
+def convert_jsonl(jsonl_path: Union[str, Path], store_path: Union[str, Path],
+                  dtype: str = "float32", batch_size: int = 4096) -> int:
+    """把旧的 JSONL（base64 编码的 float32 特征）转换为二进制特征文件，返回转换的记录数"""
+    store_path = Path(store_path)
+    if store_path.exists():
+        raise FileExistsError(f"特征文件已存在: {store_path}")
+    # 先写到临时文件，转换完成后再改名，转换中断不会留下半个特征库
+    tmp_path = store_path.with_name(store_path.name + ".tmp")
+    for path in (tmp_path, names_path_for(tmp_path)):
+        if path.exists():
+            path.unlink()
+    store = FeatureStore(tmp_path, dtype=dtype, sync=False)
+
+    try:
+        features, names = [], []
+        with open(jsonl_path, "r", encoding="utf-8") as f:
+            for line_num, line in enumerate(f, 1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    data = json.loads(line)
+                    features.append(np.frombuffer(base64.b64decode(data["feature"]), dtype=np.float32))
+                    names.append(data["name"])
+                except Exception as e:
+                    print(f"跳过第{line_num}行: {e}")
+                    continue
+                if len(names) >= batch_size:
+                    store.append(np.stack(features), names)
+                    features, names = [], []
+        if names:
+            store.append(np.stack(features), names)
+        count = len(store)
+        store.close()
+
+        if not count:
+            # 没有有效记录时不创建特征文件，也不留下临时文件
+            store.remove()
+            return 0
+        for path in (tmp_path, names_path_for(tmp_path)):
+            with open(path, "rb+") as f:
+                os.fsync(f.fileno())
+        os.replace(names_path_for(tmp_path), names_path_for(store_path))
+        os.replace(tmp_path, store_path)
+    except BaseException:
+        store.remove()
+        raise
+    return count
+
+
+def migrate_jsonl(jsonl_path: Union[str, Path], store_path: Union[str, Path],
+                  dtype: str = "float32") -> Tuple[int, Path]:
+    """转换旧的 JSONL 特征库，之后把原文件改名为 .migrated 保留，避免清空特征库后再次被转换。
+    返回 (转换的记录数, 改名后的路径)"""
+    jsonl_path = Path(jsonl_path)
+    count = convert_jsonl(jsonl_path, store_path, dtype)
+    backup_path = jsonl_path.with_name(jsonl_path.name + ".migrated")
+    os.replace(jsonl_path, backup_path)
+    return count, backup_path
+
+
+if __name__ == "__main__":
+    # python -m src.feature_store local_data/official_image/image_features.jsonl
+    parser = argparse.ArgumentParser(description="把 JSONL 特征库转换为二进制特征文件")
+    parser.add_argument("jsonl")
+    parser.add_argument("--out", help="默认与 JSONL 同名，后缀为 .bin")
+    parser.add_argument("--dtype", default="float32", choices=["float32", "float16"])
+    args = parser.parse_args()
+
+    out = args.out or str(Path(args.jsonl).with_suffix(".bin"))
+    print(f"已转换 {convert_jsonl(args.jsonl, out, args.dtype)} 条记录: {out}")
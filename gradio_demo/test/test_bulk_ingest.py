@@ -0,0 +1,148 @@
+"""
+批量建库的测试（特征提取用桩函数代替，不载入模型）: python -m pytest test/test_bulk_ingest.py
+"""
+
+import json
+import os
+import shutil
+import sys
+
+import numpy as np
+import pytest
+from PIL import Image
+
+# 在这里修正帮助我找到 src
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.bulk_ingest import BulkIngester
+from src.feature_store import FeatureStore, IngestManifest, manifest_path_for
+
+
+class StubExtractor:
+    """用缩小后的像素代替 CLIP 特征，记录计算过的图片数"""
+
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self, images):
+        self.calls += len(images)
+        return np.stack([np.asarray(image.resize((4, 4)), dtype=np.float32).reshape(-1) + 1 for image in images])
+
+
+class CrashingStore(FeatureStore):
+    """第 crash_at 次追加时抛出异常，模拟 manifest 已写入、特征还没提交时进程被杀"""
+
+    def __init__(self, path, crash_at):
+        super().__init__(path, sync=False)
+        self.crash_at = crash_at
+        self.appends = 0
+
+    def append(self, features, names):
+        self.appends += 1
+        if self.appends == self.crash_at:
+            raise RuntimeError("simulated crash")
+        super().append(features, names)
+
+
+def make_image(path, seed):
+    Image.fromarray(np.random.default_rng(seed).integers(0, 255, (32, 40, 3), dtype=np.uint8)).save(path)
+
+
+@pytest.fixture
+def image_paths(tmp_path):
+    image_dir = tmp_path / "images"
+    image_dir.mkdir()
+    paths = []
+    for i in range(10):
+        path = image_dir / f"物品{i}_{i}.png"
+        make_image(path, i)
+        paths.append(str(path))
+    return paths
+
+
+def ingest(store, paths, extractor):
+    ingester = BulkIngester(extractor, store, name_for_path=lambda path: os.path.basename(path).split("_")[0],
+                            workers=1, batch_size=3, flush_rows=4)
+    return ingester.run(paths)
+
+
+def assert_manifest_matches_store(store_path):
+    store = FeatureStore(store_path)
+    manifest = IngestManifest(manifest_path_for(store_path))
+    assert sorted(entry["id"] for entry in manifest.entries.values()) == list(range(len(store)))
+    for entry in manifest.entries.values():
+        assert store.names[entry["id"]] == entry["name"]
+
+
+def test_rerun_skips_everything(tmp_path, image_paths):
+    store_path = tmp_path / "features.bin"
+    extractor = StubExtractor()
+    stats = ingest(FeatureStore(store_path, sync=False), image_paths, extractor)
+    assert (stats["added"], stats["skipped"], stats["failed"]) == (10, 0, 0)
+
+    stats = ingest(FeatureStore(store_path, sync=False), image_paths, extractor)
+    assert (stats["added"], stats["skipped"], stats["failed"]) == (0, 10, 0)
+    assert extractor.calls == 10
+    assert len(FeatureStore(store_path)) == 10
+    assert_manifest_matches_store(store_path)
+
+
+def test_duplicate_file_is_skipped(tmp_path, image_paths):
+    duplicate = os.path.join(os.path.dirname(image_paths[0]), "副本_0.png")
+    shutil.copy(image_paths[0], duplicate)
+    store_path = tmp_path / "features.bin"
+    extractor = StubExtractor()
+
+    stats = ingest(FeatureStore(store_path, sync=False), image_paths + [duplicate], extractor)
+    assert (stats["added"], stats["skipped"]) == (10, 1)
+    assert extractor.calls == 10
+    assert len(FeatureStore(store_path)) == 10
+
+
+def test_corrupt_file_fails_without_affecting_others(tmp_path, image_paths):
+    corrupt = os.path.join(os.path.dirname(image_paths[0]), "坏图_0.png")
+    with open(corrupt, "wb") as f:
+        f.write(b"not an image")
+    store_path = tmp_path / "features.bin"
+
+    ingester = BulkIngester(StubExtractor(), FeatureStore(store_path, sync=False), name_for_path=lambda path: "x",
+                            workers=1, batch_size=3, flush_rows=4)
+    stats = ingester.run(image_paths + [corrupt])
+    assert (stats["added"], stats["failed"]) == (10, 1)
+    assert corrupt not in ingester.digests
+    assert corrupt not in IngestManifest(manifest_path_for(store_path)).live_by_path()
+
+
+def test_resume_after_crash(tmp_path, image_paths):
+    store_path = tmp_path / "features.bin"
+    with pytest.raises(RuntimeError, match="simulated crash"):
+        ingest(CrashingStore(store_path, crash_at=2), image_paths, StubExtractor())
+
+    # 第一批已提交；第二批 manifest 已写入但特征没有提交，重新打开时丢弃
+    committed = len(FeatureStore(store_path))
+    assert 0 < committed < 10
+    assert len(IngestManifest(manifest_path_for(store_path))) > committed
+
+    extractor = StubExtractor()
+    stats = ingest(FeatureStore(store_path, sync=False), image_paths, extractor)
+    assert (stats["added"], stats["skipped"]) == (10 - committed, committed)
+    assert extractor.calls == 10 - committed
+    assert len(FeatureStore(store_path)) == 10
+    assert_manifest_matches_store(store_path)
+
+
+def test_manifest_with_torn_last_line_is_pruned(tmp_path, image_paths):
+    store_path = tmp_path / "features.bin"
+    ingest(FeatureStore(store_path, sync=False), image_paths[:5], StubExtractor())
+    manifest_path = manifest_path_for(store_path)
+    with open(manifest_path, "a", encoding="utf-8") as f:
+        f.write(json.dumps({"hash": "uncommitted", "id": 5, "name": "x", "path": "p", "size": 1, "mtime": 0}) + "\n")
+        f.write('{"hash": "tor')
+
+    stats = ingest(FeatureStore(store_path, sync=False), image_paths, StubExtractor())
+    assert (stats["added"], stats["skipped"]) == (5, 5)
+    with open(manifest_path, encoding="utf-8") as f:
+        lines = [json.loads(line) for line in f]
+    assert "uncommitted" not in [line["hash"] for line in lines]
+    assert len(lines) == 10
+    assert_manifest_matches_store(store_path)
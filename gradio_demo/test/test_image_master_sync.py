@@ -0,0 +1,185 @@
+"""
+特征库增量同步和压缩的测试（特征提取用桩函数代替，不载入模型）: python -m pytest test/test_image_master_sync.py
+"""
+
+import os
+import sys
+
+import numpy as np
+import pytest
+import yaml
+from PIL import Image
+
+# 在这里修正帮助我找到 src
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import src.feature_store as feature_store
+from src.ImageMaster import ImageMaster
+from src.feature_store import IngestManifest, compact_store, manifest_path_for, read_deleted
+
+CONFIG_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "config", "image_master.yaml")
+
+
+def stub_features(images):
+    """用缩小后的像素代替 CLIP 特征，内容不同的图片特征不同"""
+    return np.stack([np.asarray(image.convert("RGB").resize((4, 4)), dtype=np.float32).reshape(-1) + 1
+                     for image in images])
+
+
+def make_image(path, seed):
+    Image.fromarray(np.random.default_rng(seed).integers(0, 255, (32, 40, 3), dtype=np.uint8)).save(path)
+
+
+def feature_of(path):
+    with Image.open(path) as image:
+        return stub_features([image])[0]
+
+
+@pytest.fixture
+def image_dir(tmp_path):
+    image_dir = tmp_path / "images"
+    image_dir.mkdir()
+    for i in range(6):
+        make_image(image_dir / f"物品{i}_{i}.png", i)
+    return image_dir
+
+
+@pytest.fixture
+def image_master(tmp_path):
+    with open(CONFIG_PATH, encoding="utf-8") as f:
+        config = yaml.safe_load(f)
+    config['database']['default_path'] = str(tmp_path / "db")
+    config['database']['legacy_file'] = None
+    config['index']['type'] = 'flat'
+    config['index']['quantization'] = 'none'
+    config['ingest'].update(workers=1, batch_size=4, flush_rows=4, compact_ratio=0.5)
+    config['logging'].update(level='WARNING', file=str(tmp_path / "logs" / "image_master.log"))
+    config_path = tmp_path / "image_master.yaml"
+    with open(config_path, "w", encoding="utf-8") as f:
+        yaml.safe_dump(config, f, allow_unicode=True)
+
+    im = ImageMaster()
+    im.set_from_config(str(config_path))
+    im.calls = 0
+
+    def extract_features(images):
+        im.calls += len(images)
+        return stub_features(images)
+
+    im.extract_features = extract_features
+    im.load_database()
+    yield im
+    im.close_database()
+
+
+def live_entries(im):
+    return IngestManifest(manifest_path_for(im.data_file_path)).live_by_path()
+
+
+def test_deleted_file_is_tombstoned_and_skipped(image_master, image_dir):
+    assert image_master.sync(image_dir)['added'] == 6
+    removed = str(image_dir / "物品1_1.png")
+    removed_id = live_entries(image_master)[removed]['id']
+    query = feature_of(removed)
+    os.remove(removed)
+
+    stats = image_master.sync(image_dir, compact_ratio=1.0)
+    assert stats['deleted'] == 1
+    assert read_deleted(image_master.data_file_path).tolist() == [removed_id]
+    assert removed not in live_entries(image_master)
+    results = image_master.extract_item_from_feature(query)
+    assert results and removed_id not in [result['index'] for result in results]
+
+
+def test_renamed_file_updates_manifest_without_reingest(image_master, image_dir):
+    image_master.sync(image_dir)
+    calls = image_master.calls
+    old_path, new_path = str(image_dir / "物品2_2.png"), str(image_dir / "物品2_99.png")
+    old_entry = live_entries(image_master)[old_path]
+    os.rename(old_path, new_path)
+
+    stats = image_master.sync(image_dir)
+    assert (stats['added'], stats['updated'], stats['deleted']) == (0, 1, 0)
+    assert image_master.calls == calls
+    entries = live_entries(image_master)
+    assert old_path not in entries
+    assert entries[new_path]['id'] == old_entry['id']
+    assert entries[new_path]['hash'] == old_entry['hash']
+
+
+def test_unreadable_file_keeps_its_record(image_master, image_dir):
+    image_master.sync(image_dir)
+    broken = str(image_dir / "物品3_3.png")
+    entry = live_entries(image_master)[broken]
+    with open(broken, "wb") as f:
+        f.write(b"not an image")
+
+    stats = image_master.sync(image_dir)
+    assert (stats['failed'], stats['deleted'], stats['updated']) == (1, 0, 0)
+    assert image_master.database.deleted_count == 0
+    assert live_entries(image_master)[broken] == entry
+
+    # 文件修好后按内容改变处理：旧记录删除，新内容入库
+    make_image(broken, 100)
+    stats = image_master.sync(image_dir, compact_ratio=1.0)
+    assert (stats['added'], stats['deleted']) == (1, 1)
+    assert live_entries(image_master)[broken]['hash'] != entry['hash']
+
+
+def test_compaction_remaps_manifest(image_master, image_dir):
+    image_master.sync(image_dir)
+    for i in range(4):
+        os.remove(image_dir / f"物品{i}_{i}.png")
+
+    stats = image_master.sync(image_dir)
+    assert stats['deleted'] == 4
+    assert stats['compacted'] == 4
+    assert len(image_master.database) == 2
+    assert image_master.database.deleted_count == 0
+    assert not read_deleted(image_master.data_file_path).size
+
+    entries = live_entries(image_master)
+    assert sorted(entry['id'] for entry in entries.values()) == [0, 1]
+    for path, entry in entries.items():
+        expected = feature_of(path)
+        np.testing.assert_allclose(image_master.database.matrix[entry['id']],
+                                   expected / np.linalg.norm(expected), atol=1e-6)
+
+
+def test_interrupted_compaction_is_rolled_forward(image_master, image_dir, monkeypatch):
+    image_master.sync(image_dir)
+    os.remove(image_dir / "物品0_0.png")
+    image_master.sync(image_dir, compact_ratio=1.0)
+    image_master.close_database()
+
+    # 新文件写好、.compacting 标记已创建，替换之前中断
+    with monkeypatch.context() as patch:
+        patch.setattr(feature_store, "finish_compaction", lambda path: False)
+        assert compact_store(image_master.data_file_path) == (5, 1)
+    db_files = set(os.listdir(image_master.database_path))
+    assert "image_features.bin.compacting" in db_files
+    assert "image_features.bin.compact" in db_files
+
+    image_master.load_database()
+    assert sorted(os.listdir(image_master.database_path)) == [
+        "image_features.bin", "image_features.bin.manifest", "image_features.bin.names"]
+    assert len(image_master.database) == 5
+    assert image_master.database.deleted_count == 0
+    entries = live_entries(image_master)
+    assert sorted(entry['id'] for entry in entries.values()) == list(range(5))
+    stats = image_master.sync(image_dir)
+    assert (stats['added'], stats['unchanged'], stats['deleted']) == (0, 5, 0)
+
+
+def test_unsupported_quantization_is_rejected(tmp_path):
+    with open(CONFIG_PATH, encoding="utf-8") as f:
+        config = yaml.safe_load(f)
+    config['database']['default_path'] = str(tmp_path / "db")
+    config['index']['quantization'] = 'float16'
+    config['logging']['file'] = str(tmp_path / "logs" / "image_master.log")
+    config_path = tmp_path / "image_master.yaml"
+    with open(config_path, "w", encoding="utf-8") as f:
+        yaml.safe_dump(config, f, allow_unicode=True)
+
+    with pytest.raises(ValueError, match="float16"):
+        ImageMaster().set_from_config(str(config_path))